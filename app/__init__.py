@@ -7,17 +7,17 @@ from flask_wtf.csrf import CSRFProtect
 from flask_login import LoginManager
 from flask_jwt_extended import JWTManager
 from flask_caching import Cache
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 from flask_babel import Babel
 import logging
-from logging.handlers import RotatingFileHandler
 from typing import Optional
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 import atexit
 from sqlalchemy import inspect
 
+from .rate_limit import RateLimiter
+from .request_pipeline import request_pipeline
+
 # Инициализация расширений
 db = SQLAlchemy()
 migrate = Migrate()
@@ -26,8 +26,7 @@ login_manager = LoginManager()
 jwt = JWTManager()
 cache = Cache()
 babel = Babel()
-limiter = Limiter(
-    key_func=get_remote_address,
+limiter = RateLimiter(
     default_limits=["1000 per hour", "100 per minute"]
 )
 
@@ -73,6 +72,9 @@ def create_app(config_name: str = 'development') -> Flask:
     # Инициализация системных компонентов
     init_system_components(app)
     
+    # Запуск очереди печати
+    init_print_queue(app)
+    
     # Инициализация управления сессиями
     init_session_management(app)
     
@@ -95,6 +97,8 @@ def create_app(config_name: str = 'development') -> Flask:
 
 def init_extensions(app: Flask) -> None:
     """Инициализация расширений Flask."""
+    # Конвейер запроса - первым, чтобы его контекст был готов для остальных хуков
+    request_pipeline.init_app(app)
     db.init_app(app)
     migrate.init_app(app, db)
     csrf.init_app(app)
@@ -129,9 +133,51 @@ def init_extensions(app: Flask) -> None:
     
     @login_manager.user_loader
     def load_user(user_id):
-        """Загрузка пользователя по ID для Flask-Login."""
-        from app.models import Staff
-        return Staff.query.get(int(user_id))
+        """Загрузка пользователя по ID для Flask-Login (кэш идентичности, без ORM-объекта)."""
+        from .utils.staff_identity import staff_identity
+        from .utils.session_store import session_store
+        try:
+            staff_id, token = session_store.parse_login_id(user_id)
+        except (TypeError, ValueError):
+            return None
+        principal = staff_identity.get(staff_id)
+        if principal is None:
+            return None
+        
+        # ID без номеров поколений допустим только из уже существующей серверной сессии
+        # (ее отзыв проверяет хранилище); из remember-cookie - нет
+        if token is None and getattr(session, 'loaded_user_id', None) == user_id:
+            return principal
+        if token != session_store.remember_token(principal.id, principal.role):
+            # Сессии сотрудника отозваны: remember-cookie больше не входит и удаляется
+            session.pop('_user_id', None)
+            session['_remember'] = 'clear'
+            return None
+        return principal
+    
+    try:
+        from .utils.staff_identity import staff_identity
+        staff_identity.init_app(app)
+    except Exception as e:
+        app.logger.error(f"Ошибка инициализации кэша сотрудников: {e}")
+    
+    try:
+        from .utils.password_hashing import password_hashing
+        password_hashing.init_app(app)
+    except Exception as e:
+        app.logger.error(f"Ошибка инициализации хеширования паролей: {e}")
+    
+    try:
+        from .utils.bonus_card_cache import bonus_card_cache
+        bonus_card_cache.init_app(app)
+    except Exception as e:
+        app.logger.error(f"Ошибка инициализации кэша бонусных карт: {e}")
+    
+    try:
+        from .utils.field_encryption import field_encryption
+        field_encryption.init_app(app)
+    except Exception as e:
+        app.logger.error(f"Ошибка инициализации шифрования полей: {e}")
 
 def register_blueprints(app: Flask) -> None:
     """Регистрация blueprints."""
@@ -198,6 +244,8 @@ def init_audit_system(app: Flask) -> None:
     try:
         from .utils.audit_middleware import audit_middleware
         audit_middleware.init_app(app)
+        from .utils.audit_retention import audit_retention
+        audit_retention.init_app(app)
         app.logger.info("Система аудита инициализирована")
     except Exception as e:
         app.logger.error(f"Ошибка инициализации аудита: {e}")
@@ -300,183 +348,97 @@ def init_scheduler(app: Flask) -> None:
 def init_session_management(app: Flask) -> None:
     """Инициализация управления сессиями с динамическим таймаутом."""
     from datetime import timedelta
+    from flask_login import current_user, logout_user
+    import time
     
-    @app.before_request
-    def update_session_timeout():
-        """Обновление времени жизни сессии на основе настроек."""
-        if request.endpoint and not request.endpoint.startswith('static'):
-            try:
-                # Получаем настройку таймаута из базы данных
-                from .models import SystemSetting
-                session_timeout_minutes = int(SystemSetting.get_setting('session_timeout', '120'))
-                
-                # Обновляем конфигурацию приложения
-                current_timeout = app.permanent_session_lifetime
-                new_timeout = timedelta(minutes=session_timeout_minutes)
-                
-                if current_timeout != new_timeout:
-                    app.permanent_session_lifetime = new_timeout
-                    app.logger.debug(f"Session timeout updated: {session_timeout_minutes} minutes")
-                
-                # Делаем сессию постоянной для применения таймаута
-                if hasattr(g, 'current_user') or 'user_id' in session:
-                    session.permanent = True
-                    
-            except Exception as e:
-                app.logger.debug(f"Session timeout update failed: {e}")
-    
-    @app.before_request
-    def check_session_activity():
-        """Проверка активности сессии для автоматического выхода."""
-        from flask_login import current_user, logout_user
-        from datetime import datetime
+    try:
+        from .utils.session_store import session_store
+        session_store.init_app(app)
+    except Exception as e:
+        # Без общего хранилища сессии и их отзыв не работают - не запускаемся
+        app.logger.error(f"Ошибка инициализации хранилища сессий: {e}")
+        raise
+    
+    cache_seconds = app.config.get('SESSION_TIMEOUT_CACHE_SECONDS', 30)
+    cached = {'minutes': 120, 'expires': 0.0}
+    
+    def session_timeout_minutes() -> int:
+        """Таймаут из настроек БД, перечитывается не чаще раза в cache_seconds."""
+        now = time.monotonic()
+        if now >= cached['expires']:
+            from .models import SystemSetting
+            cached['minutes'] = int(SystemSetting.get_setting('session_timeout', '120'))
+            cached['expires'] = now + cache_seconds
+        return cached['minutes']
+    
+    def session_stage(ctx):
+        """Таймаут сессии и автоматический выход по неактивности."""
+        try:
+            timeout_minutes = session_timeout_minutes()
+        except Exception as e:
+            app.logger.debug(f"Session timeout update failed: {e}")
+            return None
         
-        # Пропускаем статические файлы и API endpoints
-        if (request.endpoint and 
-            (request.endpoint.startswith('static') or 
-             request.path.startswith('/api/') or
-             request.endpoint == 'auth.login')):
-            return
+        # Обновляем конфигурацию приложения
+        new_timeout = timedelta(minutes=timeout_minutes)
+        if app.permanent_session_lifetime != new_timeout:
+            app.permanent_session_lifetime = new_timeout
+            app.logger.debug(f"Session timeout updated: {timeout_minutes} minutes")
         
-        if current_user.is_authenticated:
-            now = datetime.now()
-            
-            # Проверяем последнюю активность
-            last_activity = session.get('last_activity')
-            if last_activity:
-                try:
-                    from .models import SystemSetting
-                    session_timeout_minutes = int(SystemSetting.get_setting('session_timeout', '120'))
-                    
-                    if isinstance(last_activity, str):
-                        last_activity = datetime.fromisoformat(last_activity)
-                    
-                    time_diff = now - last_activity
-                    if time_diff.total_seconds() > (session_timeout_minutes * 60):
-                        # Сессия истекла - принудительный выход
-                        app.logger.info(f"Session expired for user {current_user.login} after {session_timeout_minutes} minutes of inactivity")
-                        logout_user()
-                        session.clear()
-                        
-                        # Перенаправляем на страницу входа с сообщением
-                        from flask import flash, redirect, url_for
-                        flash('Сессия истекла из-за неактивности. Пожалуйста, войдите снова.', 'warning')
-                        return redirect(url_for('auth.login'))
-                        
-                except Exception as e:
-                    app.logger.error(f"Session activity check failed: {e}")
+        # Делаем сессию постоянной для применения таймаута (один раз, а не на каждом запросе)
+        if '_user_id' in session and not session.permanent:
+            session.permanent = True
+        
+        # Проверку активности пропускаем для API и страницы входа
+        if ctx.path.startswith('/api/') or ctx.endpoint == 'auth.login':
+            return None
+        if not current_user.is_authenticated:
+            return None
+        
+        # Время активности ведет хранилище сессий (обновляется с шагом
+        # SESSION_ACTIVITY_RESOLUTION_SECONDS), в саму сессию не пишем
+        last_activity = getattr(session, 'last_activity', None)
+        if last_activity and time.time() - last_activity > timeout_minutes * 60:
+            # Сессия истекла - принудительный выход
+            app.logger.info(f"Session expired for user {current_user.login} after {timeout_minutes} minutes of inactivity")
+            logout_user()
+            session.clear()
             
-            # Обновляем время последней активности
-            session['last_activity'] = now.isoformat()
+            # Перенаправляем на страницу входа с сообщением
+            from flask import flash, redirect, url_for
+            flash('Сессия истекла из-за неактивности. Пожалуйста, войдите снова.', 'warning')
+            return redirect(url_for('auth.login'))
+        return None
+    
+    request_pipeline.add_stage('session', before=session_stage, order=30)
 
 def setup_logging(app: Flask) -> None:
-    """Настройка системы логирования."""
+    """Настройка системы логирования (очередь, JSON, выборка INFO)."""
     if app.config.get('TESTING'):
         return
-        
-    # Создание директории для логов
-    import os
-    if not os.path.exists('logs'):
-        os.mkdir('logs')
     
-    # Настройка уровня логирования
-    log_level = logging.DEBUG if app.debug else logging.INFO
-    app.logger.setLevel(log_level)
+    from .utils.structured_logging import structured_logging
+    structured_logging.init_app(app)
     
-    # Настройка форматтера с дополнительным контекстом
-    class RequestFormatter(logging.Formatter):
-        def format(self, record):
-            try:
-                # Проверяем наличие контекста приложения
-                from flask import has_request_context
-                if has_request_context() and hasattr(g, 'request_id'):
-                    record.request_id = g.request_id
-                else:
-                    record.request_id = 'no-request'
-            except RuntimeError:
-                # Если нет контекста приложения
-                record.request_id = 'app-init'
-            return super().format(record)
-    
-    formatter = RequestFormatter(
-        '%(asctime)s %(name)s %(levelname)s: %(message)s '
-        '[in %(pathname)s:%(lineno)d] [request_id: %(request_id)s]'
-    )
-    
-    # Файловый обработчик (без ротации для разработки)
-    if app.debug:
-        file_handler = logging.FileHandler('logs/app.log')
-    else:
-        file_handler = RotatingFileHandler(
-            'logs/app.log',
-            maxBytes=10485760,  # 10MB
-            backupCount=10
-        )
-    file_handler.setFormatter(formatter)
-    file_handler.setLevel(log_level)
-    app.logger.addHandler(file_handler)
-    
-    # Обработчик ошибок (без ротации для разработки)
-    if app.debug:
-        error_handler = logging.FileHandler('logs/errors.log')
-    else:
-        error_handler = RotatingFileHandler(
-            'logs/errors.log',
-            maxBytes=10485760,
-            backupCount=5
-        )
-    error_handler.setFormatter(formatter)
-    error_handler.setLevel(logging.ERROR)
-    app.logger.addHandler(error_handler)
-    
-    # Консольный вывод для разработки
-    if app.debug:
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        console_handler.setLevel(logging.DEBUG)
-        app.logger.addHandler(console_handler)
-    
-    # Добавление контекста запроса в логи
-    @app.before_request
-    def before_request():
-        import uuid
-        from flask import g
-        from datetime import datetime
-        
-        g.request_id = str(uuid.uuid4())
-        g.start_time = datetime.utcnow()
+    app.logger.info('Приложение DENIZ Restaurant запущено') 
+
+def init_print_queue(app: Flask) -> None:
+    """Запуск фоновых обработчиков очереди печати."""
+    try:
+        from .utils.printer_pool import printer_pool
+        printer_pool.init_app(app)
+        atexit.register(printer_pool.close_all)
         
-        app.logger.info(
-            f"Request started: {request.method} {request.path}"
-        )
+        from .utils.print_queue import print_queue
+        print_queue.init_app(app)
+    except Exception as e:
+        app.logger.error(f"Ошибка запуска очереди печати: {e}")
     
-    @app.after_request
-    def after_request(response):
-        from flask import g, request
-        from datetime import datetime
-        import time
-        
-        if hasattr(g, 'request_id') and hasattr(g, 'start_time'):
-            try:
-                # Если start_time это datetime объект
-                if isinstance(g.start_time, datetime):
-                    duration = (datetime.utcnow() - g.start_time).total_seconds()
-                # Если start_time это timestamp (float)
-                elif isinstance(g.start_time, (int, float)):
-                    duration = time.time() - g.start_time
-                else:
-                    duration = 0
-                
-                app.logger.info(
-                    f"Request completed: {response.status_code} "
-                    f"({duration:.4f}s)"
-                )
-            except Exception as e:
-                app.logger.warning(f"Error calculating request duration: {e}")
-        
-        return response
-        
-    app.logger.info('Приложение DENIZ Restaurant запущено') 
+    try:
+        from .utils.printer_monitor import printer_monitor
+        printer_monitor.init_app(app)
+    except Exception as e:
+        app.logger.error(f"Ошибка запуска мониторинга принтеров: {e}")
 
 def init_websocket(app: Flask) -> None:
     """Инициализация WebSocket сервера."""
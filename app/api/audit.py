@@ -3,14 +3,54 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required
 from app.models import AuditLog, Staff
+from app.models.audit_log import DETAILS_KEY_RE
 from app.utils.decorators import audit_action, admin_required
+from app.utils.audit_writer import audit_writer
 from app.errors import ValidationError
 from datetime import datetime, timedelta
 from typing import Dict, Any
+from sqlalchemy.exc import DataError, ProgrammingError
+from app import db
 import json
 
 audit_api = Blueprint('audit', __name__)
 
+def _details_filters() -> Dict[str, Any]:
+    """
+    Фильтры по details из query string.
+    
+    ``details.<путь>=<значение>`` - равенство по вложенному ключу
+    (``details.json_data.order_id=1234``), ``details_path`` - предикат
+    jsonpath (``$.response_status >= 500``). Выполняются в SQL по индексу GIN.
+    """
+    details = {
+        key[len('details.'):]: value
+        for key, value in request.args.items()
+        if key.startswith('details.') and value != ''
+    }
+    for path in details:
+        if not all(DETAILS_KEY_RE.match(key) for key in path.split('.')):
+            raise ValidationError(f"Неверный путь в details: {path}")
+    return {
+        'details': details,
+        'details_path': request.args.get('details_path') or None,
+        'ip_address': request.args.get('ip_address') or None,
+    }
+
+def _details_path_error(e: Exception):
+    """
+    Ответ 400 на ошибку в details_path.
+    
+    Ошибка в выражении jsonpath проявляется только на стороне БД: синтаксис -
+    ProgrammingError (SQLSTATE 42601), несовместимые типы - DataError.
+    Транзакция после нее прервана, поэтому откатываем сессию.
+    """
+    db.session.rollback()
+    return jsonify({
+        "status": "error",
+        "message": f"Неверный фильтр details_path: {e.orig}"
+    }), 400
+
 @audit_api.route('/logs', methods=['GET'])
 @login_required
 @admin_required
@@ -28,36 +68,33 @@ def get_audit_logs():
         date_from = request.args.get('date_from')
         date_to = request.args.get('date_to')
         
-        # Построение запроса
-        query = AuditLog.query
-        
-        # Фильтры
-        if staff_id:
-            query = query.filter_by(staff_id=staff_id)
-        if action:
-            query = query.filter(AuditLog.action.contains(action))
-        if table_id:
-            query = query.filter_by(table_affected=table_id)
-        if order_id:
-            query = query.filter_by(order_affected=order_id)
-        
-        # Фильтр по датам
+        # Парсинг дат
+        from_date = to_date = None
         if date_from:
             try:
                 from_date = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
-                query = query.filter(AuditLog.created_at >= from_date)
             except ValueError:
                 raise ValidationError("Неверный формат даты в date_from")
         
         if date_to:
             try:
                 to_date = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
-                query = query.filter(AuditLog.created_at <= to_date)
             except ValueError:
                 raise ValidationError("Неверный формат даты в date_to")
         
-        # Сортировка и пагинация
-        logs = query.order_by(AuditLog.created_at.desc()).paginate(
+        # Все фильтры, включая фильтры по details, выполняются в SQL
+        query = AuditLog.search(
+            staff_id=staff_id,
+            action=action,
+            table_id=table_id,
+            order_id=order_id,
+            date_from=from_date,
+            date_to=to_date,
+            **_details_filters()
+        )
+        
+        # Пагинация
+        logs = query.paginate(
             page=page, per_page=per_page, error_out=False
         )
         
@@ -82,6 +119,13 @@ def get_audit_logs():
             }
         })
         
+    except ValidationError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+    except (DataError, ProgrammingError) as e:
+        return _details_path_error(e)
     except Exception as e:
         current_app.logger.error(f"Error getting audit logs: {e}")
         return jsonify({
@@ -97,7 +141,11 @@ def get_recent_logs():
     """Получение последних логов."""
     try:
         limit = min(request.args.get('limit', 20, type=int), 100)
-        logs = AuditLog.get_recent_logs(limit=limit)
+        hours = request.args.get('hours', 24, type=int)
+        logs = AuditLog.search(
+            date_from=datetime.utcnow() - timedelta(hours=hours),
+            **_details_filters()
+        ).limit(limit).all()
         
         logs_data = [log.to_dict() for log in logs]
         
@@ -109,6 +157,13 @@ def get_recent_logs():
             }
         })
         
+    except ValidationError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+    except (DataError, ProgrammingError) as e:
+        return _details_path_error(e)
     except Exception as e:
         current_app.logger.error(f"Error getting recent logs: {e}")
         return jsonify({
@@ -133,7 +188,7 @@ def get_staff_logs(staff_id):
                 "message": "Сотрудник не найден"
             }), 404
         
-        logs = AuditLog.get_by_staff(staff_id, limit)
+        logs = AuditLog.search(staff_id=staff_id, **_details_filters()).limit(limit).all()
         logs_data = [log.to_dict() for log in logs]
         
         return jsonify({
@@ -150,6 +205,13 @@ def get_staff_logs(staff_id):
             }
         })
         
+    except ValidationError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+    except (DataError, ProgrammingError) as e:
+        return _details_path_error(e)
     except Exception as e:
         current_app.logger.error(f"Error getting staff logs: {e}")
         return jsonify({
@@ -175,7 +237,7 @@ def get_table_logs(table_id):
                 "message": "Стол не найден"
             }), 404
         
-        logs = AuditLog.get_by_table(table_id, limit)
+        logs = AuditLog.search(table_id=table_id, **_details_filters()).limit(limit).all()
         logs_data = [log.to_dict() for log in logs]
         
         return jsonify({
@@ -191,6 +253,13 @@ def get_table_logs(table_id):
             }
         })
         
+    except ValidationError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+    except (DataError, ProgrammingError) as e:
+        return _details_path_error(e)
     except Exception as e:
         current_app.logger.error(f"Error getting table logs: {e}")
         return jsonify({
@@ -216,7 +285,7 @@ def get_order_logs(order_id):
                 "message": "Заказ не найден"
             }), 404
         
-        logs = AuditLog.get_by_order(order_id, limit)
+        logs = AuditLog.search(order_id=order_id, **_details_filters()).limit(limit).all()
         logs_data = [log.to_dict() for log in logs]
         
         return jsonify({
@@ -236,6 +305,13 @@ def get_order_logs(order_id):
             }
         })
         
+    except ValidationError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+    except (DataError, ProgrammingError) as e:
+        return _details_path_error(e)
     except Exception as e:
         current_app.logger.error(f"Error getting order logs: {e}")
         return jsonify({
@@ -267,10 +343,11 @@ def get_logs_by_date_range():
         if start_date >= end_date:
             raise ValidationError("Дата начала должна быть раньше даты окончания")
         
-        logs = AuditLog.get_logs_by_date_range(start_date, end_date)
-        
-        # Ограничиваем количество
-        logs = logs[:limit]
+        logs = AuditLog.search(
+            date_from=start_date,
+            date_to=end_date,
+            **_details_filters()
+        ).limit(limit).all()
         logs_data = [log.to_dict() for log in logs]
         
         return jsonify({
@@ -291,6 +368,8 @@ def get_logs_by_date_range():
             "status": "error",
             "message": str(e)
         }), 400
+    except (DataError, ProgrammingError) as e:
+        return _details_path_error(e)
     except Exception as e:
         current_app.logger.error(f"Error getting logs by date range: {e}")
         return jsonify({
@@ -298,6 +377,21 @@ def get_logs_by_date_range():
             "message": "Ошибка при получении логов за период"
         }), 500
 
+@audit_api.route('/policy', methods=['GET'])
+@login_required
+@admin_required
+def get_audit_policy():
+    """Скомпилированная политика аудита: решение по каждому endpoint."""
+    from app.utils.audit_policy import audit_policy
+    
+    return jsonify({
+        "status": "success",
+        "data": {
+            "policy_file": audit_policy.path,
+            "endpoints": audit_policy.table()
+        }
+    })
+
 @audit_api.route('/statistics', methods=['GET'])
 @login_required
 @admin_required
@@ -353,7 +447,8 @@ def get_audit_stats():
                 "staff_stats": [
                     {"staff_id": staff_id, "name": name, "count": count}
                     for staff_id, name, count in staff_stats
-                ]
+                ],
+                "writer": audit_writer.metrics()
             }
         })
         
@@ -12,30 +12,25 @@ bonus_cards_bp = Blueprint('bonus_cards', __name__)
 
 @bonus_cards_bp.route('/check', methods=['POST'])
 def check_bonus_card():
-    """Проверка бонусной карты."""
+    """Проверка бонусной карты (по снимку из кэша, без записи в БД)."""
+    from flask import current_app
+    from app.utils.bonus_card_cache import bonus_card_cache
     try:
-        from flask import current_app
-        current_app.logger.info("=== BONUS CARD CHECK STARTED ===")
-        
         data = request.get_json()
-        current_app.logger.info(f"Request data: {data}")
         
         if not data or 'card_number' not in data:
             raise ValidationError("Номер карты обязателен")
         
         card_number = data['card_number'].strip()
-        current_app.logger.info(f"Card number: {card_number}")
         
         if len(card_number) != 6 or not card_number.isdigit():
             raise ValidationError("Номер карты должен содержать 6 цифр")
         
-        # Ищем карту
-        current_app.logger.info("Searching for bonus card...")
-        bonus_card = BonusCard.find_by_card_number(card_number)
-        current_app.logger.info(f"Found card: {bonus_card}")
+        # Ищем карту (несуществующие номера тоже кэшируются ненадолго)
+        card = bonus_card_cache.get(card_number)
         
-        if not bonus_card:
-            current_app.logger.info("Card not found")
+        if not card:
+            current_app.logger.debug("Bonus card %s not found", card_number)
             return jsonify({
                 'status': 'error',
                 'message': 'Карта не найдена',
@@ -45,40 +40,29 @@ def check_bonus_card():
                 }
             }), 404
         
-        # Проверяем валидность карты (с автоматической деактивацией)
-        current_app.logger.info("Checking card validity...")
-        is_valid = bonus_card.is_valid()
-        current_app.logger.info(f"Card is valid: {is_valid}")
-        
-        if not is_valid:
-            current_app.logger.info("Card is not valid")
-            reason = bonus_card.get_invalidity_reason()
+        # Проверяем валидность карты по окну действия; истекшие карты деактивирует ночная задача
+        reason = card.invalidity_reason()
+        if reason:
+            current_app.logger.debug("Bonus card %s is not valid: %s", card_number, reason)
             return jsonify({
                 'status': 'error',
                 'message': 'Карта неактивна или срок действия истек',
                 'data': {
-                    'card': bonus_card.to_dict(),
+                    'card': card.data,
                     'reason': reason,
                     'card_number': card_number
                 }
             }), 400
         
-        # Сериализуем карту
-        current_app.logger.info("Serializing card...")
-        card_dict = bonus_card.to_dict()
-        current_app.logger.info(f"Card dict: {card_dict}")
-        
-        current_app.logger.info("=== BONUS CARD CHECK SUCCESS ===")
         return jsonify({
             'status': 'success',
             'message': 'Карта найдена',
             'data': {
-                'card': card_dict
+                'card': card.data
             }
         })
         
     except ValidationError as e:
-        current_app.logger.error(f"Validation error: {e}")
         return jsonify({
             'status': 'error',
             'message': str(e),
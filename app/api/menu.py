@@ -6,7 +6,6 @@ API endpoints для работы с меню ресторана.
 """
 
 from flask import Blueprint, jsonify, request, current_app
-from flask_limiter.util import get_remote_address
 from app.models import MenuCategory, MenuItem, MenuItemSize
 from app.utils.decorators import measure_time, log_requests
 from app.utils.validators import sanitize_input
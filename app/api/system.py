@@ -9,6 +9,10 @@ from app.utils.decorators import measure_time, log_requests
 from app.version import get_version_info, __version__
 from app.utils.admin_tools import SystemInfo
 from app import limiter
+from app.request_pipeline import request_pipeline
+from app.utils.structured_logging import structured_logging
+from app.utils.staff_identity import staff_identity
+from app.utils.bonus_card_cache import bonus_card_cache
 import logging
 from datetime import datetime
 import time
@@ -217,9 +221,10 @@ def get_system_stats():
             "memory_usage": {
                 "description": "Для получения информации о памяти требуется psutil"
             },
-            "request_stats": {
-                "description": "Статистика запросов будет добавлена в будущих версиях"
-            }
+            "request_stats": request_pipeline.stats(),
+            "logging": structured_logging.stats(),
+            "staff_identity": staff_identity.stats(),
+            "bonus_card_cache": bonus_card_cache.stats()
         }
         
         logger.info("System stats requested")
@@ -2,16 +2,16 @@
 
 from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, make_response, current_app
 from flask_login import current_user
-from sqlalchemy import func, desc, extract
+from sqlalchemy import func, desc, extract, or_
 import sqlalchemy.orm as so
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import json
 from decimal import Decimal
 
 from app import db
 from app.models import (
     Staff, MenuCategory, MenuItem, Table, Order, OrderItem, 
-    BonusCard, AuditLog, SystemSetting, DailyReport, TableAssignment, Banner
+    BonusCard, AuditLog, AuditStatHourly, SystemSetting, DailyReport, TableAssignment, Banner
 )
 from app.utils.decorators import admin_required, audit_action, with_transaction
 from app.utils.image_upload import ImageUploadManager
@@ -292,6 +292,7 @@ def update_staff(staff_id):
         staff_name = staff.name
         db.session.delete(staff)
         db.session.commit()
+        _revoke_staff_sessions(staff_id)
         
         return jsonify({
             'status': 'success',
@@ -309,6 +310,8 @@ def update_staff(staff_id):
     if len(data) == 1 and 'is_active' in data:
         staff.is_active = bool(data['is_active'])
         db.session.commit()
+        if not staff.is_active:
+            _revoke_staff_sessions(staff_id)
         
         return jsonify({
             'status': 'success',
@@ -322,6 +325,7 @@ def update_staff(staff_id):
         return jsonify({'status': 'error', 'message': 'Валидация не пройдена', 'errors': form.errors}), 400
     
     # Обновление полей только если они переданы
+    previous_role = staff.role
     if 'name' in data:
         staff.name = form.name.data
     if 'role' in data:
@@ -336,12 +340,55 @@ def update_staff(staff_id):
     
     db.session.commit()
     
+    # Смена пароля, роли или деактивация - выход на всех устройствах
+    if form.password.data or staff.role != previous_role or not staff.is_active:
+        _revoke_staff_sessions(staff_id)
+    
     return jsonify({
         'status': 'success',
         'message': 'Данные сотрудника обновлены',
         'data': staff.to_dict()
     })
 
+def _revoke_staff_sessions(staff_id: int) -> None:
+    """Отзыв всех сессий сотрудника (ошибка хранилища не отменяет изменение)."""
+    from app.utils.session_store import session_store
+    try:
+        session_store.revoke('staff', staff_id)
+    except Exception as e:
+        current_app.logger.error(f"Failed to revoke sessions for staff {staff_id}: {e}")
+
+@admin_bp.route('/sessions/revoke', methods=['POST'])
+@admin_required
+@audit_action("revoke_sessions")
+def revoke_sessions():
+    """Массовый выход: всех сотрудников, роли (например, всех официантов) или одного сотрудника."""
+    from app.utils.session_store import session_store
+    
+    data = request.get_json() or {}
+    scope = data.get('scope', 'all')
+    value = data.get('value')
+    
+    if scope == 'role' and value not in ('waiter', 'admin', 'kitchen', 'bar'):
+        return jsonify({'status': 'error', 'message': 'Неизвестная роль'}), 400
+    if scope == 'staff':
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return jsonify({'status': 'error', 'message': 'Не указан сотрудник'}), 400
+    
+    try:
+        generation = session_store.revoke(scope, value)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    # Отзыв по всем или по своей роли завершает и текущую сессию администратора
+    return jsonify({
+        'status': 'success',
+        'message': 'Сессии отозваны',
+        'data': {'scope': scope, 'value': value, 'generation': generation}
+    })
+
 
 
 @admin_bp.route('/csrf-token')
@@ -446,6 +493,22 @@ def sales_report():
         }
     })
 
+@admin_bp.route('/export/<dataset>')
+@admin_required
+@audit_action("export_data")
+def export_data(dataset):
+    """Потоковая выгрузка audit_logs, orders или order_items в CSV/NDJSON с фильтрами из query string."""
+    from app.utils.streaming_export import export_response
+    from app.errors import ValidationError
+    
+    try:
+        return export_response(dataset, request.args.get('format', 'csv'), request.args)
+    except ValidationError as e:
+        return jsonify({
+            'status': 'error',
+            'message': e.message
+        }), 400
+
 # === НАСТРОЙКИ СИСТЕМЫ ===
 
 @admin_bp.route('/settings')
@@ -484,6 +547,38 @@ def printers():
     """Настройки принтеров с паролевым доступом."""
     return render_template('admin/printers.html')
 
+@admin_bp.route('/printers/stats')
+@admin_required
+def printers_stats():
+    """Счетчики соединений с принтерами (повторное использование, переподключения)."""
+    from app.utils.printer_pool import printer_pool
+    
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'connections': printer_pool.metrics()
+        }
+    })
+
+@admin_bp.route('/printers/status')
+@admin_required
+def printers_status():
+    """Доступность принтеров по данным фонового мониторинга (?refresh=1 - опросить сейчас)."""
+    from app.utils.printer_monitor import printer_monitor
+    
+    if request.args.get('refresh', type=int):
+        statuses = printer_monitor.check_all()
+    else:
+        statuses = printer_monitor.all_statuses()
+    
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'printers': statuses,
+            'interval': printer_monitor.interval
+        }
+    })
+
 @admin_bp.route('/security')
 @admin_required
 @audit_action("view_security_settings")
@@ -550,6 +645,10 @@ def update_settings():
             db.session.add(setting)
         updated_settings.append(key)
     
+    # Шаблоны чеков и настройки принтеров закешированы - сбрасываем
+    from app.utils.receipt_templates import receipt_templates
+    receipt_templates.invalidate()
+    
     # Уведомляем клиентов об изменении настроек
     try:
         from app.websocket.events import broadcast_content_update
@@ -596,12 +695,8 @@ def audit_logs():
         page=page, per_page=per_page, error_out=False
     )
     
-    # Статистика действий
-    actions_stats_rows = db.session.query(
-        AuditLog.action,
-        func.count(AuditLog.id).label('count')
-    ).group_by(AuditLog.action).order_by(desc('count')).limit(10).all()
-    actions_stats = [(row[0], int(row[1])) for row in actions_stats_rows]
+    # Статистика действий (почасовые агрегаты)
+    actions_stats = AuditStatHourly.top_actions(current_app.config.get('AUDIT_STATS_PAGE_DAYS', 30), limit=10)
     
     def get_log_severity(action):
         """Определение уровня важности действия для стилизации."""
@@ -1110,24 +1205,45 @@ def restore_backup():
 @admin_bp.route('/audit/cleanup', methods=['POST'])
 @admin_required
 @audit_action("cleanup_audit_logs")
-@with_transaction
 def cleanup_audit_logs():
-    """Очистка старых логов аудита."""
-    data = request.get_json()
-    days_old = data.get('days_old', 30)
-    
-    cutoff_date = datetime.now() - timedelta(days=days_old)
-    
-    # Подсчет записей для удаления
-    old_logs = AuditLog.query.filter(AuditLog.created_at < cutoff_date)
-    count = old_logs.count()
-    
-    # Удаление старых записей
-    old_logs.delete()
-    
+    """Запуск очистки логов аудита по политике хранения в фоне."""
+    from app.utils.audit_retention import audit_retention
+
+    data = request.get_json(silent=True) or {}
+    days_old = data.get('days_old')
+    if days_old is not None:
+        try:
+            days_old = int(days_old)
+        except (TypeError, ValueError):
+            days_old = -1
+        if days_old < 1:
+            return jsonify({
+                'status': 'error',
+                'message': 'days_old должно быть положительным числом'
+            }), 400
+
+    if not audit_retention.start_background(days=days_old):
+        return jsonify({
+            'status': 'error',
+            'message': 'Очистка уже выполняется',
+            'data': audit_retention.status()
+        }), 409
+
+    return jsonify({
+        'status': 'success',
+        'message': 'Очистка запущена',
+        'data': {'policy': audit_retention.policy()}
+    }), 202
+
+@admin_bp.route('/audit/cleanup/status')
+@admin_required
+def cleanup_audit_logs_status():
+    """Ход выполнения текущей или последней очистки логов аудита."""
+    from app.utils.audit_retention import audit_retention
+
     return jsonify({
         'status': 'success',
-        'message': f'Удалено {count} записей старше {days_old} дней'
+        'data': audit_retention.status()
     })
 
 @admin_bp.route('/z-reports/<int:report_id>')
@@ -2194,6 +2310,9 @@ def get_bonus_cards():
             error_out=False
         )
         
+        # Имена всей страницы расшифровываются одним проходом в процессе
+        BonusCard.decrypt_all(pagination.items)
+        
         cards_data = []
         for card in pagination.items:
             try:
@@ -2396,55 +2515,56 @@ def toggle_bonus_card_status(card_id):
 @admin_required
 @audit_action("get_top_dishes_report")
 def get_top_dishes_report():
-    """Получение отчета по топ блюдам по продажам."""
+    """Получение отчета по топ блюдам по продажам (один агрегирующий запрос)."""
     try:
         from app.models import Order, OrderItem, MenuItem
         
         # Получаем параметры запроса
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
+        language = request.args.get('language', 'ru')
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        category_ids = [int(value) for value in request.args.get('category_id', '').split(',') if value.strip().isdigit()]
         
-        current_app.logger.info(f"Getting top dishes report: start_date={start_date}, end_date={end_date}")
-        
-        # Простой запрос без сложных JOIN'ов
-        dishes_data = []
+        # Название на выбранном языке, пустое - русское (как MenuItem.get_name)
+        name_column = {'tk': MenuItem.name_tk, 'en': MenuItem.name_en}.get(language)
+        name = db.func.coalesce(db.func.nullif(name_column, ''), MenuItem.name_ru) if name_column is not None else MenuItem.name_ru
+        quantity = db.func.sum(OrderItem.quantity)
+        revenue = db.func.sum(OrderItem.quantity * OrderItem.unit_price)
         
-        # Получаем все блюда
-        menu_items = MenuItem.query.all()
-        
-        for item in menu_items:
-            # Для каждого блюда считаем статистику
-            order_items_query = OrderItem.query.filter_by(menu_item_id=item.id)
-            
-            # Применяем фильтры по датам через заказы
-            if start_date or end_date:
-                order_items_query = order_items_query.join(Order, OrderItem.order_id == Order.id)
-                
-                if start_date:
-                    order_items_query = order_items_query.filter(Order.created_at >= start_date)
-                if end_date:
-                    order_items_query = order_items_query.filter(Order.created_at <= end_date)
-                
-                order_items_query = order_items_query.filter(Order.status.in_(['completed', 'confirmed']))
+        query = db.session.query(
+            MenuItem.id,
+            name.label('name'),
+            quantity.label('quantity'),
+            revenue.label('revenue')
+        ).join(OrderItem, OrderItem.menu_item_id == MenuItem.id)
+        
+        # Применяем фильтры по датам через заказы
+        if start_date or end_date:
+            query = query.join(Order, OrderItem.order_id == Order.id)
             
-            order_items = order_items_query.all()
+            if start_date:
+                query = query.filter(Order.created_at >= start_date)
+            if end_date:
+                query = query.filter(Order.created_at <= end_date)
             
-            if order_items:
-                total_quantity = sum(item.quantity for item in order_items)
-                total_revenue = sum(item.quantity * item.unit_price for item in order_items)
-                
-                dishes_data.append({
-                    'name': item.name_ru,  # Используем русское название
-                    'id': item.id,
-                    'quantity': total_quantity,
-                    'revenue': total_revenue
-                })
+            query = query.filter(Order.status.in_(['completed', 'confirmed']))
+        
+        if category_ids:
+            query = query.filter(MenuItem.category_id.in_(category_ids))
         
-        # Сортируем по количеству и берем топ 10
-        dishes_data.sort(key=lambda x: x['quantity'], reverse=True)
-        dishes_data = dishes_data[:10]
+        # Группировка, сортировка и топ N - в БД
+        rows = query.group_by(MenuItem.id, MenuItem.name_ru, *([name_column] if name_column is not None else []))\
+                    .order_by(quantity.desc(), MenuItem.id)\
+                    .limit(limit)\
+                    .all()
         
-        current_app.logger.info(f"Found {len(dishes_data)} top dishes")
+        dishes_data = [{
+            'name': row.name,
+            'id': row.id,
+            'quantity': int(row.quantity),
+            'revenue': float(row.revenue or 0)
+        } for row in rows]
         
         return jsonify({
             'status': 'success',
@@ -2583,68 +2703,82 @@ def get_category_distribution_report():
 @admin_required
 @audit_action("get_table_usage_report")
 def get_table_usage_report():
-    """Получение отчета по загрузке столов."""
+    """Получение отчета по загрузке столов (два запроса при любом числе столов)."""
     try:
         from app.models import Table, Order, TableAssignment, Staff
         
         # Получаем параметры запроса
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
+        period_start = _as_utc(datetime.fromisoformat(start_date)) if start_date else None
+        period_end = _as_utc(datetime.fromisoformat(end_date)) if end_date else None
+        
+        # Количество заказов за период по столам
+        orders_query = db.session.query(Order.table_id, func.count(Order.id).label('orders_count'))
+        if period_start:
+            orders_query = orders_query.filter(Order.created_at >= period_start)
+        if period_end:
+            orders_query = orders_query.filter(Order.created_at <= period_end)
+        orders_sq = orders_query.group_by(Order.table_id).subquery()
+        
+        # Официант по активному назначению
+        waiters_sq = db.session.query(
+            TableAssignment.table_id,
+            func.min(Staff.name).label('waiter_name')
+        ).join(Staff, Staff.id == TableAssignment.waiter_id)\
+         .filter(TableAssignment.is_active.is_(True))\
+         .group_by(TableAssignment.table_id)\
+         .subquery()
+        
+        tables = db.session.query(
+            Table.id,
+            Table.table_number,
+            Table.capacity,
+            func.coalesce(orders_sq.c.orders_count, 0).label('orders_count'),
+            waiters_sq.c.waiter_name
+        ).outerjoin(orders_sq, orders_sq.c.table_id == Table.id)\
+         .outerjoin(waiters_sq, waiters_sq.c.table_id == Table.id)\
+         .all()
+        
+        # Интервалы занятости: от подтверждения до завершения/отмены заказа;
+        # незавершенный подтвержденный заказ занимает стол до сих пор
+        released_at = func.coalesce(Order.completed_at, Order.cancelled_at)
+        intervals_query = db.session.query(Order.table_id, Order.confirmed_at, released_at)\
+            .filter(Order.confirmed_at.isnot(None))\
+            .filter(or_(released_at.isnot(None), Order.status == 'confirmed'))
+        if period_start:
+            intervals_query = intervals_query.filter(or_(released_at.is_(None), released_at > period_start))
+        if period_end:
+            intervals_query = intervals_query.filter(Order.confirmed_at < period_end)
+        intervals = intervals_query.order_by(Order.table_id, Order.confirmed_at).all()
+        
+        now = datetime.now(timezone.utc)
+        if period_end is None or period_end > now:
+            period_end = now
+        if period_start is None:
+            period_start = min((_as_utc(row[1]) for row in intervals), default=period_end)
+        period_seconds = (period_end - period_start).total_seconds()
+        occupancy = _merge_occupancy(intervals, period_start, period_end)
         
-        current_app.logger.info(f"Getting table usage report: start_date={start_date}, end_date={end_date}")
-        
-        # Получаем все столы
-        tables = Table.query.all()
         tables_data = []
-        
         for table in tables:
-            # Получаем количество заказов за период
-            orders_query = Order.query.filter_by(table_id=table.id)
-            
-            if start_date:
-                orders_query = orders_query.filter(Order.created_at >= start_date)
-            if end_date:
-                orders_query = orders_query.filter(Order.created_at <= end_date)
-            
-            orders_count = orders_query.count()
-            
-            # Получаем текущее назначение официанта (если есть)
-            waiter_name = "Не назначен"
-            try:
-                # Ищем активное назначение для стола
-                current_assignment = TableAssignment.query.filter_by(
-                    table_id=table.id,
-                    is_active=True
-                ).first()
-                
-                # Если есть назначение, получаем имя официанта
-                if current_assignment and current_assignment.waiter_id:
-                    waiter = Staff.query.get(current_assignment.waiter_id)
-                    if waiter:
-                        waiter_name = waiter.name
-                        
-            except Exception as e:
-                current_app.logger.warning(f"Could not get assignment for table {table.id}: {e}")
-            
-            # Рассчитываем загруженность (процент времени с заказами)
-            # Упрощенный расчет - просто количество заказов
-            usage_percentage = min(orders_count * 10, 100)  # 10% за каждый заказ, максимум 100%
-            
+            occupied_seconds, visits = occupancy.get(table.id, (0.0, 0))
             tables_data.append({
                 'id': table.id,
                 'table_number': table.table_number,
                 'capacity': table.capacity,
-                'orders_count': orders_count,
-                'waiter_name': waiter_name,
-                'usage_percentage': usage_percentage,
-                'status': 'active' if orders_count > 0 else 'inactive'
+                'orders_count': table.orders_count,
+                'waiter_name': table.waiter_name or "Не назначен",
+                'occupied_minutes': round(occupied_seconds / 60),
+                'visits': visits,
+                'avg_visit_minutes': round(occupied_seconds / 60 / visits) if visits else 0,
+                'usage_percentage': round(occupied_seconds / period_seconds * 100, 1) if period_seconds > 0 else 0,
+                'status': 'active' if table.orders_count > 0 else 'inactive'
             })
         
         # Сортируем по количеству заказов (самые загруженные сверху)
         tables_data.sort(key=lambda x: x['orders_count'], reverse=True)
         
-        current_app.logger.info(f"Found {len(tables_data)} tables")
-        
         return jsonify({
             'status': 'success',
             'data': tables_data
@@ -2657,6 +2791,46 @@ def get_table_usage_report():
             'message': f'Ошибка получения отчета по загрузке столов: {str(e)}'
         }), 500
 
+def _as_utc(moment: datetime) -> datetime:
+    """Время с часовым поясом (наивное считается UTC)."""
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+def _merge_occupancy(intervals, period_start: datetime, period_end: datetime) -> dict:
+    """
+    Занятость столов по интервалам заказов: пересекающиеся интервалы одного
+    стола объединяются (несколько заказов за одним столом - одно посещение).
+    
+    Args:
+        intervals: (table_id, начало, конец или None), отсортированные по столу и началу
+        period_start: Начало периода отчета
+        period_end: Конец периода (и конец незавершенных интервалов)
+    
+    Returns:
+        dict: {table_id: (секунд занятости, посещений)}
+    """
+    occupancy = {}
+    table_id = run_start = run_end = None
+    
+    def close_run():
+        if table_id is not None:
+            seconds, visits = occupancy.get(table_id, (0.0, 0))
+            occupancy[table_id] = (seconds + (run_end - run_start).total_seconds(), visits + 1)
+    
+    for row_table_id, started, released in intervals:
+        start = max(_as_utc(started), period_start)
+        end = min(_as_utc(released), period_end) if released else period_end
+        if end <= start:
+            continue
+        if row_table_id == table_id and start <= run_end:
+            run_end = max(run_end, end)
+            continue
+        close_run()
+        table_id, run_start, run_end = row_table_id, start, end
+    close_run()
+    return occupancy
+
 @admin_bp.route('/orders/<int:order_id>/print-final-receipt', methods=['POST'])
 @admin_required
 @audit_action("print_final_receipt")
@@ -2668,17 +2842,15 @@ def admin_print_final_receipt(order_id):
         from app.utils.print_service import PrintService
         
         print_service = PrintService()
-        success = print_service.print_final_receipt(order)
-        if success:
-            # Только выставляем флаг печати итогового чека, статус не меняем
-            order.final_receipt_printed = True
-            db.session.commit()
+        # Флаг final_receipt_printed выставит обработчик очереди после печати
+        job = print_service.queue_final_receipt(order, waiter_id=order.waiter_id)
         
         return jsonify({
-            'status': 'success' if success else 'error',
-            'message': 'Финальный чек напечатан' if success else 'Ошибка печати финального чека',
+            'status': 'success',
+            'message': 'Финальный чек отправлен на печать',
             'data': {
-                'receipt_printed': success
+                'job_id': job.id,
+                'job_status': job.status
             }
         })
         
@@ -7,14 +7,14 @@ from app.models import Staff, SystemSetting
 from app.errors import ValidationError, AuthenticationError, AuthorizationError
 from app.utils.decorators import audit_action, admin_required
 from app import db
-from datetime import datetime, timedelta
-from typing import Dict
+from app.utils.ip_blocklist import ip_blocklist
+from app.utils.password_hashing import password_hashing, PasswordHashingBusy
+from datetime import datetime, timezone
+import ipaddress
+import time
 
 auth_bp = Blueprint('auth', __name__)
 
-# Хранилище попыток входа (в продакшене лучше использовать Redis)
-login_attempts: Dict[str, Dict] = {}
-
 def get_client_ip() -> str:
     """Получить реальный IP адрес клиента."""
     # Проверяем заголовки прокси в порядке приоритета
@@ -48,74 +48,13 @@ def get_client_ip() -> str:
         
         return client_ip
 
-def get_login_attempts(ip: str) -> Dict:
-    """Получить информацию о попытках входа для IP."""
-    return login_attempts.get(ip, {'count': 0, 'blocked_until': None, 'attempts': []})
-
-def record_failed_login(ip: str):
-    """Записать неудачную попытку входа."""
+def record_failed_login(ip: str) -> int:
+    """Записать неудачную попытку входа; возвращает число попыток за последний час."""
     max_attempts = int(SystemSetting.get_setting('max_login_attempts', '5'))
-    block_duration = int(SystemSetting.get_setting('block_duration', '30'))
-    
-    if ip not in login_attempts:
-        login_attempts[ip] = {'count': 0, 'blocked_until': None, 'attempts': []}
-    
-    login_attempts[ip]['count'] += 1
-    login_attempts[ip]['attempts'].append(datetime.now())
-    
-    # Очистка старых попыток (старше часа)
-    hour_ago = datetime.now() - timedelta(hours=1)
-    login_attempts[ip]['attempts'] = [
-        attempt for attempt in login_attempts[ip]['attempts'] 
-        if attempt > hour_ago
-    ]
-    
-    # Обновляем счетчик на основе попыток за последний час
-    login_attempts[ip]['count'] = len(login_attempts[ip]['attempts'])
-    
-    # Блокировка при превышении лимита
-    if login_attempts[ip]['count'] >= max_attempts:
-        login_attempts[ip]['blocked_until'] = datetime.now() + timedelta(minutes=block_duration)
-        current_app.logger.warning(f"IP {ip} blocked for {block_duration} minutes after {max_attempts} failed login attempts")
-
-def clear_login_attempts(ip: str):
-    """Очистить попытки входа для IP после успешного входа."""
-    if ip in login_attempts:
-        del login_attempts[ip]
-
-def is_ip_blocked(ip: str) -> bool:
-    """Проверить, заблокирован ли IP."""
-    if ip not in login_attempts:
-        return False
-    
-    blocked_until = login_attempts[ip].get('blocked_until')
-    if blocked_until and datetime.now() < blocked_until:
-        return True
-    
-    # Разблокировать если время истекло
-    if blocked_until and datetime.now() >= blocked_until:
-        current_app.logger.info(f"IP {ip} automatically unblocked after timeout")
-        login_attempts[ip]['blocked_until'] = None
-        login_attempts[ip]['count'] = 0
-        login_attempts[ip]['attempts'] = []
-    
-    return False
-
-def cleanup_expired_blocks():
-    """Очистить истекшие блокировки."""
-    current_time = datetime.now()
-    expired_ips = []
-    
-    for ip, data in login_attempts.items():
-        blocked_until = data.get('blocked_until')
-        if blocked_until and current_time >= blocked_until:
-            expired_ips.append(ip)
-    
-    for ip in expired_ips:
-        current_app.logger.info(f"Cleaning up expired block for IP {ip}")
-        login_attempts[ip]['blocked_until'] = None
-        login_attempts[ip]['count'] = 0
-        login_attempts[ip]['attempts'] = []
+    count, entry = ip_blocklist.register_failure(ip, max_attempts, window=3600)
+    if entry:
+        current_app.logger.warning(f"IP {ip} blocked after {max_attempts} failed login attempts")
+    return count
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
 @audit_action("user_login_attempt", table_affected=False, order_affected=False)
@@ -123,21 +62,18 @@ def login():
     """Вход в систему."""
     client_ip = get_client_ip()
     
-    # Проверка блокировки IP
-    if is_ip_blocked(client_ip):
-        attempts_info = get_login_attempts(client_ip)
-        blocked_until = attempts_info.get('blocked_until')
-        if blocked_until:
-            time_left = blocked_until - datetime.now()
-            total_seconds = int(time_left.total_seconds())
-            
-            if total_seconds >= 60:
-                minutes_left = int(total_seconds / 60)
-                flash(f'IP адрес заблокирован на {minutes_left} минут из-за превышения лимита попыток входа', 'error')
-            else:
-                flash(f'IP адрес заблокирован на {total_seconds} секунд из-за превышения лимита попыток входа', 'error')
-            current_app.logger.warning(f"Blocked IP {client_ip} attempted login")
-            return render_template('auth/login.html', form=LoginForm(), blocked=True)
+    # Проверка блокировки IP (общий список блокировок, включая подсети) - до формы и хеширования
+    block = ip_blocklist.lookup(client_ip, scope='login')
+    if block:
+        total_seconds = max(0, int(block['expires_at'] - time.time()))
+        
+        if total_seconds >= 60:
+            minutes_left = int(total_seconds / 60)
+            flash(f'IP адрес заблокирован на {minutes_left} минут из-за превышения лимита попыток входа', 'error')
+        else:
+            flash(f'IP адрес заблокирован на {total_seconds} секунд из-за превышения лимита попыток входа', 'error')
+        current_app.logger.warning(f"Blocked IP {client_ip} attempted login")
+        return render_template('auth/login.html', form=LoginForm(), blocked=True)
     
     if current_user.is_authenticated:
         # Перенаправление в зависимости от роли для авторизованных пользователей
@@ -153,13 +89,31 @@ def login():
     if form.validate_on_submit():
         staff = Staff.query.filter_by(login=form.username.data).first()
         
-        if staff and staff.check_password(form.password.data):
+        # Argon2 считается в пуле хеширования; с одного IP - не больше PASSWORD_HASH_MAX_PER_KEY проверок разом
+        try:
+            if staff:
+                password_ok = staff.check_password(form.password.data, key=client_ip)
+            else:
+                # Несуществующий логин проверяется столько же времени, сколько существующий
+                password_hashing.verify_dummy(form.password.data, key=client_ip)
+                password_ok = False
+        except PasswordHashingBusy as e:
+            current_app.logger.warning(f"Login from {client_ip} rejected: {e}")
+            flash('Сервер занят, повторите вход через несколько секунд', 'warning')
+            return render_template('auth/login.html', form=form), 503
+        
+        if password_ok:
             if not staff.is_active:
                 flash('Аккаунт деактивирован', 'error')
                 return render_template('auth/login.html', form=form)
             
+            # Параметры Argon2 изменились - сохраняем пересчитанный хеш
+            if db.session.is_modified(staff):
+                db.session.commit()
+                current_app.logger.info(f"Password hash for {staff.login} upgraded to current Argon2 parameters")
+            
             # Успешный вход - очищаем попытки
-            clear_login_attempts(client_ip)
+            ip_blocklist.clear_failures(client_ip)
             
             login_user(staff, remember=form.remember_me.data)
             flash(f'Добро пожаловать, {staff.name}!', 'success')
@@ -179,18 +133,17 @@ def login():
                 return redirect(url_for('auth.profile'))  # На профиль для остальных
         else:
             # Неудачный вход - записываем попытку
-            record_failed_login(client_ip)
-            attempts_info = get_login_attempts(client_ip)
+            attempts = record_failed_login(client_ip)
             
             max_attempts = int(SystemSetting.get_setting('max_login_attempts', '5'))
-            remaining = max_attempts - attempts_info['count']
+            remaining = max_attempts - attempts
             
             if remaining > 0:
                 flash(f'Неверное имя пользователя или пароль. Осталось попыток: {remaining}', 'error')
             else:
                 flash('Превышен лимит попыток входа. IP адрес заблокирован.', 'error')
             
-            current_app.logger.warning(f"Failed login attempt for {form.username.data} from {client_ip}. Attempts: {attempts_info['count']}")
+            current_app.logger.warning(f"Failed login attempt for {form.username.data} from {client_ip}. Attempts: {attempts}")
     
     return render_template('auth/login.html', form=form)
 
@@ -212,29 +165,26 @@ def profile():
 @auth_bp.route('/api/blocked-ips')
 @admin_required
 def get_blocked_ips():
-    """API для получения списка заблокированных IP (только для админов)."""
+    """API для получения списка заблокированных IP и подсетей (только для админов)."""
     from flask import jsonify
     
-    # Сначала очищаем истекшие блокировки
-    cleanup_expired_blocks()
-    
     blocked_ips = []
-    current_time = datetime.now()
+    now = time.time()
     
-    for ip, data in login_attempts.items():
-        blocked_until = data.get('blocked_until')
-        if blocked_until and blocked_until > current_time:
-            time_left = blocked_until - current_time
-            total_seconds = int(time_left.total_seconds())
-            
-            blocked_ips.append({
-                'ip': ip,
-                'attempts': data.get('count', 0),
-                'blocked_until': blocked_until.isoformat(),
-                'minutes_left': int(total_seconds / 60),
-                'seconds_left': total_seconds % 60,
-                'total_seconds': total_seconds
-            })
+    for entry in ip_blocklist.entries():
+        total_seconds = int(entry['expires_at'] - now)
+        blocked_ips.append({
+            'ip': entry['network'][:-3] if entry['network'].endswith('/32') else entry['network'],
+            'network': entry['network'],
+            'reason': entry['reason'],
+            'source': entry['source'],
+            'scope': entry['scope'],
+            'attempts': entry['attempts'],
+            'blocked_until': datetime.fromtimestamp(entry['expires_at'], tz=timezone.utc).isoformat(),
+            'minutes_left': int(total_seconds / 60),
+            'seconds_left': total_seconds % 60,
+            'total_seconds': total_seconds
+        })
     
     return jsonify({
         'status': 'success',
@@ -244,14 +194,66 @@ def get_blocked_ips():
         }
     })
 
-@auth_bp.route('/api/unblock-ip/<ip>', methods=['POST'])
+@auth_bp.route('/api/block-ip', methods=['POST'])
+@admin_required
+def block_ip():
+    """API для ручной блокировки IP или подсети (только для админов)."""
+    from flask import jsonify
+    
+    data = request.get_json(silent=True) or {}
+    target = (data.get('ip') or '').strip()
+    try:
+        network = ipaddress.ip_network(target, strict=False)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Неверный IP или подсеть: {e}'
+        }), 400
+    
+    # Слишком широкая подсеть отрезает всех клиентов разом
+    min_prefix = current_app.config.get('IP_BLOCK_MIN_PREFIX_V4' if network.version == 4 else 'IP_BLOCK_MIN_PREFIX_V6')
+    if min_prefix is not None and network.prefixlen < min_prefix:
+        return jsonify({
+            'status': 'error',
+            'message': f'Слишком широкая подсеть {network}: допускается не шире /{min_prefix}'
+        }), 400
+    
+    # Блокировка проверяется по remote_addr, журнал - по адресу из заголовков прокси
+    for own_ip in {request.remote_addr, get_client_ip()}:
+        try:
+            covers_own_ip = ipaddress.ip_address(own_ip) in network
+        except ValueError:
+            continue
+        if covers_own_ip:
+            return jsonify({
+                'status': 'error',
+                'message': f'{network} включает ваш IP {own_ip} - блокировка закроет вам доступ'
+            }), 400
+    
+    try:
+        minutes = int(data['minutes']) if data.get('minutes') else None
+        entry = ip_blocklist.block(target, minutes, reason=data.get('reason', ''),
+                                   source=f'admin:{current_user.login}')
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Неверный IP или подсеть: {e}'
+        }), 400
+    
+    return jsonify({
+        'status': 'success',
+        'message': f"{entry['network']} заблокирован",
+        'data': entry
+    })
+
+@auth_bp.route('/api/unblock-ip/<path:ip>', methods=['POST'])
 @admin_required
 def unblock_ip(ip: str):
-    """API для разблокировки IP (только для админов)."""
+    """API для разблокировки IP или подсети (только для админов)."""
     from flask import jsonify
     
-    if ip in login_attempts:
-        del login_attempts[ip]
+    if ip_blocklist.unblock(ip):
+        ip_blocklist.clear_failures(ip)
         current_app.logger.info(f"IP {ip} manually unblocked by admin {current_user.login}")
         return jsonify({
             'status': 'success',
@@ -261,4 +263,4 @@ def unblock_ip(ip: str):
         return jsonify({
             'status': 'error',
             'message': f'IP {ip} не найден в списке заблокированных'
-        }), 404 
\ No newline at end of file
+        }), 404
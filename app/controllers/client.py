@@ -3,6 +3,7 @@
 from flask import Blueprint, render_template, request, jsonify, current_app
 from app.models import Table, MenuItem, MenuCategory, SystemSetting, WaiterCall, TableAssignment, AuditLog, Order, OrderItem, BonusCard
 from app import db, csrf
+from app.utils.audit_writer import audit_writer
 from sqlalchemy import func
 from datetime import datetime
 import json
@@ -12,6 +13,7 @@ import re
 # Добавляем импорт WebSocket
 try:
     from app.websocket import socketio
+    from app.websocket.event_log import emit_room_event
     WEBSOCKET_AVAILABLE = True
 except ImportError:
     WEBSOCKET_AVAILABLE = False
@@ -26,8 +28,7 @@ def index():
         # Получаем настройки системы
         settings = get_system_settings()
         
-        # Логируем настройки для отладки
-        current_app.logger.info(f"Client settings loaded: {settings}")
+        current_app.logger.debug("Client settings loaded: %s", settings)
         
         # Проверяем, включена ли PIN-защита столов
         table_pin_enabled = settings.get('table_pin_enabled', True)
@@ -126,10 +127,7 @@ def get_banners():
         # Получаем только активные баннеры с учетом дат, отсортированные по порядку
         banners = Banner.get_current_banners()
         
-        # Логируем для отладки
-        current_app.logger.info(f"Found {len(banners)} current banners")
-        for banner in banners:
-            current_app.logger.info(f"Banner: {banner.title}, active: {banner.is_active}, start: {banner.start_date}, end: {banner.end_date}")
+        current_app.logger.debug("Found %d current banners", len(banners))
         
         # Преобразуем в формат для клиента
         banner_data = []
@@ -273,12 +271,7 @@ def get_tables():
 @client_bp.route('/api/menu')
 def get_menu():
     """Получение меню с категориями и блюдами."""
-    current_app.logger.info("=== MENU API CALLED ===")
-    current_app.logger.info(f"Request URL: {request.url}")
-    current_app.logger.info(f"Request method: {request.method}")
-    current_app.logger.info(f"Request args: {dict(request.args)}")
-    current_app.logger.info(f"Request headers: {dict(request.headers)}")
-    current_app.logger.info("========================")
+    current_app.logger.debug("Menu requested with args %s", request.args)
     
     try:
         language = request.args.get('lang', 'ru')
@@ -397,8 +390,7 @@ def get_client_settings():
 def get_carousel():
     """Получение настроек и слайдов карусели."""
     try:
-        current_app.logger.info(f"Carousel API called with args: {request.args}")
-        current_app.logger.info(f"Request headers: {dict(request.headers)}")
+        current_app.logger.debug("Carousel requested with args %s", request.args)
         
         settings = get_system_settings()
         
@@ -468,9 +460,7 @@ def create_order():
     """Создание заказа клиентом."""
     try:
         data = request.get_json()
-        current_app.logger.info(f"=== CREATE ORDER ROUTE CALLED ===")
-        current_app.logger.info(f"Request data: {data}")
-        current_app.logger.info(f"Bonus card: {data.get('bonus_card')}")
+        current_app.logger.debug("Create order payload: %s", data)
         
         # Валидация обязательных полей
         required_fields = ['table_id', 'items']
@@ -487,22 +477,13 @@ def create_order():
         bonus_card = data.get('bonus_card')
         language = data.get('language', 'ru')
         
-        # Добавляем отладочную информацию
-        current_app.logger.info(f"Creating order for table_id: {table_id}")
-        current_app.logger.info(f"Order data: {data}")
-        
         # Проверяем стол - сначала пытаемся найти по номеру стола, потом по ID
         try:
             table_id_int = int(table_id)
-            current_app.logger.info(f"Searching for table with number: {table_id_int}")
             table = Table.query.filter_by(table_number=table_id_int).first()
             if not table:
                 # Если не найден по номеру, пытаемся по ID
-                current_app.logger.info(f"Table not found by number, trying by ID: {table_id_int}")
                 table = Table.query.get(table_id_int)
-                current_app.logger.info(f"Table search by ID result: {table}")
-            else:
-                current_app.logger.info(f"Table found by number: {table.id} (number: {table.table_number})")
         except (ValueError, TypeError) as e:
             current_app.logger.error(f"Invalid table_id format: {table_id}, error: {e}")
             return jsonify({
@@ -529,19 +510,14 @@ def create_order():
                 "message": f"На стол {table.table_number} не назначен официант. Обратитесь к администратору."
             }), 400
         
-        current_app.logger.info(f"Стол {table.table_number} обслуживает официант {assigned_waiter.name} (ID: {assigned_waiter.id})")
-        
         # Проверяем, есть ли уже активный заказ для этого стола
-        current_app.logger.info(f"Checking for active orders on table {table.table_number} (ID: {table.id})")
         current_order = table.get_current_order()
         if current_order:
-            current_app.logger.info(f"Table {table.table_number} has active order {current_order.id} with status {current_order.status}")
+            current_app.logger.debug("Table %s has active order %s (%s)", table.table_number, current_order.id, current_order.status)
             return jsonify({
                 "status": "error",
                 "message": f"Для стола {table.table_number} уже есть активный заказ. Дождитесь завершения текущего заказа."
             }), 400
-        else:
-            current_app.logger.info(f"Table {table.table_number} has no active orders")
         
         # Проверяем блюда
         if not items:
@@ -600,10 +576,8 @@ def create_order():
         
         # Получаем назначенного официанта для стола
         waiter = table.get_assigned_waiter()
-        current_app.logger.info(f"Assigned waiter for table {table.table_number}: {waiter.name if waiter else 'None'}")
         
         # Создаем заказ
-        current_app.logger.info(f"Creating order with table_id={table.id}, waiter_id={waiter.id if waiter else None}")
         order = Order(
             table_id=table.id,
             guest_count=4,  # По умолчанию, можно добавить в запрос
@@ -620,28 +594,19 @@ def create_order():
         if bonus_card and bonus_card_obj and bonus_card_obj.is_active:
             order.bonus_card_id = bonus_card_obj.id
             order.discount_amount = discount_amount
-            
-            # ✅ ДОБАВЬ ЭТУ ОТЛАДКУ
-            current_app.logger.info(f"Setting bonus_card_id: {order.bonus_card_id}")
-            current_app.logger.info(f"Setting discount_amount: {order.discount_amount}")
-        else:
-            current_app.logger.info(f"Bonus card not applied: bonus_card={bonus_card}, bonus_card_obj={bonus_card_obj}")
+        elif bonus_card:
+            current_app.logger.debug("Bonus card %s not applied", bonus_card)
         
         # Сохраняем заказ
-        current_app.logger.info(f"Adding order to session: {order}")
         db.session.add(order)
-        current_app.logger.info("Flushing to get order ID...")
         db.session.flush()  # Получаем ID заказа
-        current_app.logger.info(f"Order ID after flush: {order.id}")
         
         # Создаем элементы заказа
-        current_app.logger.info(f"Creating {len(items)} order items...")
         for i, item_data in enumerate(items):
             dish_id = item_data.get('dish_id')
             quantity = item_data.get('quantity', 1)
             
             # Получаем информацию о блюде
-            current_app.logger.info(f"Looking for MenuItem with ID: {dish_id}")
             menu_item = MenuItem.query.get(dish_id)
             if not menu_item:
                 current_app.logger.error(f"MenuItem with ID {dish_id} not found")
@@ -650,8 +615,6 @@ def create_order():
                     "message": f"Блюдо с ID {dish_id} не найдено"
                 }), 400
             
-            current_app.logger.info(f"Found MenuItem: {menu_item.name_ru} (ID: {menu_item.id})")
-            
             # Создаем элемент заказа
             order_item = OrderItem(
                 order_id=order.id,
@@ -662,56 +625,35 @@ def create_order():
                 preparation_type='стандарт'  # По умолчанию
             )
             
-            current_app.logger.info(f"Order item {i+1}: {order_item}")
             db.session.add(order_item)
         
         # Изменяем статус стола на "занят" при создании заказа
-        current_app.logger.info(f"Setting table {table.table_number} status to 'occupied'")
-        
-        # Обновляем статус стола в базе данных
-        current_app.logger.info(f"Updating table status in database for table {table.table_number}")
         result = db.session.execute(
             db.text("UPDATE tables SET status = 'occupied' WHERE id = :table_id"),
             {"table_id": table.id}
         )
-        current_app.logger.info(f"Table status update result: {result.rowcount} rows affected")
+        current_app.logger.debug("Table %s set occupied: %d rows", table.table_number, result.rowcount)
         
         # Также обновляем объект таблицы для синхронизации
         table.status = 'occupied'
         
         # Сохраняем все изменения
-        current_app.logger.info("Committing all changes to database...")
         db.session.commit()
-        current_app.logger.info("Database commit successful")
-        
-        # Проверяем, что статус стола действительно обновился
-        db.session.refresh(table)
-        current_app.logger.info(f"Table {table.table_number} status after commit: {table.status}")
-        
-        # Дополнительная проверка через прямой запрос
-        table_status_check = db.session.execute(
-            db.text("SELECT status FROM tables WHERE id = :table_id"),
-            {"table_id": table.id}
-        ).scalar()
-        current_app.logger.info(f"Table {table.table_number} status from direct query: {table_status_check}")
         
-        # Аудирование
+        # Аудирование - через очередь фоновой записи
         try:
-            audit_log = AuditLog(
+            audit_writer.submit(
                 action='create_order',
                 staff_id=None,  # Клиентский интерфейс
                 ip_address=request.remote_addr,
                 table_affected=table.id,
                 order_affected=order.id,
-                details=json.dumps({  # Преобразуем dict в JSON строку
+                details={
                     'message': f'Order {order.id} created for table {table.table_number}',
                     'user_agent': request.headers.get('User-Agent'),
                     'created_at': order.created_at.isoformat()
-                })
+                }
             )
-            db.session.add(audit_log)
-            db.session.commit()
-            current_app.logger.info(f"Audit log created for order {order.id}")
         except Exception as e:
             current_app.logger.warning(f"Audit logging failed: {e}")
             # Не прерываем выполнение из-за ошибки аудита
@@ -720,7 +662,7 @@ def create_order():
         try:
             from app.websocket.events import notify_new_order
             notify_new_order(order.id)
-            current_app.logger.info(f"WebSocket уведомление отправлено для заказа {order.id}")
+            current_app.logger.debug("WebSocket уведомление отправлено для заказа %s", order.id)
         except Exception as e:
             current_app.logger.error(f"Ошибка отправки WebSocket уведомления: {e}")
         
@@ -741,7 +683,7 @@ def create_order():
             'created_at': order.created_at.isoformat()
         }
         
-        current_app.logger.info(f"Order {order.id} created successfully for table {table.table_number}")
+        current_app.logger.info("Order %s created for table %s", order.id, table.table_number)
         
         return jsonify({
             "status": "success",
@@ -822,14 +764,14 @@ def call_waiter():
         if WEBSOCKET_AVAILABLE and assigned_waiter:
             try:
                 # Отправляем уведомление конкретному официанту
-                socketio.emit('waiter_call', {
+                emit_room_event('waiter_call', {
                     'call_id': waiter_call.id,
                     'table_id': table.id,
                     'table_number': table.table_number,
                     'message': f'Вызов официанта к столу №{table.table_number}',
                     'waiter_id': assigned_waiter.id,
                     'timestamp': datetime.utcnow().isoformat()
-                }, room=f'waiter_{assigned_waiter.id}')
+                }, f'waiter_{assigned_waiter.id}')
                 
                 current_app.logger.info(f"WebSocket notification sent to waiter {assigned_waiter.id}")
                 
@@ -838,14 +780,14 @@ def call_waiter():
         elif WEBSOCKET_AVAILABLE:
             try:
                 # Если официант не назначен, отправляем общий вызов всем официантам
-                socketio.emit('waiter_call', {
+                emit_room_event('waiter_call', {
                     'call_id': waiter_call.id,
                     'table_id': table.id,
                     'table_number': table.table_number,
                     'message': f'Общий вызов официанта к столу №{table.table_number}',
                     'waiter_id': None,
                     'timestamp': datetime.utcnow().isoformat()
-                }, room='all_waiters')
+                }, 'all_waiters')
                 
                 current_app.logger.info("WebSocket notification sent to all waiters")
                 
@@ -1016,9 +958,9 @@ def complete_order(order_id):
         # Сохраняем изменения
         db.session.commit()
         
-        # Аудирование - создаем запись напрямую
+        # Аудирование - через очередь фоновой записи
         try:
-            audit_log = AuditLog(
+            audit_writer.submit(
                 action='complete_order',
                 staff_id=None,  # Клиентский интерфейс
                 ip_address=request.remote_addr,
@@ -1030,8 +972,6 @@ def complete_order(order_id):
                     'completed_at': order.completed_at.isoformat()
                 }
             )
-            db.session.add(audit_log)
-            db.session.commit()
         except Exception as audit_error:
             current_app.logger.warning(f"Audit logging failed: {audit_error}")
             # Не прерываем выполнение из-за ошибки аудита
@@ -1105,9 +1045,9 @@ def cancel_order(order_id):
         db.session.commit()
         current_app.logger.info("Изменения сохранены успешно")
         
-        # Аудирование - используем готовый метод
+        # Аудирование - через очередь фоновой записи
         try:
-            AuditLog.log_action(
+            audit_writer.submit(
                 action='cancel_order',
                 staff_id=None,  # Клиентский интерфейс
                 ip_address=request.remote_addr,
@@ -1129,14 +1069,14 @@ def cancel_order(order_id):
         
         # Отправляем WebSocket уведомление назначенному официанту об отмене заказа
         try:
-            from app.websocket import socketio
+            from app.websocket.event_log import emit_room_event
             if order.waiter_id:
-                socketio.emit('order_updated', {
+                emit_room_event('order_updated', {
                     'order_id': order.id,
                     'status': order.status,
                     'table_number': table.table_number if table else None,
                     'message': f'Заказ #{order.id} отменен клиентом'
-                }, room=f'waiter_{order.waiter_id}')
+                }, f'waiter_{order.waiter_id}')
                 current_app.logger.info(f"WebSocket уведомление об отмене заказа {order.id} отправлено официанту {order.waiter_id}")
             else:
                 current_app.logger.warning(f"Не удалось отправить WebSocket уведомление об отмене заказа {order.id}: официант не назначен")
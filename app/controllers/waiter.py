@@ -410,9 +410,7 @@ def print_order_receipts(order_id):
         }), 403
     
     try:
-        from app.utils.print_service import PrintService
-        
-        print_service = PrintService()
+        from app.websocket.kds import kds_board
         
         # Разделяем позиции по типам приготовления
         kitchen_items = []
@@ -431,16 +429,6 @@ def print_order_receipts(order_id):
             elif item.menu_item.preparation_type == 'bar':
                 bar_items.append(item)
         
-        # Печатаем чек на кухню
-        kitchen_success = False
-        if kitchen_items:
-            kitchen_success = print_service.print_kitchen_receipt(order, kitchen_items)
-        
-        # Печатаем чек в бар
-        bar_success = False
-        if bar_items:
-            bar_success = print_service.print_bar_receipt(order, bar_items)
-        
         # Если заказ был pending → переводим в confirmed
         if order.status == 'pending':
             if not order.can_transition_to('confirmed'):
@@ -464,16 +452,25 @@ def print_order_receipts(order_id):
             order.has_added_items = False
         db.session.commit()
         
+        # Только после commit: тикеты и задания печати не уходят для заказа,
+        # который не удалось подтвердить, и видят назначенного официанта
+        tickets = kds_board.publish_order(order, {
+            'kitchen': kitchen_items,
+            'bar': bar_items
+        })
+        kitchen_job_id = tickets.get('kitchen', {}).get('print_job_id')
+        bar_job_id = tickets.get('bar', {}).get('print_job_id')
+        
         # Отправляем WebSocket уведомление об обновлении заказа только назначенному официанту
         try:
-            from app.websocket import socketio
+            from app.websocket.event_log import emit_room_event
             if order.waiter_id:
-                socketio.emit('order_updated', {
+                emit_room_event('order_updated', {
                     'order_id': order.id,
                     'status': order.status,
                     'table_number': order.table.table_number,
                     'message': 'Заказ подтвержден и отправлен на печать'
-                }, room=f'waiter_{order.waiter_id}')
+                }, f'waiter_{order.waiter_id}')
                 current_app.logger.info(f"WebSocket уведомление отправлено официанту {order.waiter_id} для заказа {order.id}")
             else:
                 current_app.logger.warning(f"Не удалось отправить WebSocket уведомление для заказа {order.id}: официант не назначен")
@@ -484,14 +481,16 @@ def print_order_receipts(order_id):
             'status': 'success',
             'message': 'Чеки отправлены на печать',
             'data': {
-                'kitchen_printed': kitchen_success,
-                'bar_printed': bar_success,
+                'kitchen_job_id': kitchen_job_id,
+                'bar_job_id': bar_job_id,
                 'kitchen_items_count': len(kitchen_items),
-                'bar_items_count': len(bar_items)
+                'bar_items_count': len(bar_items),
+                'kds_tickets': {station: result['ticket_id'] for station, result in tickets.items()}
             }
         })
         
     except Exception as e:
+        db.session.rollback()
         current_app.logger.error(f"Print error: {e}")
         return jsonify({
             'status': 'error',
@@ -580,17 +579,15 @@ def print_final_receipt(order_id):
         from app.utils.print_service import PrintService
         
         print_service = PrintService()
-        success = print_service.print_final_receipt(order)
-        if success:
-            # Только выставляем флаг печати итогового чека, статус не меняем
-            order.final_receipt_printed = True
-            db.session.commit()
+        # Флаг final_receipt_printed выставит обработчик очереди после печати
+        job = print_service.queue_final_receipt(order, waiter_id=current_user.id)
         
         return jsonify({
-            'status': 'success' if success else 'error',
-            'message': 'Финальный чек напечатан' if success else 'Ошибка печати финального чека',
+            'status': 'success',
+            'message': 'Финальный чек отправлен на печать',
             'data': {
-                'receipt_printed': success
+                'job_id': job.id,
+                'job_status': job.status
             }
         })
         
@@ -601,6 +598,24 @@ def print_final_receipt(order_id):
             'message': f'Ошибка печати финального чека: {str(e)}'
         }), 500
 
+@waiter_bp.route('/api/print-jobs/<int:job_id>')
+@waiter_required
+def get_print_job(job_id):
+    """Статус задания печати."""
+    from app.models import PrintJob
+    
+    job = PrintJob.query.get_or_404(job_id)
+    if job.waiter_id and job.waiter_id != current_user.id:
+        return jsonify({
+            'status': 'error',
+            'message': 'У вас нет прав для просмотра этого задания'
+        }), 403
+    
+    return jsonify({
+        'status': 'success',
+        'data': job.to_dict()
+    })
+
 @waiter_bp.route('/api/orders/<int:order_id>/cancel', methods=['POST'])
 @waiter_required
 def cancel_order(order_id):
@@ -12,9 +12,11 @@ from .c_order_status import C_OrderStatus
 
 from .daily_report import DailyReport
 from .audit_log import AuditLog
+from .audit_stat import AuditStatHourly
 from .system_setting import SystemSetting
 from .bonus_card import BonusCard
 from .banner import Banner
+from .print_job import PrintJob
 
 __all__ = [
     'BaseModel',
@@ -31,7 +33,9 @@ __all__ = [
 
     'DailyReport',
     'AuditLog',
+    'AuditStatHourly',
     'SystemSetting',
     'BonusCard',
     'Banner',
+    'PrintJob',
 ] 
\ No newline at end of file
@@ -2,19 +2,32 @@
 
 import sqlalchemy as sa
 import sqlalchemy.orm as so
+from sqlalchemy.dialects.postgresql import JSONB, JSONPATH
 from typing import Optional, TYPE_CHECKING, Dict, Any
 from datetime import datetime
 import json
+import re
 from .base import BaseModel
 from app import db
 
 if TYPE_CHECKING:
     from .staff import Staff
 
+# Ключ в пути фильтра по details: только идентификаторы, без синтаксиса jsonpath
+DETAILS_KEY_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
 class AuditLog(BaseModel):
     """Модель аудита действий."""
     
     __tablename__ = 'audit_log'
+    __table_args__ = (
+        # jsonb_path_ops: поиск по вложенным ключам (@>, @?, @@)
+        sa.Index('ix_audit_log_details_gin', 'details',
+                 postgresql_using='gin', postgresql_ops={'details': 'jsonb_path_ops'}),
+        sa.Index('ix_audit_log_details_endpoint', sa.text("(details ->> 'endpoint')")),
+        # Пачки очистки по сроку хранения (audit_retention)
+        sa.Index('ix_audit_log_created_at', 'created_at'),
+    )
     
     # Основные поля
     staff_id: so.Mapped[Optional[int]] = so.mapped_column(
@@ -29,9 +42,9 @@ class AuditLog(BaseModel):
     order_affected: so.Mapped[Optional[int]] = so.mapped_column(
         sa.Integer, nullable=True, index=True
     )
-    details: so.Mapped[Optional[str]] = so.mapped_column(
-        sa.Text, nullable=True
-    )  # JSON данные
+    details: so.Mapped[Optional[Dict[str, Any]]] = so.mapped_column(
+        JSONB, nullable=True
+    )
     ip_address: so.Mapped[Optional[str]] = so.mapped_column(
         sa.String(45), nullable=True
     )  # IPv6 может быть до 45 символов
@@ -46,17 +59,19 @@ class AuditLog(BaseModel):
         return f'<AuditLog {self.action} by {self.staff.name if self.staff else "System"}>'
     
     def get_details(self) -> Dict[str, Any]:
-        """Получение деталей из JSON."""
-        if self.details:
-            try:
-                return json.loads(self.details)
-            except (json.JSONDecodeError, TypeError):
-                return {}
-        return {}
+        """Получение деталей."""
+        return self.details if isinstance(self.details, dict) else {}
     
     def set_details(self, data: Dict[str, Any]) -> None:
-        """Установка деталей в JSON."""
-        self.details = json.dumps(data, ensure_ascii=False, default=str)
+        """Установка деталей."""
+        self.details = self.normalize_details(data)
+    
+    @staticmethod
+    def normalize_details(data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Приведение деталей к JSON-совместимому виду (даты, Decimal -> строки)."""
+        if data is None:
+            return None
+        return json.loads(json.dumps(data, ensure_ascii=False, default=str))
     
     def to_dict(self) -> Dict[str, Any]:
         """Сериализация в словарь."""
@@ -91,18 +106,94 @@ class AuditLog(BaseModel):
         if details:
             log_entry.set_details(details)
         
+        from flask import current_app
         try:
             db.session.add(log_entry)
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             # Логируем в обычный лог если не можем записать в аудит
-            from flask import current_app
             current_app.logger.error(f"Failed to log audit action '{action}': {e}")
             raise
         
+        # Агрегаты - отдельной транзакцией: их ошибка не откатывает запись аудита
+        try:
+            from .audit_stat import AuditStatHourly
+            AuditStatHourly.add_rows([{'action': action, 'staff_id': staff_id}])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Failed to update audit hourly stats for '{action}': {e}")
+        
         return log_entry
     
+    @classmethod
+    def details_filter(cls, path: str, value: Any):
+        """
+        Условие "details.<path> == value", выполняемое в SQL по индексу GIN.
+        
+        Args:
+            path: Путь через точку, например ``json_data.order_id``
+            value: Значение; строка "1234" совпадает и с числом 1234
+        """
+        keys = path.split('.')
+        if not all(DETAILS_KEY_RE.match(key) for key in keys):
+            raise ValueError(f"Недопустимый путь в details: {path}")
+        
+        candidates = [value]
+        if isinstance(value, str):
+            try:
+                parsed = json.loads(value)
+                if not isinstance(parsed, (dict, list, str)):
+                    candidates.append(parsed)
+            except ValueError:
+                pass
+        else:
+            candidates.append(str(value))
+        
+        # Ключи в кавычках, значения - JSON-литералы: пользовательский ввод не меняет запрос
+        accessor = '$' + ''.join(f'."{key}"' for key in keys)
+        condition = ' || '.join(f'@ == {json.dumps(candidate)}' for candidate in candidates)
+        return cls.details.bool_op('@?')(sa.cast(f'{accessor} ? ({condition})', JSONPATH))
+    
+    @classmethod
+    def details_jsonpath(cls, predicate: str):
+        """Произвольный предикат jsonpath по details (оператор @@), например ``$.response_status >= 500``."""
+        return cls.details.bool_op('@@')(sa.cast(predicate, JSONPATH))
+    
+    @classmethod
+    def search(cls, staff_id: Optional[int] = None, action: Optional[str] = None,
+               table_id: Optional[int] = None, order_id: Optional[int] = None,
+               ip_address: Optional[str] = None, date_from: Optional[datetime] = None,
+               date_to: Optional[datetime] = None, details: Optional[Dict[str, Any]] = None,
+               details_path: Optional[str] = None):
+        """
+        Запрос логов с фильтрами; все условия, включая фильтры по details, выполняются в SQL.
+        
+        Returns:
+            Query: Запрос, упорядоченный от новых к старым
+        """
+        query = cls.query
+        if staff_id:
+            query = query.filter(cls.staff_id == staff_id)
+        if action:
+            query = query.filter(cls.action.contains(action))
+        if table_id:
+            query = query.filter(cls.table_affected == table_id)
+        if order_id:
+            query = query.filter(cls.order_affected == order_id)
+        if ip_address:
+            query = query.filter(cls.ip_address == ip_address)
+        if date_from:
+            query = query.filter(cls.created_at >= date_from)
+        if date_to:
+            query = query.filter(cls.created_at <= date_to)
+        for path, value in (details or {}).items():
+            query = query.filter(cls.details_filter(path, value))
+        if details_path:
+            query = query.filter(cls.details_jsonpath(details_path))
+        return query.order_by(cls.created_at.desc())
+    
     @classmethod
     def get_by_staff(cls, staff_id: int, limit: int = 100) -> list['AuditLog']:
         """Получение логов по сотруднику."""
@@ -155,43 +246,20 @@ class AuditLog(BaseModel):
     
     @classmethod
     def get_statistics(cls, days: int = 7) -> Dict[str, Any]:
-        """Получение статистики по аудиту за указанное количество дней."""
-        from datetime import datetime, timedelta
-        from sqlalchemy import func
-        
-        since = datetime.utcnow() - timedelta(days=days)
-        
-        # Общее количество действий
-        total_actions = cls.query.filter(cls.created_at >= since).count()
-        
-        # Топ действий
-        top_actions = db.session.query(
-            cls.action, 
-            func.count(cls.id).label('count')
-        ).filter(
-            cls.created_at >= since
-        ).group_by(cls.action).order_by(func.count(cls.id).desc()).limit(10).all()
-        
-        # Топ пользователей
-        top_users = db.session.query(
-            cls.staff_id,
-            func.count(cls.id).label('count')
-        ).filter(
-            cls.created_at >= since,
-            cls.staff_id.isnot(None)
-        ).group_by(cls.staff_id).order_by(func.count(cls.id).desc()).limit(10).all()
+        """Получение статистики по аудиту за указанное количество дней (из почасовых агрегатов)."""
+        from .audit_stat import AuditStatHourly
         
-        # Количество ошибок
-        error_count = cls.query.filter(
-            cls.created_at >= since,
-            cls.action.like('%_error')
-        ).count()
+        totals = AuditStatHourly.totals(days)
+        total_actions = totals['total']
+        error_count = totals['errors']
         
         return {
             'period_days': days,
             'total_actions': total_actions,
             'error_count': error_count,
             'error_percentage': round((error_count / total_actions * 100) if total_actions > 0 else 0, 2),
-            'top_actions': [{'action': action, 'count': count} for action, count in top_actions],
-            'top_users': [{'staff_id': staff_id, 'count': count} for staff_id, count in top_users]
-        } 
\ No newline at end of file
+            'top_actions': [{'action': action, 'count': count}
+                            for action, count in AuditStatHourly.top_actions(days)],
+            'top_users': [{'staff_id': staff_id, 'count': count}
+                          for staff_id, count in AuditStatHourly.top_staff(days)]
+        } 
@@ -0,0 +1,172 @@
+"""Почасовые агрегаты аудита."""
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, Iterable
+from app import db
+
+ERROR_SUFFIX = '_error'
+
+
+class AuditStatHourly(db.Model):
+    """Количество записей аудита за час по действию и сотруднику.
+
+    Пополняется при записи каждой пачки аудита (``AuditWriter``), поэтому
+    статистика читает несколько сотен строк агрегатов вместо сканирования
+    ``audit_log`` за весь период. Агрегаты пишутся отдельной транзакцией
+    после самих записей: их ошибка не теряет аудит, а пропущенное
+    пересчитывает ``flask audit rollup``. Агрегаты старше самого длинного срока
+    хранения ``audit_log`` удаляет очистка аудита (``prune``).
+    """
+
+    __tablename__ = 'audit_stats_hourly'
+    __table_args__ = (
+        # staff_id может быть NULL (гость, система) - в ключе вместо него staff_key = 0
+        sa.UniqueConstraint('hour', 'action', 'staff_key', name='uq_audit_stats_hourly_key'),
+    )
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    hour: so.Mapped[datetime] = so.mapped_column(
+        sa.DateTime(timezone=True), nullable=False, index=True
+    )
+    action: so.Mapped[str] = so.mapped_column(
+        sa.String(100), nullable=False
+    )
+    staff_id: so.Mapped[Optional[int]] = so.mapped_column(
+        sa.Integer, nullable=True
+    )  # Без внешнего ключа: агрегаты переживают удаление сотрудника
+    staff_key: so.Mapped[int] = so.mapped_column(
+        sa.Integer, default=0, nullable=False
+    )  # staff_id или 0 - часть уникального ключа (NULL в ключе не совпадает сам с собой)
+    is_error: so.Mapped[bool] = so.mapped_column(
+        sa.Boolean, default=False, nullable=False
+    )
+    count: so.Mapped[int] = so.mapped_column(
+        sa.Integer, default=0, nullable=False
+    )
+
+    def __repr__(self) -> str:
+        """Строковое представление."""
+        return f'<AuditStatHourly {self.hour:%Y-%m-%d %H}:00 {self.action} x{self.count}>'
+
+    @staticmethod
+    def truncate_hour(moment: datetime) -> datetime:
+        """Начало часа в UTC."""
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def add_rows(cls, rows: Iterable[Dict[str, Any]]) -> None:
+        """
+        Учет записей аудита в агрегатах (в текущей транзакции, без commit).
+
+        Args:
+            rows: Записи с ключами action, staff_id и created_at
+        """
+        counts = Counter(
+            (cls.truncate_hour(row.get('created_at') or datetime.now(timezone.utc)), row['action'], row.get('staff_id'))
+            for row in rows
+        )
+        if not counts:
+            return
+
+        values = [
+            {
+                'hour': hour,
+                'action': action,
+                'staff_id': staff_id,
+                'staff_key': staff_id or 0,
+                'is_error': action.endswith(ERROR_SUFFIX),
+                'count': count,
+            }
+            for (hour, action, staff_id), count in counts.items()
+        ]
+        # ON CONFLICT есть в PostgreSQL и SQLite (тесты), но конструкторы у диалектов свои
+        insert = sqlite_insert if db.session.get_bind().dialect.name == 'sqlite' else pg_insert
+        stmt = insert(cls).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.hour, cls.action, cls.staff_key],
+            set_={'count': cls.count + stmt.excluded.count}
+        )
+        db.session.execute(stmt)
+
+    @classmethod
+    def rebuild(cls, since: datetime) -> int:
+        """
+        Пересчет агрегатов из audit_log начиная с часа ``since`` (без commit).
+
+        Returns:
+            int: Количество строк агрегатов
+        """
+        from .audit_log import AuditLog
+
+        since = cls.truncate_hour(since)
+        # Час в UTC независимо от часового пояса сессии - как в truncate_hour
+        hour = sa.func.timezone('UTC', sa.func.date_trunc('hour', sa.func.timezone('UTC', AuditLog.created_at)))
+
+        db.session.execute(sa.delete(cls).where(cls.hour >= since))
+        source = sa.select(
+            hour,
+            AuditLog.action,
+            AuditLog.staff_id,
+            sa.func.coalesce(AuditLog.staff_id, 0),
+            AuditLog.action.like('%' + ERROR_SUFFIX.replace('_', r'\_'), escape='\\'),
+            sa.func.count(),
+        ).where(
+            AuditLog.created_at >= since
+        ).group_by(hour, AuditLog.action, AuditLog.staff_id)
+
+        result = db.session.execute(
+            sa.insert(cls).from_select(['hour', 'action', 'staff_id', 'staff_key', 'is_error', 'count'], source)
+        )
+        return result.rowcount or 0
+
+    @classmethod
+    def prune(cls, before: datetime) -> int:
+        """
+        Удаление агрегатов за часы до ``before`` (без commit).
+
+        Returns:
+            int: Количество удаленных строк
+        """
+        result = db.session.execute(sa.delete(cls).where(cls.hour < cls.truncate_hour(before)))
+        return result.rowcount or 0
+
+    @classmethod
+    def window(cls, days: int):
+        """Условие по часам за последние ``days`` дней (с точностью до часа)."""
+        since = cls.truncate_hour(datetime.now(timezone.utc) - timedelta(days=days))
+        return cls.hour >= since
+
+    @classmethod
+    def totals(cls, days: int) -> Dict[str, int]:
+        """Всего действий и ошибок за период."""
+        total, errors = db.session.query(
+            sa.func.coalesce(sa.func.sum(cls.count), 0),
+            sa.func.coalesce(sa.func.sum(cls.count).filter(cls.is_error), 0),
+        ).filter(cls.window(days)).one()
+        return {'total': int(total), 'errors': int(errors)}
+
+    @classmethod
+    def top_actions(cls, days: int, limit: int = 10) -> list[tuple[str, int]]:
+        """Самые частые действия за период."""
+        total = sa.func.sum(cls.count)
+        rows = db.session.query(cls.action, total).filter(
+            cls.window(days)
+        ).group_by(cls.action).order_by(total.desc()).limit(limit).all()
+        return [(action, int(count)) for action, count in rows]
+
+    @classmethod
+    def top_staff(cls, days: int, limit: int = 10) -> list[tuple[int, int]]:
+        """Самые активные сотрудники за период."""
+        total = sa.func.sum(cls.count)
+        rows = db.session.query(cls.staff_id, total).filter(
+            cls.window(days),
+            cls.staff_id.isnot(None)
+        ).group_by(cls.staff_id).order_by(total.desc()).limit(limit).all()
+        return [(staff_id, int(count)) for staff_id, count in rows]
@@ -11,38 +11,65 @@ from .base import BaseModel
 if TYPE_CHECKING:
     from .order import Order
 
+def _legacy_decrypt(value: bytes, field_name: str) -> Optional[str]:
+    """Расшифровка старого значения pgcrypto (до миграции на шифрование в приложении)."""
+    try:
+        return db.session.scalar(
+            sa.func.pgp_sym_decrypt(
+                sa.cast(value, sa.LargeBinary),
+                current_app.config['ENCRYPTION_KEY']
+            )
+        )
+    except Exception as e:
+        current_app.logger.error(f"Error decrypting legacy {field_name}: {e}")
+        return None
+
 def encrypted_property(field_name):
-    """Декоратор для создания зашифрованных свойств."""
+    """Декоратор для создания зашифрованных свойств (AES-GCM в процессе, см. field_encryption)."""
     def getter(self):
+        from app.utils.field_encryption import FieldEncryptionError, field_encryption, is_encrypted
+        value = getattr(self, f'_{field_name}')
+        if value is None:
+            return None
+        if not is_encrypted(value):
+            return _legacy_decrypt(value, field_name)
         try:
-            return db.session.scalar(
-                sa.func.pgp_sym_decrypt(
-                    sa.cast(getattr(self, f'_{field_name}'), sa.LargeBinary),
-                    current_app.config['ENCRYPTION_KEY']
-                )
-            )
-        except Exception as e:
+            return field_encryption.decrypt(value, f'{self.__tablename__}.{field_name}')
+        except FieldEncryptionError as e:
             current_app.logger.error(f"Error decrypting {field_name}: {e}")
             return None
     
     def setter(self, value):
-        if value:
-            try:
-                encrypted_value = db.session.scalar(
-                    sa.func.pgp_sym_encrypt(
-                        value,
-                        current_app.config['ENCRYPTION_KEY']
-                    )
-                )
-                setattr(self, f'_{field_name}', encrypted_value)
-            except Exception as e:
-                current_app.logger.error(f"Error encrypting {field_name}: {e}")
-                raise ValueError(f"Failed to encrypt {field_name}")
-        else:
-            setattr(self, f'_{field_name}', None)
+        from app.utils.field_encryption import FieldEncryptionError, field_encryption
+        try:
+            setattr(self, f'_{field_name}', field_encryption.encrypt(value, f'{self.__tablename__}.{field_name}'))
+        except FieldEncryptionError as e:
+            current_app.logger.error(f"Error encrypting {field_name}: {e}")
+            raise ValueError(f"Failed to encrypt {field_name}")
     
     return property(getter, setter)
 
+def card_invalidity_reason(is_active: bool, activated_at: Optional[date], deactivated_at: Optional[date],
+                           today: Optional[date] = None) -> Optional[str]:
+    """Причина невалидности карты на дату (None - карта валидна)."""
+    if not is_active:
+        return "Карта неактивна"
+    
+    today = today or datetime.now().date()
+    
+    # Приводим даты к типу date для корректного сравнения
+    if activated_at:
+        activated_date = activated_at.date() if hasattr(activated_at, 'date') else activated_at
+        if today < activated_date:
+            return f"Карта будет активна с {activated_date.strftime('%d.%m.%Y')}"
+    
+    if deactivated_at:
+        deactivated_date = deactivated_at.date() if hasattr(deactivated_at, 'date') else deactivated_at
+        if today > deactivated_date:
+            return f"Срок действия карты истек {deactivated_date.strftime('%d.%m.%Y')}"
+    
+    return None
+
 class BonusCard(BaseModel):
     """Модель бонусной карты."""
     
@@ -90,6 +117,7 @@ class BonusCard(BaseModel):
     )
     
     # Зашифрованные свойства
+    ENCRYPTED_FIELDS = ('first_name', 'last_name')
     first_name = encrypted_property('first_name')
     last_name = encrypted_property('last_name')
     
@@ -98,54 +126,29 @@ class BonusCard(BaseModel):
         return f'<BonusCard {self.card_number}>'
     
     def is_valid(self) -> bool:
-        """Проверка валидности карты с автоматической деактивацией."""
-        if not self.is_active:
-            return False
-        
-        today = datetime.now().date()
-        
-        # Приводим даты к типу date для корректного сравнения
-        if self.activated_at:
-            activated_date = self.activated_at.date() if hasattr(self.activated_at, 'date') else self.activated_at
-            if today < activated_date:
-                return False
-        
-        if self.deactivated_at:
-            deactivated_date = self.deactivated_at.date() if hasattr(self.deactivated_at, 'date') else self.deactivated_at
-            if today > deactivated_date:
-                # Автоматически деактивируем карту при истечении срока
-                if self.is_active:
-                    self.is_active = False
-                    try:
-                        from app import db
-                        db.session.commit()
-                        from flask import current_app
-                        current_app.logger.info(f"Bonus card {self.card_number} automatically deactivated due to expired date")
-                    except Exception as e:
-                        current_app.logger.error(f"Failed to auto-deactivate card {self.card_number}: {e}")
-                        db.session.rollback()
-                return False
-        
-        return True
+        """Проверка валидности карты (без записи: истекшие карты деактивирует ночная задача)."""
+        return card_invalidity_reason(self.is_active, self.activated_at, self.deactivated_at) is None
     
     def get_invalidity_reason(self) -> str:
         """Получение причины невалидности карты."""
-        if not self.is_active:
-            return "Карта неактивна"
-        
+        return card_invalidity_reason(self.is_active, self.activated_at, self.deactivated_at) or "Карта валидна"
+    
+    @classmethod
+    def deactivate_expired(cls) -> int:
+        """Деактивация всех карт с истекшим сроком одним UPDATE; возвращает число карт."""
         today = datetime.now().date()
-        
-        if self.activated_at:
-            activated_date = self.activated_at.date() if hasattr(self.activated_at, 'date') else self.activated_at
-            if today < activated_date:
-                return f"Карта будет активна с {activated_date.strftime('%d.%m.%Y')}"
-        
-        if self.deactivated_at:
-            deactivated_date = self.deactivated_at.date() if hasattr(self.deactivated_at, 'date') else self.deactivated_at
-            if today > deactivated_date:
-                return f"Срок действия карты истек {deactivated_date.strftime('%d.%m.%Y')}"
-        
-        return "Карта валидна"
+        result = db.session.execute(
+            sa.update(cls)
+            .where(cls.is_active.is_(True), cls.deactivated_at < today)
+            .values(is_active=False)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if result.rowcount:
+            # Массовый UPDATE не вызывает событий модели - сбрасываем кэш проверки целиком
+            from app.utils.bonus_card_cache import bonus_card_cache
+            bonus_card_cache.invalidate()
+        return result.rowcount
     
     def to_dict(self, include_sensitive: bool = False) -> Dict[str, Any]:
         """Сериализация в словарь."""
@@ -189,6 +192,47 @@ class BonusCard(BaseModel):
         self.total_used += 1
         self.total_saved = float(self.total_saved) + float(discount_amount)
     
+    @classmethod
+    def decrypt_all(cls, cards: list['BonusCard']) -> None:
+        """Расшифровка зашифрованных полей страницы карт одним проходом (дальше чтения из памяти запроса)."""
+        from app.utils.field_encryption import field_encryption
+        for field_name in cls.ENCRYPTED_FIELDS:
+            field_encryption.decrypt_many(
+                (getattr(card, f'_{field_name}') for card in cards), f'{cls.__tablename__}.{field_name}'
+            )
+    
+    @classmethod
+    def reencrypt_fields(cls, batch_size: int = 500) -> Dict[str, int]:
+        """
+        Перешифровка активным ключом значений, зашифрованных старым ключом или pgcrypto.
+        
+        Карты обходятся пачками по id, каждая пачка - своя транзакция.
+        Значение, которое не удалось расшифровать, не перезаписывается.
+        
+        Returns:
+            Dict: {'reencrypted': перешифровано значений, 'failed': не расшифровано}
+        """
+        from app.utils.field_encryption import field_encryption
+        
+        result = {'reencrypted': 0, 'failed': 0}
+        last_id = 0
+        while True:
+            cards = cls.query.filter(cls.id > last_id).order_by(cls.id).limit(batch_size).all()
+            if not cards:
+                return result
+            for card in cards:
+                for field_name in cls.ENCRYPTED_FIELDS:
+                    if not field_encryption.needs_reencrypt(getattr(card, f'_{field_name}')):
+                        continue
+                    value = getattr(card, field_name)
+                    if value is None:
+                        result['failed'] += 1
+                        continue
+                    setattr(card, field_name, value)
+                    result['reencrypted'] += 1
+            db.session.commit()
+            last_id = cards[-1].id
+    
     @classmethod
     def find_by_card_number(cls, card_number: str) -> Optional['BonusCard']:
         """Поиск карты по номеру."""
@@ -0,0 +1,132 @@
+"""Модель заданий очереди печати."""
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from typing import Optional, TYPE_CHECKING, Dict, Any
+from datetime import datetime
+from .base import BaseModel
+
+if TYPE_CHECKING:
+    from .order import Order
+
+class PrintJob(BaseModel):
+    """Задание печати для фонового обработчика принтера."""
+
+    __tablename__ = 'print_jobs'
+    __table_args__ = (
+        sa.Index('ix_print_jobs_printer_status_id', 'printer', 'status', 'id'),
+    )
+
+    # Основные поля
+    printer: so.Mapped[str] = so.mapped_column(
+        sa.String(20), nullable=False
+    )  # kitchen, bar, receipt
+    job_type: so.Mapped[str] = so.mapped_column(
+        sa.String(20), nullable=False
+    )  # kitchen, bar, final
+    status: so.Mapped[str] = so.mapped_column(
+        sa.String(20), default='queued', nullable=False, index=True
+    )  # queued, printing, done, failed
+    content: so.Mapped[str] = so.mapped_column(
+        sa.Text, nullable=False
+    )
+    payload: so.Mapped[Optional[bytes]] = so.mapped_column(
+        sa.LargeBinary, nullable=True
+    )  # Готовые байты ESC/POS в кодировке принтера
+    order_id: so.Mapped[Optional[int]] = so.mapped_column(
+        sa.Integer, sa.ForeignKey('orders.id'), nullable=True, index=True
+    )
+    waiter_id: so.Mapped[Optional[int]] = so.mapped_column(
+        sa.Integer, sa.ForeignKey('staff.id'), nullable=True
+    )  # Кому отправлять статус задания по WebSocket
+
+    # Повторы
+    attempts: so.Mapped[int] = so.mapped_column(
+        sa.Integer, default=0, nullable=False
+    )
+    max_attempts: so.Mapped[int] = so.mapped_column(
+        sa.Integer, default=5, nullable=False
+    )
+    next_attempt_at: so.Mapped[Optional[datetime]] = so.mapped_column(
+        sa.DateTime(timezone=True), nullable=True
+    )
+    last_error: so.Mapped[Optional[str]] = so.mapped_column(
+        sa.Text, nullable=True
+    )
+    printed_at: so.Mapped[Optional[datetime]] = so.mapped_column(
+        sa.DateTime(timezone=True), nullable=True
+    )
+
+    # Захват задания обработчиком (аренда): другой процесс не возьмет задание,
+    # пока аренда не истекла
+    claimed_at: so.Mapped[Optional[datetime]] = so.mapped_column(
+        sa.DateTime(timezone=True), nullable=True
+    )
+    claimed_by: so.Mapped[Optional[str]] = so.mapped_column(
+        sa.String(100), nullable=True
+    )  # hostname:pid обработчика
+
+    # Отношения
+    order: so.Mapped[Optional["Order"]] = so.relationship(
+        lazy='select'
+    )
+
+    def __repr__(self) -> str:
+        """Строковое представление."""
+        return f'<PrintJob #{self.id} {self.printer} ({self.status})>'
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Сериализация в словарь (без содержимого чека)."""
+        data = super().to_dict()
+        data.update({
+            'printer': self.printer,
+            'job_type': self.job_type,
+            'status': self.status,
+            'order_id': self.order_id,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'printed_at': self.printed_at.isoformat() if self.printed_at else None,
+        })
+        return data
+
+    @classmethod
+    def get_head(cls, printer: str) -> Optional['PrintJob']:
+        """Самое раннее незавершенное задание принтера (строгий порядок печати)."""
+        return cls.query.filter(
+            cls.printer == printer,
+            cls.status.in_(['queued', 'printing'])
+        ).order_by(cls.id).first()
+
+    @classmethod
+    def claim(cls, job_id: int, owner: str, now: datetime, lease_expired_before: datetime) -> bool:
+        """
+        Атомарный захват задания: queued или printing с истекшей арендой -> printing.
+
+        Returns:
+            bool: False, если задание уже захватил другой обработчик
+        """
+        from app import db
+        result = db.session.execute(
+            sa.update(cls)
+            .where(
+                cls.id == job_id,
+                sa.or_(
+                    cls.status == 'queued',
+                    sa.and_(
+                        cls.status == 'printing',
+                        sa.or_(cls.claimed_at.is_(None), cls.claimed_at < lease_expired_before)
+                    )
+                )
+            )
+            .values(status='printing', attempts=cls.attempts + 1, claimed_at=now, claimed_by=owner)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    @classmethod
+    def get_by_order(cls, order_id: int) -> list['PrintJob']:
+        """Задания печати по заказу."""
+        return cls.query.filter_by(order_id=order_id).order_by(cls.id).all()
@@ -4,7 +4,6 @@ import sqlalchemy as sa
 import sqlalchemy.orm as so
 from typing import Optional, TYPE_CHECKING, Dict, Any
 from datetime import datetime
-from argon2 import PasswordHasher
 from flask_login import UserMixin
 from .base import BaseModel
 
@@ -55,19 +54,31 @@ class Staff(BaseModel, UserMixin):
         """Строковое представление."""
         return f'<Staff {self.name} ({self.role})>'
     
+    def get_id(self) -> str:
+        """ID для Flask-Login с номерами поколений отзыва (remember-cookie гаснет при отзыве сессий)."""
+        from app.utils.session_store import session_store
+        return session_store.login_id(self.id, self.role)
+    
     def set_password(self, password: str) -> None:
         """Установка пароля с хешированием."""
-        ph = PasswordHasher()
-        self.password_hash = ph.hash(password)
-    
-    def check_password(self, password: str) -> bool:
-        """Проверка пароля."""
-        try:
-            ph = PasswordHasher()
-            ph.verify(self.password_hash, password)
-            return True
-        except Exception:
-            return False
+        from app.utils.password_hashing import password_hashing
+        self.password_hash = password_hashing.hash(password)
+    
+    def check_password(self, password: str, key: Optional[str] = None) -> bool:
+        """
+        Проверка пароля (в пуле хеширования).
+        
+        Если параметры Argon2 изменились, password_hash заменяется новым -
+        сохранить изменение должен вызывающий код.
+        
+        Raises:
+            PasswordHashingBusy: Пул хеширования занят
+        """
+        from app.utils.password_hashing import password_hashing
+        valid, new_hash = password_hashing.verify(self.password_hash, password, key=key)
+        if valid and new_hash:
+            self.password_hash = new_hash
+        return valid
     
     def has_role(self, role_name: str) -> bool:
         """Проверка наличия роли."""
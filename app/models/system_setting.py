@@ -95,6 +95,7 @@ class SystemSetting(BaseModel):
             ('session_timeout', '120', 'Время сессии в минутах'),
             ('printer_kitchen_type', 'network', 'Тип подключения кухонного принтера (network|serial|disabled)'),
             ('printer_bar_type', 'serial', 'Тип подключения барного принтера'),
+            ('kds_print_tickets', 'true', 'Печатать бумажные чеки кухни/бара вместе с экраном KDS'),
             ('printer_receipt_type', 'serial', 'Тип подключения чекового принтера'),
 
             # Kitchen printer settings
@@ -64,21 +64,11 @@ class Table(BaseModel):
     def get_current_order(self) -> Optional["Order"]:
         """Получение текущего заказа для стола."""
         from .order import Order
-        from flask import current_app
         
-        # Логируем поиск заказов для отладки
-        if current_app:
-            current_app.logger.info(f"Searching for active orders on table {self.table_number} (ID: {self.id})")
-            
-        orders = Order.query.filter(
+        return Order.query.filter(
             Order.table_id == self.id,
             Order.status.in_(['pending', 'confirmed'])
-        ).all()
-        
-        if current_app:
-            current_app.logger.info(f"Found {len(orders)} orders for table {self.table_number}: {[o.id for o in orders]}")
-            
-        return orders[0] if orders else None
+        ).first()
     
     def get_assigned_waiter(self) -> Optional["Staff"]:
         """Получение назначенного официанта."""
@@ -0,0 +1,292 @@
+"""Единый ограничитель частоты запросов (GCRA).
+
+Для каждого ключа хранится одно число - теоретическое время прибытия
+следующего запроса (TAT, алгоритм GCRA). Память на ключ постоянна, без
+списков меток времени; запись сама устаревает, когда TAT уходит в прошлое.
+Хранилище общее для всех воркеров gunicorn:
+
+- ``redis://...`` - атомарный Lua-скрипт, ключи с TTL;
+- ``sqlite:///path`` - файл для установки на одной машине без Redis;
+- ``memory://`` - память процесса, LRU на ``RATE_LIMIT_MAX_KEYS`` ключей.
+
+Ограничитель используется и ``SecurityMiddleware``, и декоратором
+``@limiter.limit("100 per hour")`` в API (замена Flask-Limiter).
+"""
+
+import functools
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from flask import Flask, abort, current_app, g, request
+
+from app.request_pipeline import request_pipeline
+
+UNITS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+}
+
+LIMIT_RE = re.compile(r'^\s*(\d+)\s*(?:per|/)\s*(\d+)?\s*(second|minute|hour|day)s?\s*$', re.IGNORECASE)
+
+
+class RateLimit:
+    """Лимит "count запросов за period секунд"."""
+
+    __slots__ = ('count', 'period', 'text')
+
+    def __init__(self, count: int, period: float, text: str = ''):
+        self.count = count
+        self.period = period
+        self.text = text or f'{count} per {period}s'
+
+    @property
+    def interval(self) -> float:
+        """Интервал эмиссии GCRA: сколько "стоит" один запрос."""
+        return self.period / self.count
+
+    @classmethod
+    def parse(cls, text: str) -> 'RateLimit':
+        """Разбор строки вида "100 per minute", "5 per 15 minutes", "1000/hour"."""
+        match = LIMIT_RE.match(text)
+        if not match:
+            raise ValueError(f"Неверный формат лимита: {text}")
+        count, multiplier, unit = match.groups()
+        return cls(int(count), int(multiplier or 1) * UNITS[unit.lower()], text.strip())
+
+
+def gcra(tat: Optional[float], now: float, limit: RateLimit) -> Tuple[bool, float, float]:
+    """
+    Шаг GCRA.
+
+    Returns:
+        (allowed, new_tat, retry_after): при отказе TAT не меняется
+    """
+    tat = max(tat or now, now)
+    new_tat = tat + limit.interval
+    if new_tat - now > limit.period:
+        return False, tat, new_tat - limit.period - now
+    return True, new_tat, 0.0
+
+
+class MemoryBackend:
+    """TAT в памяти процесса с вытеснением давно не использованных ключей."""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._tats: 'OrderedDict[str, float]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: RateLimit, now: float) -> Tuple[bool, float]:
+        with self._lock:
+            allowed, new_tat, retry_after = gcra(self._tats.get(key), now, limit)
+            self._tats[key] = new_tat
+            self._tats.move_to_end(key)
+            while len(self._tats) > self.max_keys:
+                self._tats.popitem(last=False)
+            return allowed, retry_after
+
+    def reset(self, key: Optional[str] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._tats.clear()
+            else:
+                self._tats.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+
+class RedisBackend:
+    """TAT в Redis; шаг GCRA выполняется атомарно Lua-скриптом."""
+
+    SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local interval = tonumber(ARGV[2])
+    local period = tonumber(ARGV[3])
+    local tat = tonumber(redis.call('GET', KEYS[1]) or ARGV[1])
+    if tat < now then tat = now end
+    local new_tat = tat + interval
+    if new_tat - now > period then
+        return {0, tostring(new_tat - period - now)}
+    end
+    redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+    return {1, '0'}
+    """
+
+    def __init__(self, url: str, prefix: str = 'ratelimit'):
+        import redis
+        self.client = redis.from_url(url)
+        self.client.ping()
+        self.prefix = prefix
+        self._script = self.client.register_script(self.SCRIPT)
+
+    def hit(self, key: str, limit: RateLimit, now: float) -> Tuple[bool, float]:
+        allowed, retry_after = self._script(
+            keys=[f'{self.prefix}:{key}'],
+            args=[repr(now), repr(limit.interval), repr(limit.period)]
+        )
+        return bool(int(allowed)), float(retry_after)
+
+    def reset(self, key: Optional[str] = None) -> None:
+        if key is not None:
+            self.client.delete(f'{self.prefix}:{key}')
+            return
+        for redis_key in self.client.scan_iter(f'{self.prefix}:*'):
+            self.client.delete(redis_key)
+
+
+class SQLiteBackend:
+    """TAT в файле SQLite (WAL) - общий для воркеров одной машины."""
+
+    SWEEP_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._hits = 0
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS rate_limit (key TEXT PRIMARY KEY, tat REAL NOT NULL)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key: str, limit: RateLimit, now: float) -> Tuple[bool, float]:
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tat FROM rate_limit WHERE key = ?', (key,)).fetchone()
+            allowed, new_tat, retry_after = gcra(row[0] if row else None, now, limit)
+            if allowed:
+                conn.execute('INSERT INTO rate_limit (key, tat) VALUES (?, ?) '
+                             'ON CONFLICT(key) DO UPDATE SET tat = excluded.tat', (key, new_tat))
+            self._hits += 1
+            if self._hits % self.SWEEP_EVERY == 0:
+                # Устаревшие ключи эквивалентны отсутствующим
+                conn.execute('DELETE FROM rate_limit WHERE tat < ?', (now,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, retry_after
+
+    def reset(self, key: Optional[str] = None) -> None:
+        conn = self._connect()
+        if key is None:
+            conn.execute('DELETE FROM rate_limit')
+        else:
+            conn.execute('DELETE FROM rate_limit WHERE key = ?', (key,))
+
+
+class RateLimiter:
+    """Ограничитель частоты запросов с общим хранилищем."""
+
+    def __init__(self, key_func: Optional[Callable[[], str]] = None,
+                 default_limits: Optional[List[str]] = None):
+        self.key_func = key_func or (lambda: request.remote_addr or 'unknown')
+        self.default_limits = [RateLimit.parse(text) for text in (default_limits or [])]
+        self.enabled = True
+        self.backend = MemoryBackend()
+        self._fallback = MemoryBackend()
+
+    def init_app(self, app: Flask) -> None:
+        """Выбор хранилища и подключение лимитов по умолчанию."""
+        self.enabled = app.config.get('RATELIMIT_ENABLED', True)
+        if not self.default_limits and app.config.get('RATELIMIT_DEFAULT'):
+            self.default_limits = [RateLimit.parse(text) for text in app.config['RATELIMIT_DEFAULT'].split(';')]
+
+        max_keys = int(app.config.get('RATE_LIMIT_MAX_KEYS', 10000))
+        self._fallback = MemoryBackend(max_keys)
+        self.backend = self._create_backend(app, app.config.get('RATELIMIT_STORAGE_URL') or 'memory://', max_keys)
+
+        # Лимиты по умолчанию - первой стадией конвейера; Retry-After нужен и легким запросам
+        request_pipeline.add_stage('rate_limit', before=self._check_request, order=10)
+        request_pipeline.add_stage('rate_limit_headers', after=self._add_headers, order=10, light=True)
+
+    def _create_backend(self, app: Flask, url: str, max_keys: int):
+        try:
+            if url.startswith('redis'):
+                backend = RedisBackend(url)
+            elif url.startswith('sqlite:///'):
+                path = url[len('sqlite:///'):] or os.path.join(app.instance_path, 'ratelimit.sqlite3')
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                backend = SQLiteBackend(path)
+            else:
+                return MemoryBackend(max_keys)
+            app.logger.info(f"Хранилище лимитов запросов: {url.split('://')[0]}")
+            return backend
+        except Exception as e:
+            app.logger.warning(f"Хранилище лимитов {url.split('://')[0]} недоступно, используется память процесса: {e}")
+            return MemoryBackend(max_keys)
+
+    def hit(self, scope: str, key: str, limit: RateLimit) -> Tuple[bool, float]:
+        """
+        Учет запроса по ключу.
+
+        Returns:
+            (allowed, retry_after): retry_after - через сколько секунд повторить
+        """
+        now = time.time()
+        full_key = f'{scope}:{limit.count}/{limit.period}:{key}'
+        try:
+            return self.backend.hit(full_key, limit, now)
+        except Exception as e:
+            # Хранилище недоступно - считаем в памяти процесса, а не отказываем всем
+            current_app.logger.warning(f"Rate limit storage error: {e}")
+            return self._fallback.hit(full_key, limit, now)
+
+    def check(self, scope: str, key: str, limits: List[RateLimit]) -> bool:
+        """Проверка всех лимитов; при отказе запоминает Retry-After для ответа."""
+        for limit in limits:
+            allowed, retry_after = self.hit(scope, key, limit)
+            if not allowed:
+                g.rate_limit_retry_after = max(getattr(g, 'rate_limit_retry_after', 0), retry_after)
+                return False
+        return True
+
+    def limit(self, limit_text: str):
+        """Декоратор лимита на endpoint; заменяет лимиты по умолчанию для него."""
+        limits = [RateLimit.parse(text) for text in limit_text.split(';')]
+
+        def decorator(f):
+            endpoint_key = f'{f.__module__}.{f.__qualname__}'
+
+            @functools.wraps(f)
+            def decorated_function(*args, **kwargs):
+                if self.enabled and not self.check(endpoint_key, self.key_func(), limits):
+                    current_app.logger.warning(f"Rate limit {limit_text} exceeded for {self.key_func()} on {request.endpoint}")
+                    abort(429)
+                return f(*args, **kwargs)
+
+            decorated_function._rate_limited = True
+            return decorated_function
+        return decorator
+
+    def _check_request(self, ctx):
+        if not self.enabled or not self.default_limits or ctx.endpoint is None:
+            return
+        view = current_app.view_functions.get(ctx.endpoint)
+        if getattr(view, '_rate_limited', False):
+            return  # У endpoint свой лимит
+        if not self.check('default', self.key_func(), self.default_limits):
+            current_app.logger.warning(f"Default rate limit exceeded for {self.key_func()}")
+            abort(429)
+
+    def _add_headers(self, ctx, response):
+        retry_after = getattr(g, 'rate_limit_retry_after', None)
+        if response.status_code == 429 and retry_after is not None:
+            response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
@@ -0,0 +1,247 @@
+"""Единый конвейер обработки запроса.
+
+Лимиты, проверки безопасности, сессия, аудит и журнал запросов подключены
+не отдельными before_request/after_request, а стадиями одного конвейера с
+явным порядком. Контекст запроса (id, время начала, IP, endpoint,
+User-Agent) снимается один раз и передается каждой стадии; он же доступен
+как ``g.pipeline``. Время каждой стадии копится в счетчиках процесса
+(``stats()``, отдается в /api/system/stats).
+
+Статика, favicon и health-check - "легкие" запросы: для них выполняются
+только стадии с ``light=True`` (заголовки ответа), остальные пропускаются
+одной проверкой флага.
+"""
+
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import Flask, current_app, g, request
+from werkzeug.exceptions import HTTPException
+
+# Endpoint'ы, для которых выполняются только легкие стадии
+DEFAULT_LIGHT_ENDPOINTS = ('static', 'favicon', 'system_api.health_check')
+
+
+@dataclass
+class RequestContext:
+    """Данные запроса, снятые один раз в начале конвейера."""
+
+    request_id: str
+    started: float  # time.perf_counter()
+    started_at: float  # time.time()
+    method: str
+    path: str
+    endpoint: Optional[str]
+    remote_addr: Optional[str]
+    user_agent: str
+    is_api: bool
+    light: bool
+    overhead: float = 0.0  # Суммарное время стадий, сек
+
+    @property
+    def elapsed(self) -> float:
+        """Секунд с начала обработки запроса."""
+        return time.perf_counter() - self.started
+
+
+@dataclass
+class Stage:
+    """Стадия конвейера: функции до и/или после обработчика запроса."""
+
+    name: str
+    order: int
+    before: Optional[Callable[[RequestContext], Any]] = None
+    after: Optional[Callable[[RequestContext, Any], Any]] = None
+    light: bool = False  # Выполнять и для легких запросов
+
+
+class _Counter:
+    __slots__ = ('calls', 'errors', 'total', 'max')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+@dataclass
+class _Stats:
+    requests: int = 0
+    light_requests: int = 0
+    counters: Dict[str, _Counter] = field(default_factory=dict)
+
+
+class RequestPipeline:
+    """Упорядоченные стадии обработки запроса со счетчиками времени."""
+
+    def __init__(self):
+        self.stages: List[Stage] = []
+        self.light_endpoints = frozenset(DEFAULT_LIGHT_ENDPOINTS)
+        self.slow_request_seconds = 1.0
+        self.log_requests = True
+        self._before_stages: List[Stage] = []
+        self._after_stages: List[Stage] = []
+        self._stats = _Stats()
+        self._lock = threading.Lock()
+
+    def init_app(self, app: Flask) -> None:
+        """Подключение конвейера; вызывается до остальных расширений с хуками."""
+        self.light_endpoints = frozenset(
+            app.config.get('REQUEST_PIPELINE_LIGHT_ENDPOINTS') or DEFAULT_LIGHT_ENDPOINTS
+        )
+        self.slow_request_seconds = float(app.config.get('REQUEST_PIPELINE_SLOW_SECONDS', 1.0))
+        self.log_requests = app.config.get('REQUEST_PIPELINE_LOG_REQUESTS', True)
+
+        if 'request_pipeline' not in app.extensions:
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+            app.extensions['request_pipeline'] = self
+
+    def add_stage(self, name: str, before: Optional[Callable] = None, after: Optional[Callable] = None,
+                  order: int = 100, light: bool = False) -> None:
+        """
+        Регистрация стадии (повторная регистрация с тем же именем заменяет ее).
+
+        Args:
+            name: Имя стадии в счетчиках
+            before: f(ctx) до обработчика; вернувшийся не-None ответ прерывает запрос
+            after: f(ctx, response) -> response после обработчика, в обратном порядке
+            order: Порядок выполнения (меньше - раньше)
+            light: Выполнять и для статики/health-check
+        """
+        self.stages = [stage for stage in self.stages if stage.name != name]
+        self.stages.append(Stage(name, order, before, after, light))
+        self.stages.sort(key=lambda stage: stage.order)
+        self._before_stages = [stage for stage in self.stages if stage.before]
+        self._after_stages = [stage for stage in reversed(self.stages) if stage.after]
+
+    def context(self) -> Optional[RequestContext]:
+        """Контекст текущего запроса (None вне конвейера)."""
+        return g.get('pipeline')
+
+    def _capture(self) -> RequestContext:
+        endpoint = request.endpoint
+        path = request.path
+        light = endpoint is not None and (endpoint in self.light_endpoints or endpoint.endswith('.static'))
+        return RequestContext(
+            request_id=str(uuid.uuid4()),
+            started=time.perf_counter(),
+            started_at=time.time(),
+            method=request.method,
+            path=path,
+            endpoint=endpoint,
+            remote_addr=request.remote_addr,
+            user_agent=request.headers.get('User-Agent', ''),
+            is_api=path.startswith('/api/') or path.startswith('/client/api/'),
+            light=light,
+        )
+
+    def _record(self, key: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            counter = self._stats.counters.get(key)
+            if counter is None:
+                counter = self._stats.counters[key] = _Counter()
+            counter.calls += 1
+            counter.total += seconds
+            if seconds > counter.max:
+                counter.max = seconds
+            if error:
+                counter.errors += 1
+
+    def _before_request(self):
+        ctx = self._capture()
+        g.pipeline = ctx
+        g.request_id = ctx.request_id
+        ctx.overhead = time.perf_counter() - ctx.started
+
+        for stage in self._before_stages:
+            if ctx.light and not stage.light:
+                continue
+            started = time.perf_counter()
+            error = False
+            try:
+                result = stage.before(ctx)
+            except HTTPException:
+                # abort() из стадии - штатный отказ (403, 429...), отдаем как есть
+                raise
+            except Exception as e:
+                # Сбой стадии не должен ронять запрос
+                error = True
+                result = None
+                current_app.logger.error(f"Request pipeline stage '{stage.name}' failed: {e}", exc_info=True)
+            finally:
+                duration = time.perf_counter() - started
+                ctx.overhead += duration
+                self._record(f'{stage.name}.before', duration, error)
+            if result is not None:
+                return result
+        return None
+
+    def _after_request(self, response):
+        ctx = g.get('pipeline')
+        if ctx is None:
+            # before_request не дошел до конвейера (ошибка в более раннем хуке)
+            return response
+
+        for stage in self._after_stages:
+            if ctx.light and not stage.light:
+                continue
+            started = time.perf_counter()
+            error = False
+            try:
+                response = stage.after(ctx, response)
+            except Exception as e:
+                error = True
+                current_app.logger.error(f"Request pipeline stage '{stage.name}' failed: {e}", exc_info=True)
+            finally:
+                duration = time.perf_counter() - started
+                ctx.overhead += duration
+                self._record(f'{stage.name}.after', duration, error)
+
+        with self._lock:
+            self._stats.requests += 1
+            if ctx.light:
+                self._stats.light_requests += 1
+        self._record('pipeline', ctx.overhead)
+
+        duration = ctx.elapsed
+        if duration > self.slow_request_seconds:
+            current_app.logger.warning("Slow request: %.2fs for %s %s", duration, ctx.method, ctx.path)
+        elif self.log_requests and not ctx.light:
+            current_app.logger.info(
+                "Request completed: %s %s %s (%.4fs)", ctx.method, ctx.path, response.status_code, duration
+            )
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики процесса: вызовы, ошибки, среднее и максимум по стадиям, мс."""
+        with self._lock:
+            stages = {
+                key: {
+                    'calls': counter.calls,
+                    'errors': counter.errors,
+                    'total_ms': round(counter.total * 1000, 3),
+                    'avg_ms': round(counter.total * 1000 / counter.calls, 4) if counter.calls else 0.0,
+                    'max_ms': round(counter.max * 1000, 3),
+                }
+                for key, counter in self._stats.counters.items()
+            }
+            return {
+                'requests': self._stats.requests,
+                'light_requests': self._stats.light_requests,
+                'order': [stage.name for stage in self.stages],
+                'stages': stages,
+            }
+
+    def reset_stats(self) -> None:
+        """Обнуление счетчиков."""
+        with self._lock:
+            self._stats = _Stats()
+
+
+# Глобальный экземпляр
+request_pipeline = RequestPipeline()
@@ -11,6 +11,11 @@ class ClientWebSocket {
         this.reconnectDelay = 3000;
         this.isConnected = false;
         
+        // Последний полученный номер события (для досылки после переподключения)
+        this.lastSeq = null;
+        // Эпоха нумерации: номера из разных эпох несравнимы
+        this.epoch = null;
+        
         console.log('🔌 Инициализация ClientWebSocket');
         this.init();
     }
@@ -27,7 +32,7 @@ class ClientWebSocket {
                 this.reconnectAttempts = 0;
                 
                 // Присоединяемся к комнате клиентов
-                this.socket.emit('join_client_room');
+                this.socket.emit('join_client_room', { last_seq: this.lastSeq, epoch: this.epoch });
             });
             
             this.socket.on('disconnect', () => {
@@ -44,12 +49,23 @@ class ClientWebSocket {
             
             // Основной слушатель обновлений контента
             this.socket.on('content_updated', (data) => {
+                if (typeof data.seq === 'number') {
+                    // Повторно досланные события пропускаем (в пределах одной эпохи)
+                    const sameEpoch = !data.epoch || data.epoch === this.epoch;
+                    if (sameEpoch && this.lastSeq !== null && data.seq <= this.lastSeq && data.action !== 'resync') return;
+                    this.lastSeq = data.seq;
+                    if (data.epoch) this.epoch = data.epoch;
+                }
                 this.handleContentUpdate(data);
             });
             
             // Подтверждение присоединения к комнате
             this.socket.on('joined_client_room', (data) => {
                 console.log('🏠 Присоединились к клиентской комнате:', data.message);
+                if (this.lastSeq === null && typeof data.seq === 'number') {
+                    this.lastSeq = data.seq;
+                    this.epoch = data.epoch || null;
+                }
             });
             
         } catch (error) {
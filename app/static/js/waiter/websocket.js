@@ -15,6 +15,11 @@ class WaiterWebSocket {
         this.lastOrderId = null;
         this.lastCallId = null;
         
+        // Последние полученные номера событий по комнатам (для досылки после переподключения)
+        this.lastSeq = {};
+        // Эпохи нумерации по комнатам: номера из разных эпох несравнимы
+        this.epoch = {};
+        
         this.init();
     }
     
@@ -55,19 +60,42 @@ class WaiterWebSocket {
             
             // Обработка уведомлений
             this.socket.on('new_order', (data) => {
-                this.handleNewOrder(data);
+                if (this.trackSeq(data)) this.handleNewOrder(data);
             });
             
             this.socket.on('order_updated', (data) => {
-                this.handleOrderUpdated(data);
+                if (this.trackSeq(data)) this.handleOrderUpdated(data);
             });
             
             this.socket.on('waiter_call', (data) => {
-                this.handleWaiterCall(data);
+                if (this.trackSeq(data)) this.handleWaiterCall(data);
+            });
+            
+            this.socket.on('order_ready', (data) => {
+                if (this.trackSeq(data)) this.handleOrderReady(data);
+            });
+            
+            this.socket.on('print_job_status', (data) => {
+                if (this.trackSeq(data)) this.handlePrintJobStatus(data);
+            });
+            
+            this.socket.on('printer_status', (data) => {
+                if (this.trackSeq(data)) this.handlePrinterStatus(data);
+            });
+            
+            this.socket.on('sync_snapshot', (data) => {
+                this.handleSnapshot(data);
             });
             
             this.socket.on('joined_room', (data) => {
                 console.log('Присоединились к комнате:', data.message);
+                // При первом подключении начинаем отсчет с текущих номеров
+                Object.entries(data.seq || {}).forEach(([room, seq]) => {
+                    if (!(room in this.lastSeq)) {
+                        this.lastSeq[room] = seq;
+                        this.epoch[room] = (data.epoch || {})[room];
+                    }
+                });
             });
             
             this.socket.on('error', (data) => {
@@ -82,11 +110,67 @@ class WaiterWebSocket {
     joinWaiterRoom() {
         if (this.socket && this.isConnected) {
             this.socket.emit('join_waiter_room', {
-                waiter_id: this.waiterId
+                waiter_id: this.waiterId,
+                last_seq: this.lastSeq,
+                epoch: this.epoch
             });
         }
     }
     
+    trackSeq(data) {
+        // Запоминаем номер события; повторно досланные события пропускаем
+        if (!data || !data.room || typeof data.seq !== 'number') return true;
+        if (data.epoch && data.epoch !== this.epoch[data.room]) {
+            // Сервер начал новую нумерацию - отсчет заново с этого события
+            this.epoch[data.room] = data.epoch;
+            this.lastSeq[data.room] = data.seq;
+            return true;
+        }
+        const last = this.lastSeq[data.room] || 0;
+        if (data.seq <= last) return false;
+        this.lastSeq[data.room] = data.seq;
+        return true;
+    }
+    
+    handleSnapshot(data) {
+        console.log('Снимок состояния после переподключения:', data);
+        Object.assign(this.lastSeq, data.seq || {});
+        Object.assign(this.epoch, data.epoch || {});
+        
+        // Страница может применить снимок сама и отменить обработку по умолчанию
+        const event = new CustomEvent('waiter:snapshot', { detail: data, cancelable: true });
+        if (!document.dispatchEvent(event)) return;
+        
+        const counters = data.counters || {};
+        const ordersCounter = document.getElementById('pendingOrdersCount');
+        if (ordersCounter && counters.pending_orders !== undefined) {
+            ordersCounter.textContent = `${counters.pending_orders} новых`;
+        }
+        const callsCounter = document.getElementById('pendingCallsCount');
+        if (callsCounter && counters.pending_calls !== undefined) {
+            callsCounter.textContent = `${counters.pending_calls} активных`;
+        }
+        
+        // Списки отрисовываются из снимка; REST перезагрузка - только для
+        // страниц, которые не могут применить снимок (другая страница, фильтр)
+        if (!this.applySnapshotList(window.applyOrdersSnapshot, data.orders)) {
+            if (typeof window.loadOrders === 'function') window.loadOrders();
+        }
+        if (!this.applySnapshotList(window.applyCallsSnapshot, data.calls)) {
+            if (typeof window.loadCalls === 'function') window.loadCalls();
+        }
+    }
+    
+    applySnapshotList(apply, items) {
+        if (typeof apply !== 'function' || !Array.isArray(items)) return false;
+        try {
+            return apply(items) !== false;
+        } catch (error) {
+            console.error('Ошибка применения снимка:', error);
+            return false;
+        }
+    }
+    
     handleNewOrder(data) {
         // Защита от дублирования: проверяем ID заказа
         if (this.lastOrderId === data.order_id) {
@@ -132,6 +216,47 @@ class WaiterWebSocket {
         }
     }
     
+    handleOrderReady(data) {
+        console.log('Заказ готов:', data);
+        playNotificationSound();
+        this.showNotification('Заказ готов', data.message, 'ready');
+    }
+    
+    handlePrintJobStatus(data) {
+        console.log('Статус печати:', data);
+        if (!window.waiterNotifications) return;
+        
+        const printerNames = { kitchen: 'Кухонный', bar: 'Барный', receipt: 'Финальный' };
+        const name = printerNames[data.printer] || '';
+        if (data.status === 'done') {
+            window.waiterNotifications.show(`${name} чек заказа #${data.order_id} напечатан`, 'success', 4000);
+            if (data.job_type === 'final' && typeof window.loadOrders === 'function') {
+                window.loadOrders();
+            }
+        } else if (data.status === 'failed') {
+            window.waiterNotifications.show(`${name} чек заказа #${data.order_id} не напечатан: ${data.error || 'ошибка принтера'}`, 'error', 8000);
+        } else if (data.status === 'queued' && data.attempts > 0) {
+            window.waiterNotifications.show(`${name} принтер недоступен, повтор печати (попытка ${data.attempts})`, 'warning', 4000);
+        }
+    }
+    
+    handlePrinterStatus(data) {
+        console.log('Состояние принтера:', data);
+        if (!window.waiterNotifications) return;
+        
+        const printerNames = { kitchen: 'Кухонный', bar: 'Барный', receipt: 'Кассовый' };
+        const name = printerNames[data.printer] || '';
+        if (data.status === 'offline') {
+            window.waiterNotifications.show(`${name} принтер недоступен`, 'error', 8000);
+        } else if (data.status === 'paper_out') {
+            window.waiterNotifications.show(`${name} принтер: закончилась бумага`, 'error', 8000);
+        } else if (data.status === 'paper_low') {
+            window.waiterNotifications.show(`${name} принтер: бумага заканчивается`, 'warning', 6000);
+        } else if (data.status === 'online') {
+            window.waiterNotifications.show(`${name} принтер снова в сети`, 'success', 4000);
+        }
+    }
+    
     handleWaiterCall(data) {
         // Защита от дублирования: проверяем ID вызова
         if (this.lastCallId === data.call_id) {
@@ -239,6 +239,21 @@ def create_admin(username, password, email):
     click.echo(f"Статус: {result['status']}")
     click.echo(f"Сообщение: {result['message']}")
 
+@cli.command()
+@click.option('--batch-size', default=500, help='Карт в одной транзакции')
+def reencrypt_fields(batch_size):
+    """Перешифровка полей бонусных карт активным ключом (после смены ключа)."""
+    from app.models import BonusCard
+    from app.utils.field_encryption import field_encryption
+    
+    if field_encryption.active_version is None:
+        raise click.ClickException("Ключи шифрования полей не заданы (FIELD_ENCRYPTION_KEYS / ENCRYPTION_KEY)")
+    
+    result = BonusCard.reencrypt_fields(batch_size)
+    click.echo(f"Перешифровано значений: {result['reencrypted']} (ключ {field_encryption.active_version})")
+    if result['failed']:
+        click.echo(f"Не удалось расшифровать: {result['failed']} - значения оставлены как есть")
+
 @cli.command()
 def status():
     """Статус системы."""
@@ -16,24 +16,36 @@ def audit():
 @click.option('--staff-id', type=int, help='ID сотрудника')
 @click.option('--action', help='Фильтр по действию')
 @click.option('--hours', type=int, default=24, help='Часов назад')
+@click.option('--ip', help='IP адрес')
+@click.option('--detail', 'detail_filters', multiple=True, metavar='PATH=VALUE',
+              help='Фильтр по details, например json_data.order_id=1234 (можно несколько)')
+@click.option('--json-path', help='Предикат jsonpath по details, например "$.response_status >= 500"')
 @with_appcontext
-def logs(limit, staff_id, action, hours):
+def logs(limit, staff_id, action, hours, ip, detail_filters, json_path):
     """Просмотр логов аудита."""
     from app.models import AuditLog, Staff
     
-    query = AuditLog.query
-    
-    # Фильтр по времени
-    since = datetime.utcnow() - timedelta(hours=hours)
-    query = query.filter(AuditLog.created_at >= since)
+    details = {}
+    for item in detail_filters:
+        path, sep, value = item.partition('=')
+        if not sep or not path:
+            raise click.BadParameter(f"Ожидается PATH=VALUE: {item}", param_hint='--detail')
+        details[path.strip()] = value
     
-    # Фильтры
-    if staff_id:
-        query = query.filter_by(staff_id=staff_id)
-    if action:
-        query = query.filter(AuditLog.action.contains(action))
+    # Фильтры выполняются в SQL (индекс GIN по details)
+    try:
+        query = AuditLog.search(
+            staff_id=staff_id,
+            action=action,
+            ip_address=ip,
+            date_from=datetime.utcnow() - timedelta(hours=hours),
+            details=details,
+            details_path=json_path
+        )
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--detail')
     
-    logs = query.order_by(AuditLog.created_at.desc()).limit(limit).all()
+    logs = query.limit(limit).all()
     
     if not logs:
         click.echo("Логи не найдены")
@@ -92,6 +104,20 @@ def stats(days):
         name = staff.name if staff else f"ID {user['staff_id']}"
         click.echo(f"  • {name}: {user['count']} действий")
 
+@audit.command()
+@click.option('--days', default=7, help='Пересчитать агрегаты за указанное количество дней')
+@with_appcontext
+def rollup(days):
+    """Пересчет почасовых агрегатов статистики из логов."""
+    from app.models import AuditStatHourly
+    from app import db
+    
+    since = datetime.utcnow() - timedelta(days=days)
+    count = AuditStatHourly.rebuild(since)
+    db.session.commit()
+    
+    click.echo(f"✅ Агрегаты за {days} дней пересчитаны: {count} строк")
+
 @audit.command()
 @click.option('--hours', default=1, help='Часов назад')
 @with_appcontext
@@ -355,27 +381,56 @@ def recent(limit):
         click.echo("-" * 40)
 
 @audit.command()
-@click.confirmation_option(prompt='Вы уверены, что хотите очистить старые логи?')
-@click.option('--days', default=90, help='Удалить логи старше указанного количества дней')
+@click.option('--days', type=int, help='Единый срок хранения для всех действий вместо политики')
+@click.option('--batch-size', type=int, help='Строк в одной пачке DELETE')
+@click.option('--pause-ms', type=int, help='Пауза между пачками, мс')
+@click.option('--dry-run', is_flag=True, help='Только показать, сколько записей будет удалено')
+@click.option('--yes', is_flag=True, help='Не спрашивать подтверждение')
 @with_appcontext
-def cleanup(days):
-    """Очистка старых логов."""
-    from app.models import AuditLog
-    from app import db
-    
-    cutoff_date = datetime.utcnow() - timedelta(days=days)
-    
-    old_logs = AuditLog.query.filter(AuditLog.created_at < cutoff_date)
-    count = old_logs.count()
-    
-    if count == 0:
-        click.echo(f"Логов старше {days} дней не найдено")
+def cleanup(days, batch_size, pause_ms, dry_run, yes):
+    """Очистка старых логов по политике хранения."""
+    from app.utils.audit_retention import audit_retention
+
+    if batch_size:
+        audit_retention.batch_size = batch_size
+    if pause_ms is not None:
+        audit_retention.pause = pause_ms / 1000.0
+
+    if days is None:
+        policy = audit_retention.policy()
+        click.echo(f"Политика хранения: по умолчанию {policy['default_days']} дней")
+        for rule in policy['rules']:
+            click.echo(f"  {rule['action']}: {rule['days']} дней")
+    else:
+        click.echo(f"Срок хранения для всех действий: {days} дней")
+
+    if not dry_run and not yes:
+        click.confirm('Вы уверены, что хотите очистить старые логи?', abort=True)
+
+    def progress(status):
+        if status['state'] == 'running':
+            click.echo(f"\r⏳ Пачек: {status['batches']}, удалено: {status['deleted']}", nl=False)
+
+    status = audit_retention.run(days=days, dry_run=dry_run, progress=progress)
+    click.echo()
+
+    if status['state'] == 'failed':
+        click.echo(f"❌ Ошибка очистки: {status['error']}")
         return
-    
-    old_logs.delete()
-    db.session.commit()
-    
-    click.echo(f"✅ Удалено {count} записей старше {days} дней")
+
+    for rule in status['rules']:
+        click.echo(f"  {rule['action']} (до {rule['cutoff'][:10]}): {rule['deleted']}")
+    for name in status['dropped_partitions']:
+        click.echo(f"  🗑 Удалена секция {name}")
+    if status['pruned_stats']:
+        click.echo(f"  Удалено почасовых агрегатов: {status['pruned_stats']}")
+
+    if dry_run:
+        click.echo(f"Будет удалено записей: {status['deleted']}")
+    elif status['state'] == 'stopped':
+        click.echo(f"⚠️ Остановлено по лимиту времени, удалено {status['deleted']} записей")
+    else:
+        click.echo(f"✅ Удалено {status['deleted']} записей за {status['batches']} пачек")
 
 @audit.command()
 @with_appcontext
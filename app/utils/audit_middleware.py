@@ -1,11 +1,15 @@
 """Middleware для автоматического аудита всех действий."""
 
-from flask import request, g, current_app
+from flask import request, current_app
 from flask_login import current_user
-import json
-import time
+import random
 from typing import Dict, Any, Optional
 
+from app.request_pipeline import RequestContext, request_pipeline
+from app.utils.audit_policy import audit_policy
+
+SENSITIVE_FIELDS = ('password', 'password_hash', 'token', 'secret')
+
 class AuditMiddleware:
     """Middleware для автоматического логирования всех действий в системе."""
     
@@ -16,75 +20,44 @@ class AuditMiddleware:
     
     def init_app(self, app):
         """Инициализация middleware."""
-        app.before_request(self.before_request)
-        app.after_request(self.after_request)
+        from app.utils.audit_writer import audit_writer
+        audit_writer.init_app(app)
+        audit_policy.init_app(app)
+        
+        # Последняя стадия до обработчика и первая после него
+        request_pipeline.add_stage('audit', before=self.before_request, after=self.after_request, order=40)
         app.teardown_appcontext(self.teardown_request)
     
-    def before_request(self):
+    def before_request(self, ctx: RequestContext):
         """Действия перед обработкой запроса."""
-        try:
-            g.start_time = time.time()
-            g.request_data = {
-                'method': request.method,
-                'url': request.url,
-                'endpoint': request.endpoint,
-                'remote_addr': request.remote_addr,
-                'user_agent': request.headers.get('User-Agent'),
-                'referrer': request.headers.get('Referer'),
-                'content_type': request.content_type,
-                'content_length': request.content_length
-            }
-        except Exception as e:
-            current_app.logger.error(f"Audit before_request error: {e}")
-            # Устанавливаем минимальные данные
-            g.start_time = time.time()
-            g.request_data = {}
-        
-        try:
-            # Логируем параметры запроса (без паролей)
-            if request.args:
-                g.request_data['query_params'] = dict(request.args)
-            
-            # Логируем JSON данные (без паролей)
-            if request.is_json:
-                try:
-                    json_data = request.get_json(silent=True)
-                    if json_data:
-                        json_data = dict(json_data)
-                        # Удаляем чувствительные данные
-                        for sensitive_field in ['password', 'password_hash', 'token', 'secret']:
-                            if sensitive_field in json_data:
-                                json_data[sensitive_field] = '[FILTERED]'
-                        g.request_data['json_data'] = json_data
-                except Exception as e:
-                    # Игнорируем ошибки парсинга JSON
-                    current_app.logger.debug(f"JSON parsing failed: {e}")
-            
-            # Логируем форм-данные (без паролей)
-            if request.form:
-                form_data = dict(request.form)
-                for sensitive_field in ['password', 'password_hash', 'token', 'secret']:
-                    if sensitive_field in form_data:
-                        form_data[sensitive_field] = '[FILTERED]'
-                    g.request_data['form_data'] = form_data
-        except Exception as e:
-            current_app.logger.error(f"Audit data collection error: {e}")
+        # Данные запроса собираются только для записей, которые будут залогированы
+        if not audit_policy.compiled:
+            # URL map заполняется после init_app - компилируем на первом запросе
+            audit_policy.compile(current_app._get_current_object())
     
-    def after_request(self, response):
+    def after_request(self, ctx: RequestContext, response):
         """Действия после обработки запроса."""
         try:
-            if not hasattr(g, 'start_time'):
-                return response
-            
-            # Вычисляем время выполнения
-            duration = time.time() - g.start_time
-            
-            # Определяем тип действия на основе endpoint и метода
-            action = self.determine_action(request.endpoint, request.method, response.status_code)
-            
-            # Логируем только важные действия
-            if self.should_log_action(action, request.endpoint, response.status_code):
-                self.log_request_action(action, response, duration)
+            # Классификация запроса - один поиск в скомпилированной таблице
+            rule = audit_policy.lookup(ctx.endpoint)
+            is_error = response.status_code >= 400
+            
+            if rule is None:
+                if not is_error:
+                    return response
+                action = f"{ctx.method}_unknown_endpoint"
+            elif is_error:
+                if not rule.log_errors:
+                    return response
+                action = rule.error_action
+            else:
+                if ctx.method not in rule.log_methods:
+                    return response
+                if rule.sample_rate < 1.0 and random.random() >= rule.sample_rate:
+                    return response
+                action = rule.action_for(ctx.method, is_error)
+            
+            self.log_request_action(action, response, ctx.elapsed, rule)
         except Exception as e:
             current_app.logger.error(f"Audit after_request error: {e}")
         
@@ -96,110 +69,54 @@ class AuditMiddleware:
             # Логируем исключения
             self.log_exception(exception)
     
-    def determine_action(self, endpoint: str, method: str, status_code: int) -> str:
-        """Определяет тип действия на основе endpoint и метода."""
-        if not endpoint:
-            return f"{method}_unknown_endpoint"
+    def collect_request_data(self) -> Dict[str, Any]:
+        """Данные запроса для записи аудита (без паролей)."""
+        data = {
+            'method': request.method,
+            'url': request.url,
+            'endpoint': request.endpoint,
+            'remote_addr': request.remote_addr,
+            'user_agent': request.headers.get('User-Agent'),
+            'referrer': request.headers.get('Referer'),
+            'content_type': request.content_type,
+            'content_length': request.content_length
+        }
         
-        # Мапим endpoint на действия
-        action_map = {
-            # Аутентификация
-            'auth.login': 'user_login',
-            'auth.logout': 'user_logout',
-            
-            # Заказы
-            'orders.create': 'order_create',
-            'orders.confirm': 'order_confirm', 
-            'orders.complete': 'order_complete',
-            'orders.cancel': 'order_cancel',
-            
-            # Столы
-            'tables.assign': 'table_assign',
-            'tables.release': 'table_release',
-            'tables.status': 'table_status_check',
-            
-            # Меню
-            'menu.create': 'menu_item_create',
-            'menu.update': 'menu_item_update',
-            'menu.delete': 'menu_item_delete',
-            'menu.get': 'menu_view',
-            
-
-            
-            # Печать
-            'print.kitchen': 'print_kitchen_order',
-            'print.bar': 'print_bar_order',
-            'print.receipt': 'print_receipt',
+        try:
+            if request.args:
+                data['query_params'] = dict(request.args)
             
-            # Админка
-            'admin.dashboard': 'admin_dashboard_view',
-            'admin.reports': 'admin_reports_view',
-            'admin.settings': 'admin_settings_view',
+            if request.is_json:
+                json_data = request.get_json(silent=True)
+                if isinstance(json_data, dict):
+                    data['json_data'] = self._filter_sensitive(json_data)
             
-            # Официанты
-            'waiter.dashboard': 'waiter_dashboard_view',
-            'waiter.calls': 'waiter_calls_view',
-        }
-        
-        base_action = action_map.get(endpoint, endpoint.replace('.', '_'))
-        
-        # Добавляем суффикс на основе статуса
-        if status_code >= 400:
-            base_action += '_error'
-        elif method in ['POST', 'PUT', 'PATCH']:
-            base_action += '_modify'
-        elif method == 'DELETE':
-            base_action += '_delete'
-        elif method == 'GET':
-            base_action += '_view'
+            if request.form:
+                data['form_data'] = self._filter_sensitive(dict(request.form))
+        except Exception as e:
+            current_app.logger.error(f"Audit data collection error: {e}")
         
-        return base_action
+        return data
     
-    def should_log_action(self, action: str, endpoint: str, status_code: int) -> bool:
-        """Определяет, нужно ли логировать действие."""
-        # Всегда логируем ошибки
-        if status_code >= 400:
-            return True
-        
-        # Исключаем статические файлы, healthcheck и waiter API
-        excluded_endpoints = [
-            'static',
-            'health',
-            'favicon.ico',
-            'waiter.dashboard_stats'
-        ]
-        
-        # Также исключаем по URL пути
-        if request.path and any(path in request.path for path in ['/api/dashboard']):
-            return False
-        
-        if endpoint and any(excl in endpoint for excl in excluded_endpoints):
-            return False
-        
-        # Логируем только важные действия
-        important_actions = [
-            'user_login', 'user_logout',
-            'order_create', 'order_confirm', 'order_complete', 'order_cancel',
-            'table_assign', 'table_release',
-            'menu_item_create', 'menu_item_update', 'menu_item_delete',
-            'print_kitchen_order', 'print_bar_order', 'print_receipt',
-            'admin_', 'waiter_'  # Все админские и официантские действия
-        ]
-        
-        return any(important in action for important in important_actions)
+    @staticmethod
+    def _filter_sensitive(data: Dict[str, Any]) -> Dict[str, Any]:
+        data = dict(data)
+        for sensitive_field in SENSITIVE_FIELDS:
+            if sensitive_field in data:
+                data[sensitive_field] = '[FILTERED]'
+        return data
     
-    def log_request_action(self, action: str, response, duration: float):
+    def log_request_action(self, action: str, response, duration: float, rule=None):
         """Логирует действие запроса."""
         try:
-            from app.models import AuditLog
+            from app.utils.audit_writer import audit_writer
             
-            # Собираем детали (безопасно получаем request_data)
-            request_data = getattr(g, 'request_data', {})
             details = {
-                **request_data,
+                **self.collect_request_data(),
                 'duration_seconds': round(duration, 4),
                 'response_status': response.status_code,
-                'response_size': len(response.get_data()) if hasattr(response, 'get_data') else None,
+                # Из заголовка Content-Length: тело (в т.ч. потоковое) не читаем
+                'response_size': response.content_length,
             }
             
             # Добавляем информацию о пользователе
@@ -211,12 +128,13 @@ class AuditMiddleware:
                     'role': current_user.role
                 }
             
-            # Извлекаем ID стола и заказа из URL или данных
-            table_id = self.extract_table_id()
-            order_id = self.extract_order_id()
+            # Извлекаем ID стола и заказа за один проход по источникам правила
+            ids = self.extract_ids(rule)
+            table_id = ids.get('table_id')
+            order_id = ids.get('order_id')
             
-            # Создаем запись аудита
-            AuditLog.log_action(
+            # Запись уходит в очередь, в БД ее вставит фоновый поток
+            audit_writer.submit(
                 action=action,
                 staff_id=current_user.id if current_user.is_authenticated else None,
                 table_affected=table_id,
@@ -234,18 +152,16 @@ class AuditMiddleware:
     def log_exception(self, exception):
         """Логирует исключения."""
         try:
-            from app.models import AuditLog
+            from app.utils.audit_writer import audit_writer
             
-            # Безопасно получаем request_data
-            request_data = getattr(g, 'request_data', {})
             details = {
-                **request_data,
+                **self.collect_request_data(),
                 'exception_type': type(exception).__name__,
                 'exception_message': str(exception),
                 'traceback': self.get_traceback_string(exception)
             }
             
-            AuditLog.log_action(
+            audit_writer.submit(
                 action='system_exception',
                 staff_id=current_user.id if current_user.is_authenticated else None,
                 details=details,
@@ -255,65 +171,46 @@ class AuditMiddleware:
         except Exception as e:
             current_app.logger.error(f"Failed to log exception: {e}")
     
-    def extract_table_id(self) -> Optional[int]:
-        """Извлекает ID стола из запроса."""
-        # Проверяем URL параметры
-        if request.view_args and 'table_id' in request.view_args:
-            return request.view_args['table_id']
-        
-        # Проверяем query параметры
-        if request.args.get('table_id'):
-            try:
-                return int(request.args.get('table_id'))
-            except (ValueError, TypeError):
-                pass
-        
-        # Проверяем JSON данные
-        try:
-            json_data = request.get_json(silent=True)
-            if json_data and 'table_id' in json_data:
-                return int(json_data['table_id'])
-        except (ValueError, TypeError, AttributeError):
-            pass
-        
-        # Проверяем форм данные
-        if request.form.get('table_id'):
-            try:
-                return int(request.form.get('table_id'))
-            except (ValueError, TypeError):
-                pass
-        
-        return None
-    
-    def extract_order_id(self) -> Optional[int]:
-        """Извлекает ID заказа из запроса."""
-        # Проверяем URL параметры
-        if request.view_args and 'order_id' in request.view_args:
-            return request.view_args['order_id']
-        
-        # Проверяем query параметры
-        if request.args.get('order_id'):
-            try:
-                return int(request.args.get('order_id'))
-            except (ValueError, TypeError):
-                pass
-        
-        # Проверяем JSON данные
-        try:
-            json_data = request.get_json(silent=True)
-            if json_data and 'order_id' in json_data:
-                return int(json_data['order_id'])
-        except (ValueError, TypeError, AttributeError):
-            pass
-        
-        # Проверяем форм данные
-        if request.form.get('order_id'):
-            try:
-                return int(request.form.get('order_id'))
-            except (ValueError, TypeError):
-                pass
+    def extract_ids(self, rule=None) -> Dict[str, int]:
+        """
+        Извлекает ID (table_id, order_id) из запроса.
+        
+        Источники (view_args, args, json, form) читаются по одному разу в
+        порядке приоритета из правила политики; первое найденное значение
+        каждого поля выигрывает.
+        """
+        fields = rule.id_fields if rule else ('table_id', 'order_id')
+        sources = rule.id_sources if rule else ('view_args', 'args', 'json', 'form')
+        found: Dict[str, int] = {}
+        
+        for source in sources:
+            if len(found) == len(fields):
+                break
+            if source == 'view_args':
+                values = request.view_args
+            elif source == 'args':
+                values = request.args
+            elif source == 'json':
+                values = request.get_json(silent=True) if request.is_json else None
+            elif source == 'form':
+                values = request.form
+            else:
+                continue
+            
+            if not values or not hasattr(values, 'get'):
+                continue
+            for field in fields:
+                if field in found:
+                    continue
+                value = values.get(field)
+                if value in (None, ''):
+                    continue
+                try:
+                    found[field] = int(value)
+                except (ValueError, TypeError):
+                    pass
         
-        return None
+        return found
     
     def get_traceback_string(self, exception) -> str:
         """Получает строковое представление traceback."""
@@ -0,0 +1,164 @@
+"""Скомпилированная политика аудита запросов.
+
+Декларативный файл политики (``app/audit_policy.json`` или
+``AUDIT_POLICY_FILE``) один раз при старте применяется ко всем endpoint из
+URL map Flask. Получается таблица endpoint -> ``EndpointAuditRule`` с уже
+вычисленными именами действий по методам, решением "логировать или нет",
+долей выборки и списком полей id для извлечения. На запросе остается один
+поиск в словаре.
+"""
+
+import fnmatch
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import Flask
+
+DEFAULT_POLICY_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'audit_policy.json')
+
+METHOD_SUFFIXES = {
+    'POST': '_modify',
+    'PUT': '_modify',
+    'PATCH': '_modify',
+    'DELETE': '_delete',
+    'GET': '_view',
+}
+
+
+class EndpointAuditRule:
+    """Решение аудита для одного endpoint."""
+
+    __slots__ = ('endpoint', 'actions', 'error_action', 'log_methods',
+                 'log_errors', 'sample_rate', 'id_fields', 'id_sources')
+
+    def __init__(self, endpoint: Optional[str], actions: Dict[str, str], error_action: str,
+                 log_methods: frozenset, log_errors: bool, sample_rate: float,
+                 id_fields: Tuple[str, ...], id_sources: Tuple[str, ...]):
+        self.endpoint = endpoint
+        self.actions = actions
+        self.error_action = error_action
+        self.log_methods = log_methods
+        self.log_errors = log_errors
+        self.sample_rate = sample_rate
+        self.id_fields = id_fields
+        self.id_sources = id_sources
+
+    def action_for(self, method: str, is_error: bool) -> str:
+        """Имя действия для метода и исхода запроса."""
+        if is_error:
+            return self.error_action
+        return self.actions.get(method) or self.error_action[:-len('_error')]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'endpoint': self.endpoint,
+            'actions': self.actions,
+            'log_methods': sorted(self.log_methods),
+            'log_errors': self.log_errors,
+            'sample_rate': self.sample_rate,
+            'id_fields': list(self.id_fields),
+            'id_sources': list(self.id_sources),
+        }
+
+
+class AuditPolicy:
+    """Загрузка файла политики и компиляция таблицы решений."""
+
+    def __init__(self):
+        self.path = DEFAULT_POLICY_FILE
+        self.policy: Dict[str, Any] = {}
+        self._table: Optional[Dict[str, EndpointAuditRule]] = None
+        self._url_rules: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app: Flask) -> None:
+        """Чтение файла политики. Таблица компилируется при первом запросе."""
+        self.path = app.config.get('AUDIT_POLICY_FILE') or DEFAULT_POLICY_FILE
+        self.policy = self.load(self.path)
+        self._table = None
+
+    @staticmethod
+    def load(path: str) -> Dict[str, Any]:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def compile(self, app: Flask) -> Dict[str, EndpointAuditRule]:
+        """Компиляция таблицы по всем правилам URL map приложения."""
+        url_rules: Dict[str, List[str]] = {}
+        methods: Dict[str, set] = {}
+        for rule in app.url_map.iter_rules():
+            url_rules.setdefault(rule.endpoint, []).append(rule.rule)
+            methods.setdefault(rule.endpoint, set()).update(rule.methods or ())
+
+        table = {}
+        for endpoint in url_rules:
+            table[endpoint] = self._compile_endpoint(endpoint, url_rules[endpoint], methods[endpoint])
+
+        with self._lock:
+            self._url_rules = url_rules
+            self._table = table
+        app.logger.info(f"Audit policy compiled: {len(table)} endpoints, "
+                        f"{sum(1 for r in table.values() if r.log_methods)} logged")
+        return table
+
+    def lookup(self, endpoint: Optional[str]) -> Optional[EndpointAuditRule]:
+        """Правило для endpoint; None - запрос не сопоставлен ни одному маршруту."""
+        if endpoint is None:
+            return None
+        rule = self._table.get(endpoint)
+        if rule is None:
+            # Маршрут добавлен после компиляции - компилируем и запоминаем
+            rule = self._compile_endpoint(endpoint, self._url_rules.get(endpoint, []), set(METHOD_SUFFIXES))
+            with self._lock:
+                self._table[endpoint] = rule
+        return rule
+
+    @property
+    def compiled(self) -> bool:
+        return self._table is not None
+
+    def table(self) -> Dict[str, Dict[str, Any]]:
+        """Скомпилированная таблица (для просмотра администратором)."""
+        return {endpoint: rule.to_dict() for endpoint, rule in sorted((self._table or {}).items())}
+
+    def _compile_endpoint(self, endpoint: str, url_rules: List[str], methods: set) -> EndpointAuditRule:
+        policy = self.policy
+        overrides: Dict[str, Any] = {}
+        for pattern, override in policy.get('endpoints', {}).items():
+            if fnmatch.fnmatchcase(endpoint, pattern):
+                overrides.update(override)
+
+        base_action = overrides.get('action') or policy.get('actions', {}).get(endpoint) or endpoint.replace('.', '_')
+        actions = {method: base_action + suffix for method, suffix in METHOD_SUFFIXES.items() if method in methods}
+
+        excluded = (
+            any(excl in endpoint for excl in policy.get('exclude_endpoints', []))
+            or any(path in url for path in policy.get('exclude_paths', []) for url in url_rules)
+        )
+        important = policy.get('important_actions', [])
+
+        log_methods = set()
+        for method, action in actions.items():
+            if 'log' in overrides:
+                log = bool(overrides['log'])
+            else:
+                log = not excluded and any(item in action for item in important)
+            if log:
+                log_methods.add(method)
+
+        return EndpointAuditRule(
+            endpoint=endpoint,
+            actions=actions,
+            error_action=base_action + '_error',
+            log_methods=frozenset(log_methods),
+            log_errors=bool(overrides.get('log_errors', policy.get('log_errors', True))),
+            sample_rate=float(overrides.get('sample_rate', 1.0)),
+            id_fields=tuple(overrides.get('id_fields', policy.get('id_fields', ['table_id', 'order_id']))),
+            id_sources=tuple(overrides.get('id_sources', policy.get('id_sources', ['view_args', 'args', 'json', 'form']))),
+        )
+
+
+# Глобальная политика аудита
+audit_policy = AuditPolicy()
@@ -0,0 +1,303 @@
+"""Хранение логов аудита: удаление старых записей порциями.
+
+Вместо одного ``DELETE ... WHERE created_at < cutoff`` на миллионы строк
+(одна большая транзакция, раздутый WAL, блокировки и остановка вставок
+аудита) записи удаляются пачками по ``AUDIT_RETENTION_BATCH_SIZE`` строк,
+каждая в своей транзакции, с паузой между пачками. Если таблица
+``audit_log`` секционирована, секции, целиком вышедшие за срок хранения,
+отсоединяются и удаляются без построчного DELETE. Почасовые агрегаты
+старше самого длинного срока хранения удаляются вместе с логами.
+
+Срок хранения задается по действиям в разделе ``retention`` файла политики
+аудита (``app/audit_policy.json``): первое подходящее правило выигрывает.
+Очистка запускается каждую ночь планировщиком, из ``flask audit cleanup``
+и из админки; ход выполнения доступен через ``status()``.
+"""
+
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+from flask import Flask
+
+from app import db
+
+# Граница секции: FOR VALUES FROM ('...') TO ('...')
+PARTITION_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+class RetentionRule:
+    """Срок хранения для действий, подходящих под шаблон."""
+
+    __slots__ = ('pattern', 'days')
+
+    def __init__(self, pattern: str, days: int):
+        self.pattern = pattern
+        self.days = int(days)
+
+    @property
+    def like(self) -> str:
+        """Шаблон с * -> SQL LIKE."""
+        return self.pattern.replace('%', r'\%').replace('_', r'\_').replace('*', '%')
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'action': self.pattern, 'days': self.days}
+
+
+class AuditRetention:
+    """Движок очистки логов аудита по политике хранения."""
+
+    def __init__(self):
+        self.app: Optional[Flask] = None
+        self.batch_size = 5000
+        self.pause = 0.2
+        self.max_runtime = 3600.0
+        self.default_days = 90
+        self.rules: List[RetentionRule] = []
+        self._run_lock = threading.Lock()
+        self._status: Dict[str, Any] = {'state': 'idle'}
+
+    def init_app(self, app: Flask) -> None:
+        """Настройки, политика хранения и ночной запуск в планировщике."""
+        self.app = app
+        self.batch_size = int(app.config.get('AUDIT_RETENTION_BATCH_SIZE', self.batch_size))
+        self.pause = int(app.config.get('AUDIT_RETENTION_PAUSE_MS', 200)) / 1000.0
+        self.max_runtime = float(app.config.get('AUDIT_RETENTION_MAX_RUNTIME_SECONDS', self.max_runtime))
+
+        from app.utils.audit_policy import audit_policy
+        self.load_policy(audit_policy.policy.get('retention', {}))
+
+        if app.config.get('TESTING') or not app.config.get('AUDIT_RETENTION_ENABLED', True):
+            return
+
+        from app import scheduler
+        from apscheduler.triggers.cron import CronTrigger
+
+        scheduler.add_job(
+            func=self._scheduled_run,
+            trigger=CronTrigger(hour=int(app.config.get('AUDIT_RETENTION_HOUR', 3)), minute=30),
+            id='audit_retention',
+            name='Audit log retention',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+        if not scheduler.running:
+            scheduler.start()
+
+    def load_policy(self, retention: Dict[str, Any]) -> None:
+        """Политика вида {"default_days": 90, "rules": [{"action": "user_login*", "days": 365}, ...]}."""
+        self.default_days = int(retention.get('default_days', self.default_days))
+        self.rules = [RetentionRule(rule['action'], rule['days']) for rule in retention.get('rules', [])]
+
+    def policy(self) -> Dict[str, Any]:
+        return {
+            'default_days': self.default_days,
+            'rules': [rule.to_dict() for rule in self.rules],
+        }
+
+    def status(self) -> Dict[str, Any]:
+        """Ход выполнения текущей или последней очистки."""
+        return dict(self._status)
+
+    # --- запуск ---
+
+    def start_background(self, days: Optional[int] = None) -> bool:
+        """Запуск очистки в отдельном потоке. False - очистка уже идет."""
+        if self._run_lock.locked():
+            return False
+
+        def run():
+            with self.app.app_context():
+                try:
+                    self.run(days=days)
+                finally:
+                    db.session.remove()
+
+        threading.Thread(target=run, name='audit-retention', daemon=True).start()
+        return True
+
+    def run(self, days: Optional[int] = None, dry_run: bool = False,
+            progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Очистка по политике хранения (нужен контекст приложения).
+
+        Args:
+            days: Единый срок для всех действий вместо политики
+            dry_run: Только подсчитать, сколько записей будет удалено
+            progress: Вызывается после каждой пачки со снимком статуса
+
+        Returns:
+            Dict: Итоговый статус
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return self.status()
+
+        try:
+            now = datetime.now(timezone.utc)
+            plan = self._plan(now, days)
+            self._status = {
+                'state': 'running',
+                'dry_run': dry_run,
+                'started_at': now.isoformat(),
+                'finished_at': None,
+                'deleted': 0,
+                'batches': 0,
+                'dropped_partitions': [],
+                'pruned_stats': 0,
+                'rules': [{'action': label, 'cutoff': cutoff.isoformat(), 'deleted': 0}
+                          for label, _, cutoff in plan],
+                'error': None,
+            }
+
+            if dry_run:
+                for index, (_, condition, _) in enumerate(plan):
+                    count = db.session.execute(
+                        sa.select(sa.func.count()).select_from(sa.table('audit_log')).where(condition)
+                    ).scalar()
+                    self._status['rules'][index]['deleted'] = count
+                    self._status['deleted'] += count
+            else:
+                self._drop_expired_partitions(now, days)
+                deadline = time.monotonic() + self.max_runtime
+                for index, (_, condition, _) in enumerate(plan):
+                    if not self._delete_in_batches(index, condition, deadline, progress):
+                        self._status['state'] = 'stopped'
+                        break
+                self._prune_stats(now, days)
+
+            if self._status['state'] == 'running':
+                self._status['state'] = 'done'
+            self._status['finished_at'] = datetime.now(timezone.utc).isoformat()
+            if self.app and not dry_run:
+                self.app.logger.info(
+                    f"Audit retention {self._status['state']}: deleted {self._status['deleted']} rows "
+                    f"in {self._status['batches']} batches, "
+                    f"dropped partitions: {len(self._status['dropped_partitions'])}, "
+                    f"pruned hourly stats: {self._status['pruned_stats']}"
+                )
+        except Exception as e:
+            db.session.rollback()
+            self._status.update({
+                'state': 'failed',
+                'error': str(e),
+                'finished_at': datetime.now(timezone.utc).isoformat(),
+            })
+            if self.app:
+                self.app.logger.error(f"Audit retention failed: {e}")
+        finally:
+            self._run_lock.release()
+
+        if progress:
+            progress(self.status())
+        return self.status()
+
+    # --- внутреннее ---
+
+    def _plan(self, now: datetime, days: Optional[int]) -> List[Tuple[str, Any, datetime]]:
+        """Условия удаления по правилам: (метка, условие WHERE, граница)."""
+        action = sa.column('action')
+        created_at = sa.column('created_at')
+
+        if days is not None:
+            cutoff = now - timedelta(days=days)
+            return [('*', created_at < cutoff, cutoff)]
+
+        plan = []
+        earlier = []
+        for rule in self.rules:
+            matches = action.like(rule.like, escape='\\')
+            cutoff = now - timedelta(days=rule.days)
+            # Первое подходящее правило выигрывает: исключаем совпадения предыдущих
+            plan.append((rule.pattern, sa.and_(matches, *[sa.not_(m) for m in earlier], created_at < cutoff), cutoff))
+            earlier.append(matches)
+
+        cutoff = now - timedelta(days=self.default_days)
+        plan.append(('default', sa.and_(*[sa.not_(m) for m in earlier], created_at < cutoff), cutoff))
+        return plan
+
+    def _delete_in_batches(self, index: int, condition, deadline: float,
+                           progress: Optional[Callable[[Dict[str, Any]], None]]) -> bool:
+        """Удаление пачками до исчерпания; False - превышено время работы."""
+        audit_log = sa.table('audit_log', sa.column('id'))
+        batch_ids = sa.select(audit_log.c.id).where(condition).limit(self.batch_size).scalar_subquery()
+
+        while True:
+            if time.monotonic() > deadline:
+                return False
+
+            result = db.session.execute(sa.delete(audit_log).where(audit_log.c.id.in_(batch_ids)))
+            db.session.commit()
+
+            deleted = result.rowcount or 0
+            self._status['deleted'] += deleted
+            self._status['rules'][index]['deleted'] += deleted
+            self._status['batches'] += 1
+            if progress:
+                progress(self.status())
+
+            if deleted < self.batch_size:
+                return True
+            # Пауза дает место вставкам аудита и autovacuum
+            time.sleep(self.pause)
+
+    def _longest_cutoff(self, now: datetime, days: Optional[int]) -> datetime:
+        """Граница самого длинного срока хранения: старше нее в audit_log ничего не остается."""
+        longest = days if days is not None else max([self.default_days] + [rule.days for rule in self.rules])
+        return now - timedelta(days=longest)
+
+    def _prune_stats(self, now: datetime, days: Optional[int]) -> None:
+        """Удаление почасовых агрегатов за часы, логи которых уже удалены."""
+        from app.models import AuditStatHourly
+
+        self._status['pruned_stats'] = AuditStatHourly.prune(self._longest_cutoff(now, days))
+        db.session.commit()
+
+    def _drop_expired_partitions(self, now: datetime, days: Optional[int]) -> None:
+        """Удаление секций, все строки которых старше самого длинного срока хранения."""
+        if db.engine.dialect.name != 'postgresql':
+            return
+
+        partitioned = db.session.execute(sa.text(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'audit_log'::regclass"
+        )).scalar()
+        if not partitioned:
+            return
+
+        cutoff = self._longest_cutoff(now, days)
+
+        partitions = db.session.execute(sa.text("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'audit_log'::regclass
+        """)).all()
+
+        for name, bound in partitions:
+            match = PARTITION_BOUND_RE.search(bound or '')
+            if not match:
+                continue  # DEFAULT-секция или неизвестный формат границы
+            upper = datetime.fromisoformat(match.group(2))
+            if upper.tzinfo is None:
+                upper = upper.replace(tzinfo=timezone.utc)
+            if upper > cutoff:
+                continue
+
+            db.session.execute(sa.text(f'ALTER TABLE audit_log DETACH PARTITION "{name}"'))
+            db.session.execute(sa.text(f'DROP TABLE "{name}"'))
+            db.session.commit()
+            self._status['dropped_partitions'].append(name)
+
+    def _scheduled_run(self) -> None:
+        with self.app.app_context():
+            try:
+                self.run()
+            finally:
+                db.session.remove()
+
+
+# Глобальный экземпляр очистки аудита
+audit_retention = AuditRetention()
@@ -0,0 +1,198 @@
+"""Буферизованная запись аудита.
+
+Записи аудита из запросов не пишутся в БД на потоке запроса: они кладутся
+в ограниченную очередь в памяти, а фоновый поток вставляет их пачками -
+каждые ``AUDIT_BATCH_SIZE`` записей или ``AUDIT_FLUSH_INTERVAL_MS``
+миллисекунд. Если очередь переполнена (БД не успевает), запись
+отбрасывается и учитывается в счетчике ``dropped`` - запрос не ждет.
+Приведение деталей к JSON тоже выполняется в фоновом потоке.
+"""
+
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import sqlalchemy as sa
+from flask import Flask
+
+from app import db
+
+
+class AuditWriter:
+    """Очередь записей аудита и фоновый поток пакетной вставки."""
+
+    def __init__(self):
+        self.app: Optional[Flask] = None
+        self.batch_size = 200
+        self.flush_interval = 0.5
+        self.put_timeout = 0.0
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._last_drop_warning = 0.0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def init_app(self, app: Flask) -> None:
+        """Чтение настроек и запуск фонового потока."""
+        self.app = app
+        self.batch_size = int(app.config.get('AUDIT_BATCH_SIZE', self.batch_size))
+        self.flush_interval = int(app.config.get('AUDIT_FLUSH_INTERVAL_MS', 500)) / 1000.0
+        self.put_timeout = int(app.config.get('AUDIT_QUEUE_PUT_TIMEOUT_MS', 0)) / 1000.0
+
+        if app.config.get('TESTING') or not app.config.get('AUDIT_ASYNC_ENABLED', True):
+            app.logger.info("Аудит пишется синхронно")
+            return
+
+        self._queue = queue.Queue(maxsize=int(app.config.get('AUDIT_QUEUE_SIZE', 10000)))
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    @property
+    def is_async(self) -> bool:
+        """Работает ли фоновая запись."""
+        return self._queue is not None
+
+    def submit(self, action: str, staff_id: Optional[int] = None,
+               table_affected: Optional[int] = None, order_affected: Optional[int] = None,
+               details: Optional[Dict[str, Any]] = None, ip_address: Optional[str] = None) -> bool:
+        """
+        Постановка записи аудита в очередь.
+
+        Returns:
+            bool: False, если запись отброшена из-за переполнения очереди
+        """
+        row = {
+            'action': action,
+            'staff_id': staff_id,
+            'table_affected': table_affected,
+            'order_affected': order_affected,
+            'details': details,
+            'ip_address': ip_address,
+            # Время события, а не вставки пачки
+            'created_at': datetime.now(timezone.utc),
+        }
+
+        if not self.is_async:
+            self._write([row])
+            return True
+
+        try:
+            if self.put_timeout > 0:
+                self._queue.put(row, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            now = time.monotonic()
+            if now - self._last_drop_warning > 10:
+                self._last_drop_warning = now
+                self.app.logger.warning(f"Audit queue full, dropped records: {self.dropped}")
+            return False
+
+    def flush(self) -> None:
+        """Запись всего, что накопилось в очереди (CLI, остановка приложения)."""
+        if not self.is_async:
+            return
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return
+            self._write(batch)
+
+    def shutdown(self) -> None:
+        """Остановка потока с записью остатка очереди."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Счетчики записи аудита."""
+        return {
+            'async': self.is_async,
+            'queued': self._queue.qsize() if self.is_async else 0,
+            'capacity': self._queue.maxsize if self.is_async else 0,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'batches': self.batches,
+        }
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+
+    def _collect(self) -> List[Dict[str, Any]]:
+        """Ожидание пачки: batch_size записей или истечение flush_interval."""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self, limit: int) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        """Вставка пачки одним INSERT; почасовые агрегаты - отдельной транзакцией после нее."""
+        from app.models import AuditLog, AuditStatHourly
+
+        for row in batch:
+            row['details'] = AuditLog.normalize_details(row['details'])
+
+        with self._flush_lock, self.app.app_context():
+            try:
+                db.session.execute(sa.insert(AuditLog), batch)
+                db.session.commit()
+                self.written += len(batch)
+                self.batches += 1
+            except Exception as e:
+                db.session.rollback()
+                self.failed += len(batch)
+                self.app.logger.error(f"Failed to write {len(batch)} audit records: {e}")
+                db.session.remove()
+                return
+
+            # Ошибка агрегатов не должна терять записи аудита: они уже сохранены,
+            # а агрегаты восстанавливает flask audit rollup
+            try:
+                AuditStatHourly.add_rows(batch)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Failed to update audit hourly stats for {len(batch)} records: {e}")
+            finally:
+                db.session.remove()
+
+
+# Глобальный экземпляр записи аудита
+audit_writer = AuditWriter()
@@ -0,0 +1,187 @@
+"""Кэш проверки бонусных карт для /api/bonus-cards/check.
+
+Планшет проверяет карту по мере ввода номера, поэтому на каждый запрос
+раньше уходили поиск карты в БД и ``is_valid()`` с возможным commit.
+Теперь по номеру карты в памяти процесса хранится снимок: активность,
+окно действия (activated_at/deactivated_at) и готовый словарь ответа.
+Срок действия проверяется по снимку на каждый запрос, поэтому истекшая
+карта отклоняется сразу, без записи в БД; флаг is_active таким картам
+выставляет ночная задача одним UPDATE (``BonusCard.deactivate_expired``).
+
+Отсутствующие номера тоже кэшируются, на ``BONUS_CARD_NEGATIVE_TTL_SECONDS``:
+перебор номеров не превращается в поток запросов к БД. Снимок
+сбрасывается при создании, изменении и удалении карты (события
+SQLAlchemy, после commit); в других воркерах - не позже чем через TTL.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, Optional, Set, Tuple
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from flask import Flask
+
+
+@dataclass(frozen=True)
+class CardValidity:
+    """Снимок карты для проверки без обращения к БД."""
+
+    id: int
+    card_number: str
+    is_active: bool
+    valid_from: Optional[date]
+    valid_until: Optional[date]
+    data: Dict[str, Any]  # BonusCard.to_dict()
+
+    def invalidity_reason(self, today: Optional[date] = None) -> Optional[str]:
+        """Причина невалидности на дату (None - карта валидна)."""
+        from app.models.bonus_card import card_invalidity_reason
+        return card_invalidity_reason(self.is_active, self.valid_from, self.valid_until, today)
+
+    def is_valid(self, today: Optional[date] = None) -> bool:
+        return self.invalidity_reason(today) is None
+
+
+# Отметка "карты нет" в кэше
+_MISSING = object()
+
+
+class BonusCardCache:
+    """Снимки бонусных карт по номеру, включая отрицательные."""
+
+    def __init__(self, ttl: float = 60.0, negative_ttl: float = 15.0, max_entries: int = 5000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.app: Optional[Flask] = None
+        self._entries: Dict[str, Tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    def init_app(self, app: Flask) -> None:
+        """Настройки и подписка на изменения карт."""
+        from app.models import BonusCard
+
+        self.ttl = float(app.config.get('BONUS_CARD_CACHE_TTL_SECONDS', 60))
+        self.negative_ttl = float(app.config.get('BONUS_CARD_NEGATIVE_TTL_SECONDS', 15))
+        self.max_entries = int(app.config.get('BONUS_CARD_CACHE_MAX_ENTRIES', 5000))
+
+        if not sa.event.contains(BonusCard, 'after_update', self._on_card_changed):
+            sa.event.listen(BonusCard, 'after_insert', self._on_card_changed)
+            sa.event.listen(BonusCard, 'after_update', self._on_card_changed)
+            sa.event.listen(BonusCard, 'after_delete', self._on_card_changed)
+            sa.event.listen(so.Session, 'after_commit', self._on_commit)
+            sa.event.listen(so.Session, 'after_rollback', self._on_rollback)
+
+        if app.config.get('TESTING'):
+            return
+
+        from app import scheduler
+        from apscheduler.triggers.cron import CronTrigger
+
+        self.app = app
+        scheduler.add_job(
+            func=self._deactivate_expired,
+            trigger=CronTrigger(hour=0, minute=5),
+            id='bonus_card_expiry',
+            name='Bonus card expiry',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+        if not scheduler.running:
+            scheduler.start()
+
+    def _deactivate_expired(self) -> None:
+        from app import db
+        from app.models import BonusCard
+
+        with self.app.app_context():
+            try:
+                count = BonusCard.deactivate_expired()
+                if count:
+                    self.app.logger.info(f"Deactivated {count} expired bonus cards")
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Bonus card expiry failed: {e}")
+            finally:
+                db.session.remove()
+
+    def get(self, card_number: str) -> Optional[CardValidity]:
+        """Снимок карты по номеру; None, если карты нет."""
+        now = time.monotonic()
+        entry = self._entries.get(card_number)
+        if entry is not None and entry[1] > now:
+            if entry[0] is _MISSING:
+                self.negative_hits += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        snapshot = self._load(card_number)
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            if snapshot is None:
+                self._entries[card_number] = (_MISSING, now + self.negative_ttl)
+            else:
+                self._entries[card_number] = (snapshot, now + self.ttl)
+        return snapshot
+
+    @staticmethod
+    def _load(card_number: str) -> Optional[CardValidity]:
+        from app.models import BonusCard
+
+        card = BonusCard.find_by_card_number(card_number)
+        if card is None:
+            return None
+        return CardValidity(
+            id=card.id,
+            card_number=card.card_number,
+            is_active=card.is_active,
+            valid_from=card.activated_at,
+            valid_until=card.deactivated_at,
+            data=card.to_dict(),
+        )
+
+    def invalidate(self, card_number: Optional[str] = None) -> None:
+        """Сброс одного номера или всего кэша."""
+        with self._lock:
+            if card_number is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(card_number, None)
+
+    def _on_card_changed(self, mapper, connection, target) -> None:
+        # Старый и новый номер: при смене номера сбрасываются оба
+        numbers = {target.card_number}
+        numbers.update(sa.inspect(target).attrs.card_number.history.deleted or ())
+        for card_number in numbers:
+            self.invalidate(card_number)
+        session = so.object_session(target)
+        if session is not None:
+            session.info.setdefault('bonus_card_changed', set()).update(numbers)
+
+    def _on_commit(self, session) -> None:
+        changed: Set[str] = session.info.pop('bonus_card_changed', None)
+        if changed:
+            for card_number in changed:
+                self.invalidate(card_number)
+
+    def _on_rollback(self, session) -> None:
+        session.info.pop('bonus_card_changed', None)
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики попаданий и размер кэша."""
+        return {'entries': len(self._entries), 'hits': self.hits, 'negative_hits': self.negative_hits,
+                'misses': self.misses}
+
+
+# Глобальный экземпляр
+bonus_card_cache = BonusCardCache()
@@ -0,0 +1,87 @@
+"""Фильтр подозрительного содержимого запросов с литеральным префильтром.
+
+У каждого правила есть литерал-триггер (``union``, ``<script``, ``../``) и
+заранее скомпилированный проверочный шаблон. Поле приводится к нижнему
+регистру один раз, затем триггеры ищутся быстрым поиском подстроки на C;
+регулярное выражение запускается только для правил, чей триггер найден.
+Вместо ``.*`` между ключевыми словами стоит ограниченное окно
+``[^\\n]{0,N}``: проверка остается линейной и не уходит в катастрофический
+откат на больших телах. Тело запроса сканируется как bytes кусками с
+перекрытием и только до ``max_body_bytes``.
+
+Одна общая альтернация всех шаблонов в ``re`` оказалась медленнее: CPython
+не оптимизирует альтернацию литералов и пробует каждую ветку на каждой
+позиции (см. ``scripts/content_filter_benchmark.py``).
+"""
+
+import re
+from typing import Iterable, List, Optional, Tuple
+
+# (имя правила, литерал-триггер, проверочный шаблон); {gap} - окно в пределах строки
+RULES: List[Tuple[str, str, Optional[str]]] = [
+    ('xss_script', '<script', r'<script[^>\n]{0,{gap}}>[^\n]{0,{gap}}?</script'),
+    ('sql_union', 'union', r'union[^\n]{0,{gap}}?select'),
+    ('sql_drop', 'drop', r'drop[^\n]{0,{gap}}?table'),
+    ('code_exec', 'exec', r'exec\s{0,16}\('),
+    ('path_traversal', '../', None),
+    ('file_access', '/etc/passwd', None),
+    ('iframe', '<iframe', None),
+    ('js_scheme', 'javascript:', None),
+    ('vbs_scheme', 'vbscript:', None),
+    ('onload', 'onload', r'onload\s{0,16}='),
+    ('onerror', 'onerror', r'onerror\s{0,16}='),
+]
+
+
+class ContentFilter:
+    """Скомпилированный набор правил и сканирование полей запроса."""
+
+    def __init__(self, rules: Iterable[Tuple[str, str, Optional[str]]] = RULES, gap: int = 256,
+                 max_body_bytes: int = 64 * 1024, chunk_bytes: int = 16 * 1024):
+        self.gap = gap
+        self.max_body_bytes = max_body_bytes
+        # Перекрытие кусков: совпадение на границе не теряется
+        self.overlap = gap * 2 + 64
+        self.chunk_bytes = max(chunk_bytes, self.overlap * 2)
+
+        # Для правил без шаблона достаточно найти триггер
+        self.text_rules = []
+        self.bytes_rules = []
+        for name, trigger, pattern in rules:
+            verify = pattern.replace('{gap}', str(gap)) if pattern else None
+            self.text_rules.append((name, trigger, re.compile(verify) if verify else None))
+            self.bytes_rules.append((name, trigger.encode('ascii'),
+                                     re.compile(verify.encode('ascii')) if verify else None))
+
+    @staticmethod
+    def _match(rules, lowered) -> Optional[str]:
+        for name, trigger, verify in rules:
+            if trigger in lowered and (verify is None or verify.search(lowered)):
+                return name
+        return None
+
+    def scan_text(self, text: str) -> Optional[str]:
+        """Имя сработавшего правила или None."""
+        if not text:
+            return None
+        return self._match(self.text_rules, text.lower())
+
+    def scan_fields(self, fields: Iterable[str]) -> Optional[str]:
+        """Короткие поля (путь, значения параметров, заголовки) - одним проходом."""
+        return self.scan_text('\n'.join(field for field in fields if field))
+
+    def scan_body(self, body: bytes) -> Optional[str]:
+        """Тело запроса кусками по chunk_bytes с перекрытием, не дальше max_body_bytes."""
+        if not body:
+            return None
+        view = memoryview(body)[:self.max_body_bytes]
+        start = 0
+        while start < len(view):
+            end = min(start + self.chunk_bytes, len(view))
+            rule = self._match(self.bytes_rules, view[start:end].tobytes().lower())
+            if rule:
+                return rule
+            if end == len(view):
+                break
+            start = end - self.overlap
+        return None
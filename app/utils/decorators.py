@@ -91,8 +91,8 @@ def audit_action(action: str, table_affected: bool = False, order_affected: bool
                 # Выполнение функции
                 result = f(*args, **kwargs)
                 
-                # Логирование действия
-                from app.models import AuditLog
+                # Логирование действия (через очередь фоновой записи)
+                from app.utils.audit_writer import audit_writer
                 
                 # Получение данных для логирования
                 staff_id = current_user.id if current_user.is_authenticated else None
@@ -134,7 +134,7 @@ def audit_action(action: str, table_affected: bool = False, order_affected: bool
                     details['result'] = result
                 
                 # Создание записи аудита
-                AuditLog.log_action(
+                audit_writer.submit(
                     action=action,
                     staff_id=staff_id,
                     table_affected=table_id,
@@ -147,7 +147,7 @@ def audit_action(action: str, table_affected: bool = False, order_affected: bool
                 
             except Exception as e:
                 # Логирование ошибки
-                from app.models import AuditLog
+                from app.utils.audit_writer import audit_writer
                 
                 details = {
                     'endpoint': request.endpoint,
@@ -157,7 +157,7 @@ def audit_action(action: str, table_affected: bool = False, order_affected: bool
                     'result_status': 'error'
                 }
                 
-                AuditLog.log_action(
+                audit_writer.submit(
                     action=f"{action}_error",
                     staff_id=current_user.id if current_user.is_authenticated else None,
                     details=details,
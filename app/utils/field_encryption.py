@@ -0,0 +1,183 @@
+"""Шифрование полей моделей на стороне приложения (AES-256-GCM).
+
+Раньше каждое чтение зашифрованного поля бонусной карты было отдельным
+``SELECT pgp_sym_decrypt(...)``, каждая запись - ``pgp_sym_encrypt``.
+Теперь шифрование и расшифровка идут в процессе, без обращения к БД.
+
+Формат значения: ``b'FE'`` + номер ключа (1 байт) + nonce (12 байт) +
+шифртекст с тегом. Первый байт пакета OpenPGP всегда >= 0x80, поэтому
+старые значения pgcrypto отличаются по префиксу и до миграции читаются
+прежним способом. В AAD входит имя колонки: значение одного поля нельзя
+подставить в другое.
+
+Ключи - ``FIELD_ENCRYPTION_KEYS`` ("2:<base64>,1:<base64>"), новым
+значениям достается ``FIELD_ENCRYPTION_ACTIVE_KEY`` (по умолчанию
+наибольший номер); старые ключи остаются для чтения. Если список не
+задан, ключ 1 выводится из ``ENCRYPTION_KEY`` через HKDF. После смены
+активного ключа ``python manage.py reencrypt-fields`` перешифровывает
+старые значения (``needs_reencrypt``), после чего старый ключ можно убрать.
+
+Расшифрованные значения запоминаются на время запроса (``g``), а
+``decrypt_many`` расшифровывает страницу значений за один проход.
+"""
+
+import base64
+import os
+from typing import Dict, Iterable, List, Optional
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from flask import Flask, g, has_app_context
+
+MAGIC = b'FE'
+NONCE_SIZE = 12
+HEADER_SIZE = len(MAGIC) + 1 + NONCE_SIZE
+
+
+class FieldEncryptionError(Exception):
+    """Значение не удалось зашифровать или расшифровать."""
+
+
+def derive_key(secret: str) -> bytes:
+    """Ключ AES-256 из ENCRYPTION_KEY (ключ номер 1 по умолчанию)."""
+    return HKDF(
+        algorithm=hashes.SHA256(), length=32, salt=None, info=b'deniz-field-encryption-v1'
+    ).derive(secret.encode('utf-8'))
+
+
+def parse_keys(value: str) -> Dict[int, bytes]:
+    """Разбор "2:<base64>,1:<base64>" в {номер: ключ}."""
+    keys = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        version, _, encoded = item.partition(':')
+        key = base64.urlsafe_b64decode(encoded.strip() + '=' * (-len(encoded.strip()) % 4))
+        if len(key) != 32:
+            raise ValueError(f"Field encryption key {version} must be 32 bytes")
+        keys[int(version)] = key
+    return keys
+
+
+def is_encrypted(value: Optional[bytes]) -> bool:
+    """Значение в формате приложения (а не pgcrypto)."""
+    return value is not None and bytes(value[:len(MAGIC)]) == MAGIC
+
+
+class FieldEncryption:
+    """AEAD-шифрование полей с версиями ключей и памятью на время запроса."""
+
+    def __init__(self):
+        self._ciphers: Dict[int, AESGCM] = {}
+        self.active_version: Optional[int] = None
+
+    def init_app(self, app: Flask) -> None:
+        """Ключи из конфигурации."""
+        keys_value = app.config.get('FIELD_ENCRYPTION_KEYS')
+        if keys_value:
+            keys = parse_keys(keys_value)
+        elif app.config.get('ENCRYPTION_KEY'):
+            keys = {1: derive_key(app.config['ENCRYPTION_KEY'])}
+        else:
+            keys = {}
+        if any(not 0 < version < 256 for version in keys):
+            raise ValueError("Field encryption key numbers must be in 1..255")
+
+        self._ciphers = {version: AESGCM(key) for version, key in keys.items()}
+        active = app.config.get('FIELD_ENCRYPTION_ACTIVE_KEY')
+        self.active_version = int(active) if active else (max(keys) if keys else None)
+        if self.active_version is not None and self.active_version not in self._ciphers:
+            raise ValueError(f"Active field encryption key {self.active_version} is not configured")
+        if self.active_version is None:
+            app.logger.warning("Ключи шифрования полей не заданы (FIELD_ENCRYPTION_KEYS / ENCRYPTION_KEY)")
+
+    @staticmethod
+    def _aad(context: str) -> bytes:
+        return context.encode('utf-8')
+
+    def encrypt(self, value: Optional[str], context: str) -> Optional[bytes]:
+        """
+        Шифрование строки активным ключом.
+
+        Args:
+            value: Открытый текст (None/пустая строка -> None)
+            context: Имя поля ("таблица.колонка"), входит в AAD
+        """
+        if not value:
+            return None
+        if self.active_version is None:
+            raise FieldEncryptionError("Field encryption key is not configured")
+        nonce = os.urandom(NONCE_SIZE)
+        ciphertext = self._ciphers[self.active_version].encrypt(nonce, value.encode('utf-8'), self._aad(context))
+        encrypted = MAGIC + bytes([self.active_version]) + nonce + ciphertext
+        self._memo()[(context, encrypted)] = value
+        return encrypted
+
+    def _decrypt(self, value: bytes, context: str) -> str:
+        if len(value) < HEADER_SIZE + 16:
+            raise FieldEncryptionError(f"Truncated value of {context}")
+        cipher = self._ciphers.get(value[len(MAGIC)])
+        if cipher is None:
+            raise FieldEncryptionError(f"Unknown field encryption key {value[len(MAGIC)]}")
+        try:
+            return cipher.decrypt(value[len(MAGIC) + 1:HEADER_SIZE], value[HEADER_SIZE:],
+                                  self._aad(context)).decode('utf-8')
+        except (InvalidTag, UnicodeDecodeError):
+            raise FieldEncryptionError(f"Failed to decrypt {context}")
+
+    @staticmethod
+    def _memo() -> Dict:
+        # Память расшифровок на время запроса; вне контекста приложения - одноразовая
+        if not has_app_context():
+            return {}
+        memo = g.get('_field_decryption_memo')
+        if memo is None:
+            memo = g._field_decryption_memo = {}
+        return memo
+
+    def decrypt(self, value: Optional[bytes], context: str) -> Optional[str]:
+        """Расшифровка значения формата приложения (None -> None)."""
+        if value is None:
+            return None
+        value = bytes(value)
+        memo = self._memo()
+        key = (context, value)
+        if key not in memo:
+            memo[key] = self._decrypt(value, context)
+        return memo[key]
+
+    def decrypt_many(self, values: Iterable[Optional[bytes]], context: str) -> List[Optional[str]]:
+        """
+        Расшифровка набора значений одного поля за один проход (с общей памятью запроса).
+
+        Значения pgcrypto и нерасшифровываемые значения дают None - их
+        обрабатывает (и логирует) чтение поля модели.
+        """
+        memo = self._memo()
+        result = []
+        for value in values:
+            if value is None or not is_encrypted(value):
+                result.append(None)
+                continue
+            key = (context, bytes(value))
+            if key not in memo:
+                try:
+                    memo[key] = self._decrypt(key[1], context)
+                except FieldEncryptionError:
+                    result.append(None)
+                    continue
+            result.append(memo[key])
+        return result
+
+    def needs_reencrypt(self, value: Optional[bytes]) -> bool:
+        """Значение зашифровано не активным ключом (или еще pgcrypto)."""
+        if value is None:
+            return False
+        return not is_encrypted(value) or value[len(MAGIC)] != self.active_version
+
+
+# Глобальный экземпляр
+field_encryption = FieldEncryption()
@@ -0,0 +1,381 @@
+"""Общий список блокировок IP с истечением и поддержкой подсетей.
+
+Одна служба вместо множества ``blocked_ips`` в SecurityMiddleware и словаря
+``login_attempts`` в auth.py. Записи хранятся в общем хранилище (Redis,
+файл SQLite или память процесса - ``IP_BLOCKLIST_STORAGE_URL``), поэтому
+блокировка видна всем воркерам. У каждой записи есть срок (по умолчанию
+настройка ``block_duration`` в минутах); истекшие записи не действуют и
+вычищаются при синхронизации.
+
+Каждый воркер держит локальный индекс по длине префикса: для каждой
+используемой длины префикса - словарь "адрес сети -> запись". Проверка IP -
+по одному поиску в словаре на каждую длину префикса (обычно /32 и пара
+подсетей), от длинных к коротким. Индекс перечитывается, когда в хранилище
+меняется номер версии (проверка не чаще ``IP_BLOCKLIST_SYNC_SECONDS``).
+"""
+
+import ipaddress
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import Flask, current_app
+
+# Область блокировки: all - весь сайт, login - только вход
+SCOPES = ('all', 'login')
+
+
+class MemoryStore:
+    """Записи в памяти процесса (одиночный воркер, разработка)."""
+
+    def __init__(self):
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._failures: Dict[str, Tuple[int, float]] = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def version(self) -> int:
+        return self._version
+
+    def load(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._entries.values())
+
+    def put(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[entry['network']] = entry
+            self._version += 1
+
+    def delete(self, networks: List[str]) -> int:
+        with self._lock:
+            removed = sum(1 for network in networks if self._entries.pop(network, None) is not None)
+            if removed:
+                self._version += 1
+            return removed
+
+    def add_failure(self, ip: str, window: float, now: float) -> int:
+        with self._lock:
+            count, window_end = self._failures.get(ip, (0, 0.0))
+            if window_end <= now:
+                count, window_end = 0, now + window
+            self._failures[ip] = (count + 1, window_end)
+            # Не даем словарю расти: выбрасываем истекшие окна
+            if len(self._failures) > 10000:
+                self._failures = {key: value for key, value in self._failures.items() if value[1] > now}
+            return count + 1
+
+    def clear_failures(self, ip: str) -> None:
+        with self._lock:
+            self._failures.pop(ip, None)
+
+
+class RedisStore:
+    """Записи в хеше Redis, счетчики неудачных входов - ключи с TTL."""
+
+    def __init__(self, url: str, prefix: str = 'ipblock'):
+        import redis
+        self.client = redis.from_url(url)
+        self.client.ping()
+        self.entries_key = f'{prefix}:entries'
+        self.version_key = f'{prefix}:version'
+        self.failure_prefix = f'{prefix}:fail'
+
+    def version(self) -> int:
+        return int(self.client.get(self.version_key) or 0)
+
+    def load(self) -> List[Dict[str, Any]]:
+        return [json.loads(value) for value in self.client.hvals(self.entries_key)]
+
+    def put(self, entry: Dict[str, Any]) -> None:
+        pipe = self.client.pipeline()
+        pipe.hset(self.entries_key, entry['network'], json.dumps(entry))
+        pipe.incr(self.version_key)
+        pipe.execute()
+
+    def delete(self, networks: List[str]) -> int:
+        if not networks:
+            return 0
+        removed = self.client.hdel(self.entries_key, *networks)
+        if removed:
+            self.client.incr(self.version_key)
+        return removed
+
+    def add_failure(self, ip: str, window: float, now: float) -> int:
+        key = f'{self.failure_prefix}:{ip}'
+        count = int(self.client.incr(key))
+        if count == 1:
+            # Окно считается от первой неудачной попытки
+            self.client.expire(key, int(window))
+        return count
+
+    def clear_failures(self, ip: str) -> None:
+        self.client.delete(f'{self.failure_prefix}:{ip}')
+
+
+class SQLiteStore:
+    """Записи в файле SQLite (WAL) - общий для воркеров одной машины."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS ip_blocklist (network TEXT PRIMARY KEY, data TEXT NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS ip_block_failures '
+                     '(ip TEXT PRIMARY KEY, count INTEGER NOT NULL, window_end REAL NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS ip_blocklist_meta (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)')
+        conn.execute('INSERT OR IGNORE INTO ip_blocklist_meta (id, version) VALUES (1, 0)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def version(self) -> int:
+        return self._connect().execute('SELECT version FROM ip_blocklist_meta WHERE id = 1').fetchone()[0]
+
+    def load(self) -> List[Dict[str, Any]]:
+        return [json.loads(row[0]) for row in self._connect().execute('SELECT data FROM ip_blocklist')]
+
+    def put(self, entry: Dict[str, Any]) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('INSERT INTO ip_blocklist (network, data) VALUES (?, ?) '
+                         'ON CONFLICT(network) DO UPDATE SET data = excluded.data',
+                         (entry['network'], json.dumps(entry)))
+            conn.execute('UPDATE ip_blocklist_meta SET version = version + 1 WHERE id = 1')
+
+    def delete(self, networks: List[str]) -> int:
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            removed = conn.executemany('DELETE FROM ip_blocklist WHERE network = ?',
+                                       [(network,) for network in networks]).rowcount
+            if removed:
+                conn.execute('UPDATE ip_blocklist_meta SET version = version + 1 WHERE id = 1')
+        return removed
+
+    def add_failure(self, ip: str, window: float, now: float) -> int:
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM ip_block_failures WHERE window_end <= ?', (now,))
+            conn.execute('INSERT INTO ip_block_failures (ip, count, window_end) VALUES (?, 1, ?) '
+                         'ON CONFLICT(ip) DO UPDATE SET count = count + 1', (ip, now + window))
+            return conn.execute('SELECT count FROM ip_block_failures WHERE ip = ?', (ip,)).fetchone()[0]
+
+    def clear_failures(self, ip: str) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM ip_block_failures WHERE ip = ?', (ip,))
+
+
+class IPBlocklist:
+    """Блокировки IP и подсетей с истечением срока."""
+
+    def __init__(self):
+        self.store = MemoryStore()
+        self.sync_interval = 1.0
+        # (индекс, длины префиксов) - публикуется одним присваиванием,
+        # чтобы lookup без блокировки не видел наполовину собранный индекс
+        self._table: Tuple[Dict[Tuple[int, int], Dict[int, Dict[str, Any]]], Dict[int, List[int]]] = (
+            {}, {4: [], 6: []}
+        )
+        self._version = -1
+        self._next_sync = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app: Flask) -> None:
+        """Выбор общего хранилища."""
+        self.sync_interval = float(app.config.get('IP_BLOCKLIST_SYNC_SECONDS', 1.0))
+        url = app.config.get('IP_BLOCKLIST_STORAGE_URL') or app.config.get('RATELIMIT_STORAGE_URL') or 'memory://'
+        try:
+            if url.startswith('redis'):
+                self.store = RedisStore(url)
+            elif url.startswith('sqlite:///'):
+                path = url[len('sqlite:///'):] or os.path.join(app.instance_path, 'ip_blocklist.sqlite3')
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self.store = SQLiteStore(path)
+            else:
+                self.store = MemoryStore()
+            app.logger.info(f"Хранилище блокировок IP: {url.split('://')[0]}")
+        except Exception as e:
+            self.store = MemoryStore()
+            app.logger.warning(f"Хранилище блокировок IP недоступно, используется память процесса: {e}")
+        self._version = -1
+        self._next_sync = 0.0
+
+    # --- проверка ---
+
+    def lookup(self, ip: str, scope: str = 'all') -> Optional[Dict[str, Any]]:
+        """
+        Действующая блокировка, под которую попадает IP.
+
+        Args:
+            scope: all - проверка для всего сайта (блокировки входа не учитываются),
+                login - проверка на странице входа (учитываются все)
+        """
+        if not ip:
+            return None
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+
+        self._sync()
+        index, prefixes = self._table
+        now = time.time()
+        value = int(address)
+        bits = address.max_prefixlen
+        for prefixlen in prefixes[address.version]:
+            entry = index.get((address.version, prefixlen), {}).get(value >> (bits - prefixlen))
+            if entry and entry['expires_at'] > now and (entry['scope'] == 'all' or scope == 'login'):
+                return entry
+        return None
+
+    def is_blocked(self, ip: str, scope: str = 'all') -> bool:
+        return self.lookup(ip, scope) is not None
+
+    # --- изменение ---
+
+    def block(self, target: str, minutes: Optional[int] = None, reason: str = '',
+              source: str = 'manual', scope: str = 'all', attempts: int = 0) -> Dict[str, Any]:
+        """
+        Блокировка IP или подсети (``10.0.0.0/24``).
+
+        Args:
+            minutes: Срок; по умолчанию настройка block_duration
+        """
+        network = ipaddress.ip_network(target, strict=False)
+        if scope not in SCOPES:
+            raise ValueError(f"Неизвестная область блокировки: {scope}")
+        if minutes is None:
+            minutes = self.default_minutes()
+
+        now = time.time()
+        entry = {
+            'network': str(network),
+            'reason': reason,
+            'source': source,
+            'scope': scope,
+            'attempts': attempts,
+            'created_at': now,
+            'expires_at': now + minutes * 60,
+        }
+        self.store.put(entry)
+        self._apply(entry)
+        current_app.logger.warning(f"IP blocked: {entry['network']} for {minutes} min ({source}: {reason})")
+        return entry
+
+    def unblock(self, target: str) -> bool:
+        """Снятие блокировки IP или подсети."""
+        try:
+            network = str(ipaddress.ip_network(target, strict=False))
+        except ValueError:
+            return False
+        removed = self.store.delete([network])
+        self._next_sync = 0.0
+        if removed:
+            current_app.logger.info(f"IP unblocked: {network}")
+        return bool(removed)
+
+    def register_failure(self, ip: str, max_attempts: int, window: int = 3600,
+                         minutes: Optional[int] = None) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """
+        Неудачная попытка входа; при достижении max_attempts за окно - блокировка входа.
+
+        Returns:
+            (count, entry): число попыток в окне и запись блокировки, если она создана
+        """
+        count = self.store.add_failure(ip, window, time.time())
+        if count < max_attempts:
+            return count, None
+        self.store.clear_failures(ip)
+        entry = self.block(ip, minutes, reason=f'{count} неудачных попыток входа',
+                           source='login', scope='login', attempts=count)
+        return count, entry
+
+    def clear_failures(self, ip: str) -> None:
+        self.store.clear_failures(ip)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Действующие блокировки (для администратора)."""
+        self._sync(force=True)
+        index, _ = self._table
+        now = time.time()
+        return sorted(
+            (entry for table in index.values() for entry in table.values() if entry['expires_at'] > now),
+            key=lambda entry: entry['expires_at']
+        )
+
+    @staticmethod
+    def default_minutes() -> int:
+        from app.models import SystemSetting
+        try:
+            return int(SystemSetting.get_setting('block_duration', '30'))
+        except (TypeError, ValueError):
+            return 30
+
+    # --- локальный индекс ---
+
+    def _sync(self, force: bool = False) -> None:
+        now = time.time()
+        if not force and now < self._next_sync:
+            return
+        self._next_sync = now + self.sync_interval
+        try:
+            version = self.store.version()
+            if version == self._version and not force:
+                return
+            entries = self.store.load()
+        except Exception as e:
+            current_app.logger.warning(f"IP blocklist sync failed: {e}")
+            return
+
+        expired = [entry['network'] for entry in entries if entry['expires_at'] <= now]
+        if expired:
+            try:
+                self.store.delete(expired)
+            except Exception:
+                pass
+
+        index: Dict[Tuple[int, int], Dict[int, Dict[str, Any]]] = {}
+        prefixes: Dict[int, List[int]] = {4: [], 6: []}
+        for entry in entries:
+            if entry['expires_at'] > now:
+                self._add(index, prefixes, entry)
+
+        with self._lock:
+            self._table = (index, prefixes)
+            self._version = version
+
+    def _apply(self, entry: Dict[str, Any]) -> None:
+        """Добавление записи в опубликованный индекс: правится копия, затем подменяется."""
+        with self._lock:
+            index, prefixes = self._table
+            index = {key: dict(table) for key, table in index.items()}
+            prefixes = dict(prefixes)
+            self._add(index, prefixes, entry)
+            self._table = (index, prefixes)
+
+    @staticmethod
+    def _add(index: Dict[Tuple[int, int], Dict[int, Dict[str, Any]]],
+             prefixes: Dict[int, List[int]], entry: Dict[str, Any]) -> None:
+        network = ipaddress.ip_network(entry['network'])
+        key = (network.version, network.prefixlen)
+        value = int(network.network_address) >> (network.max_prefixlen - network.prefixlen)
+        index.setdefault(key, {})[value] = entry
+        if network.prefixlen not in prefixes[network.version]:
+            # От длинных префиксов к коротким; список заменяется, а не дополняется
+            prefixes[network.version] = sorted(prefixes[network.version] + [network.prefixlen], reverse=True)
+
+
+# Глобальный список блокировок
+ip_blocklist = IPBlocklist()
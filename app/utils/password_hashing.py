@@ -0,0 +1,146 @@
+"""Хеширование паролей Argon2 в отдельном ограниченном пуле потоков.
+
+Проверка пароля - самая тяжелая по CPU операция приложения (десятки
+мегабайт памяти и сотни миллисекунд на вызов). Вычисление идет в пуле из
+``PASSWORD_HASH_WORKERS`` потоков (argon2-cffi отпускает GIL), поэтому
+одновременный вход десятка сотрудников при пересменке занимает не больше
+этого числа ядер, а обработка заказов в остальных потоках продолжается.
+Очередь ограничена: если за ``PASSWORD_HASH_WAIT_SECONDS`` место не
+освободилось, вызов получает ``PasswordHashingBusy``; с одного ключа
+(IP) одновременно идет не больше ``PASSWORD_HASH_MAX_PER_KEY`` проверок.
+
+Параметры Argon2 (``ARGON2_*``) подбираются под CPU сервера скриптом
+``scripts/argon2_tune.py``. Хеши со старыми параметрами пересчитываются
+при успешном входе.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError, VerifyMismatchError
+from flask import Flask
+
+
+class PasswordHashingBusy(Exception):
+    """Пул хеширования занят - повторить позже."""
+
+
+def default_workers() -> int:
+    """Половина ядер, но не меньше одного потока."""
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+class PasswordHashing:
+    """Общий PasswordHasher и пул потоков для hash/verify."""
+
+    def __init__(self):
+        self.hasher = PasswordHasher()
+        self.workers = default_workers()
+        self.max_pending = 16
+        self.wait_seconds = 10.0
+        self.max_per_key = 2
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+        self._in_flight: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._dummy_hash: Optional[str] = None
+
+    def init_app(self, app: Flask) -> None:
+        """Параметры Argon2 и размер пула из конфигурации."""
+        defaults = PasswordHasher()
+        self.hasher = PasswordHasher(
+            time_cost=int(app.config.get('ARGON2_TIME_COST') or defaults.time_cost),
+            memory_cost=int(app.config.get('ARGON2_MEMORY_COST') or defaults.memory_cost),
+            parallelism=int(app.config.get('ARGON2_PARALLELISM') or defaults.parallelism),
+        )
+        self.workers = int(app.config.get('PASSWORD_HASH_WORKERS') or default_workers())
+        self.max_pending = int(app.config.get('PASSWORD_HASH_MAX_PENDING', 16))
+        self.wait_seconds = float(app.config.get('PASSWORD_HASH_WAIT_SECONDS', 10.0))
+        self.max_per_key = int(app.config.get('PASSWORD_HASH_MAX_PER_KEY', 2))
+
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            self._slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+            self._dummy_hash = None
+
+        app.logger.info(
+            f"Argon2: t={self.hasher.time_cost} m={self.hasher.memory_cost}KiB "
+            f"p={self.hasher.parallelism}, потоков: {self.workers}"
+        )
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='argon2')
+            return self._executor
+
+    def _run(self, key: Optional[str], func, *args):
+        """Выполнение в пуле с ожиданием результата; ограничение очереди и ключа."""
+        if key is not None:
+            with self._lock:
+                if self._in_flight.get(key, 0) >= self.max_per_key:
+                    raise PasswordHashingBusy(f"Too many concurrent password checks for {key}")
+                self._in_flight[key] = self._in_flight.get(key, 0) + 1
+        try:
+            if not self._slots.acquire(timeout=self.wait_seconds):
+                raise PasswordHashingBusy("Password hashing queue is full")
+            try:
+                return self._get_executor().submit(func, *args).result()
+            finally:
+                self._slots.release()
+        finally:
+            if key is not None:
+                with self._lock:
+                    left = self._in_flight.get(key, 1) - 1
+                    if left:
+                        self._in_flight[key] = left
+                    else:
+                        self._in_flight.pop(key, None)
+
+    def hash(self, password: str) -> str:
+        """Хеш пароля с текущими параметрами."""
+        return self._run(None, self.hasher.hash, password)
+
+    def _verify(self, password_hash: str, password: str) -> Tuple[bool, Optional[str]]:
+        try:
+            self.hasher.verify(password_hash, password)
+        except (VerifyMismatchError, VerificationError, InvalidHashError):
+            return False, None
+        # Параметры изменились - новый хеш считаем здесь же, пока пароль известен
+        if self.hasher.check_needs_rehash(password_hash):
+            return True, self.hasher.hash(password)
+        return True, None
+
+    def verify(self, password_hash: str, password: str, key: Optional[str] = None) -> Tuple[bool, Optional[str]]:
+        """
+        Проверка пароля в пуле.
+
+        Args:
+            password_hash: Сохраненный хеш
+            password: Введенный пароль
+            key: Ключ ограничения одновременных проверок (IP клиента)
+
+        Returns:
+            (valid, new_hash): new_hash - пересчитанный хеш, если параметры Argon2 изменились
+
+        Raises:
+            PasswordHashingBusy: Пул или лимит ключа заняты
+        """
+        if not password_hash:
+            return False, None
+        return self._run(key, self._verify, password_hash, password)
+
+    def verify_dummy(self, password: str, key: Optional[str] = None) -> None:
+        """Проверка против фиктивного хеша: ответ для несуществующего логина занимает столько же."""
+        if self._dummy_hash is None:
+            self._dummy_hash = self.hash('deniz-dummy-password')
+        self.verify(self._dummy_hash, password, key=key)
+
+
+# Глобальный экземпляр
+password_hashing = PasswordHashing()
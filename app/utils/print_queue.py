@@ -0,0 +1,272 @@
+"""Асинхронная очередь печати с отдельным потоком на каждый принтер.
+
+Задания хранятся в таблице ``print_jobs``, поэтому переживают перезапуск
+приложения. Каждый принтер (kitchen, bar, receipt) обслуживается своим
+потоком, который печатает задания строго по порядку: пока первое задание
+не напечатано или не исчерпало попытки, следующие ждут. Ошибки повторяются
+с экспоненциальной задержкой, статус задания отправляется официанту по
+WebSocket (событие ``print_job_status``).
+
+Задание захватывается одним условным UPDATE с арендой на
+``PRINT_QUEUE_LEASE_SECONDS``: потоки нескольких процессов (воркеры
+gunicorn, перезагрузчик отладки) не напечатают один чек дважды, а задание
+процесса, упавшего во время печати, после истечения аренды снова берется
+в работу.
+"""
+
+import atexit
+import os
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from flask import Flask
+
+from app import db
+
+PRINTERS = ('kitchen', 'bar', 'receipt')
+
+
+class PrintQueue:
+    """Очередь заданий печати и пул потоков-обработчиков."""
+
+    def __init__(self):
+        self.app: Optional[Flask] = None
+        self.poll_interval = 2.0
+        self.max_attempts = 5
+        self.retry_base_seconds = 2.0
+        self.retry_max_seconds = 60.0
+        self.lease_seconds = 120.0
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self._wakeups: Dict[str, threading.Event] = {printer: threading.Event() for printer in PRINTERS}
+        self._threads: Dict[str, threading.Thread] = {}
+        self._stop = threading.Event()
+
+    def init_app(self, app: Flask) -> None:
+        """Чтение настроек и запуск потоков-обработчиков."""
+        self.app = app
+        self.poll_interval = float(app.config.get('PRINT_QUEUE_POLL_INTERVAL', self.poll_interval))
+        self.max_attempts = int(app.config.get('PRINT_QUEUE_MAX_ATTEMPTS', self.max_attempts))
+        self.retry_base_seconds = float(app.config.get('PRINT_QUEUE_RETRY_BASE_SECONDS', self.retry_base_seconds))
+        self.retry_max_seconds = float(app.config.get('PRINT_QUEUE_RETRY_MAX_SECONDS', self.retry_max_seconds))
+        self.lease_seconds = float(app.config.get('PRINT_QUEUE_LEASE_SECONDS', self.lease_seconds))
+        # Процесс мог быть создан fork'ом после импорта модуля
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+
+        if app.config.get('TESTING') or not app.config.get('PRINT_QUEUE_ENABLED', True):
+            app.logger.info("Очередь печати работает в синхронном режиме")
+            return
+
+        self._recover_interrupted()
+
+        for printer in PRINTERS:
+            if printer in self._threads and self._threads[printer].is_alive():
+                continue
+            thread = threading.Thread(
+                target=self._worker_loop,
+                args=(printer,),
+                name=f'print-worker-{printer}',
+                daemon=True
+            )
+            self._threads[printer] = thread
+            thread.start()
+
+        atexit.register(self.shutdown)
+        app.logger.info(f"Очередь печати запущена: {', '.join(PRINTERS)}")
+
+    @property
+    def is_async(self) -> bool:
+        """Работают ли фоновые потоки."""
+        return bool(self._threads)
+
+    def enqueue(self, printer: str, content: str, job_type: str,
+                order_id: Optional[int] = None, waiter_id: Optional[int] = None,
+                payload: Optional[bytes] = None):
+        """
+        Постановка задания в очередь.
+
+        Returns:
+            PrintJob: Сохраненное задание (id можно сразу вернуть клиенту)
+        """
+        from app.models import PrintJob
+
+        if printer not in PRINTERS:
+            raise ValueError(f"Неизвестный принтер: {printer}")
+
+        job = PrintJob(
+            printer=printer,
+            job_type=job_type,
+            status='queued',
+            content=content,
+            payload=payload,
+            order_id=order_id,
+            waiter_id=waiter_id,
+            attempts=0,
+            max_attempts=self.max_attempts
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        if self.is_async:
+            self._wakeups[printer].set()
+        else:
+            # Без фоновых потоков печатаем сразу (тесты, PRINT_QUEUE_ENABLED=false);
+            # повторять некому - неудачная попытка сразу уходит в файл receipts/
+            while self._process_next(printer, sync=True) == 0:
+                pass
+
+        return job
+
+    def wake(self, printer: str) -> None:
+        """Немедленная проверка очереди принтера (например, после его восстановления)."""
+        if printer in self._wakeups:
+            self._wakeups[printer].set()
+
+    def shutdown(self) -> None:
+        """Остановка потоков-обработчиков."""
+        self._stop.set()
+        for event in self._wakeups.values():
+            event.set()
+
+    def _recover_interrupted(self) -> None:
+        """Возврат в очередь заданий с истекшей арендой (процесс остановился во время печати)."""
+        from app.models import PrintJob
+
+        expired_before = datetime.now(timezone.utc) - timedelta(seconds=self.lease_seconds)
+        with self.app.app_context():
+            try:
+                count = PrintJob.query.filter(
+                    PrintJob.status == 'printing',
+                    db.or_(PrintJob.claimed_at.is_(None), PrintJob.claimed_at < expired_before)
+                ).update({'status': 'queued', 'claimed_at': None, 'claimed_by': None},
+                         synchronize_session=False)
+                db.session.commit()
+                if count:
+                    self.app.logger.warning(f"Возвращено в очередь прерванных заданий печати: {count}")
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Не удалось восстановить очередь печати: {e}")
+
+    def _worker_loop(self, printer: str) -> None:
+        wakeup = self._wakeups[printer]
+        while not self._stop.is_set():
+            delay = self.poll_interval
+            with self.app.app_context():
+                try:
+                    delay = self._process_next(printer)
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"Print worker '{printer}' error: {e}")
+                finally:
+                    db.session.remove()
+
+            if delay > 0:
+                wakeup.wait(timeout=delay)
+            wakeup.clear()
+
+    def _process_next(self, printer: str, sync: bool = False) -> float:
+        """
+        Печать первого задания принтера.
+
+        Args:
+            printer: Принтер
+            sync: Синхронный режим без потоков: без пауз повтора, ошибка сразу завершает задание
+
+        Returns:
+            float: Сколько секунд можно ждать до следующей проверки
+        """
+        from app.models import PrintJob
+        from app.utils.print_service import PrintService
+
+        job = PrintJob.get_head(printer)
+        if not job:
+            return self.poll_interval
+
+        now = datetime.now(timezone.utc)
+        lease_expired_before = now - timedelta(seconds=self.lease_seconds)
+        if job.status == 'printing' and job.claimed_at and job.claimed_at >= lease_expired_before:
+            # Задание печатает другой обработчик - порядок печати сохраняем, ждем
+            return self.poll_interval
+        if not sync and job.next_attempt_at and job.next_attempt_at > now:
+            return min((job.next_attempt_at - now).total_seconds(), self.poll_interval)
+
+        from app.utils.printer_monitor import printer_monitor, PrinterUnavailableError
+        if not sync and printer_monitor.is_down(printer):
+            # Принтер недоступен (нет бумаги, офлайн): задание ждет в очереди, попытка не тратится
+            return max(printer_monitor.interval, self.poll_interval)
+
+        if not PrintJob.claim(job.id, self.owner, now, lease_expired_before):
+            # Задание успел захватить другой процесс
+            return self.poll_interval
+        db.session.refresh(job)
+
+        print_service = PrintService()
+        try:
+            print_service._write_to_printer(job.payload or job.content, printer)
+        except PrinterUnavailableError as e:
+            if sync:
+                return self._fail(job, print_service, e)
+            # Мониторинг отметил принтер недоступным уже после захвата - попытку не засчитываем
+            job.status = 'queued'
+            job.attempts -= 1
+            job.claimed_at = None
+            job.claimed_by = None
+            job.last_error = str(e)
+            db.session.commit()
+            return max(printer_monitor.interval, self.poll_interval)
+        except Exception as e:
+            if sync or job.attempts >= job.max_attempts:
+                return self._fail(job, print_service, e)
+
+            job.last_error = str(e)
+            backoff = min(self.retry_base_seconds * (2 ** (job.attempts - 1)), self.retry_max_seconds)
+            job.status = 'queued'
+            job.claimed_at = None
+            job.claimed_by = None
+            job.next_attempt_at = now + timedelta(seconds=backoff)
+            db.session.commit()
+            self.app.logger.warning(f"Print job #{job.id} ({printer}) attempt {job.attempts} failed, retry in {backoff:.0f}s: {e}")
+            self._notify(job)
+            return min(backoff, self.poll_interval)
+
+        job.status = 'done'
+        job.printed_at = datetime.now(timezone.utc)
+        job.last_error = None
+        if job.job_type == 'final' and job.order:
+            job.order.final_receipt_printed = True
+        db.session.commit()
+        self._notify(job)
+        return 0
+
+    def _fail(self, job, print_service, error: Exception) -> float:
+        """Задание не напечатано окончательно: статус failed и чек в файл receipts/."""
+        job.status = 'failed'
+        job.last_error = str(error)
+        db.session.commit()
+        self.app.logger.error(f"Print job #{job.id} ({job.printer}) failed after {job.attempts} attempts: {error}")
+        print_service._save_fallback(job.content, job.printer)
+        self._notify(job)
+        return 0
+
+    def _notify(self, job) -> None:
+        """Отправка статуса задания официанту по WebSocket."""
+        if not job.waiter_id:
+            return
+        try:
+            from app.websocket.event_log import emit_room_event
+            emit_room_event('print_job_status', {
+                'job_id': job.id,
+                'printer': job.printer,
+                'job_type': job.job_type,
+                'order_id': job.order_id,
+                'status': job.status,
+                'attempts': job.attempts,
+                'error': job.last_error,
+            }, f'waiter_{job.waiter_id}')
+        except Exception as e:
+            self.app.logger.error(f"Print job status notification failed: {e}")
+
+
+# Глобальный экземпляр очереди печати
+print_queue = PrintQueue()
@@ -2,9 +2,10 @@
 
 import os
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
 from flask import current_app
-from app.models import Order, OrderItem, Staff
+from app.models import Order, OrderItem
+from app.utils.receipt_templates import PrinterProfile, receipt_templates
 from escpos.printer import Network, Usb, Serial
 class PrintService:
     """Сервис для печати чеков."""
@@ -14,28 +15,29 @@ class PrintService:
         
     def _get_printer_config(self, kind: str) -> dict:
         # kind: 'kitchen' | 'bar' | 'receipt'
-        from app.models.system_setting import SystemSetting
+        # Все настройки берутся из одного кешированного запроса, а не по запросу на ключ
+        get_setting = receipt_templates.setting
         cfg = {
-            'type': SystemSetting.get_setting(f'printer_{kind}_type', 'disabled'),  # network | usb | serial | disabled
-            'code_page': int(SystemSetting.get_setting(f'printer_{kind}_code_page', '37') or 37),
-            'chars_per_line': int(SystemSetting.get_setting(f'printer_{kind}_cpl', '32') or 32),
+            'type': get_setting(f'printer_{kind}_type', 'disabled'),  # network | usb | serial | disabled
+            'code_page': int(get_setting(f'printer_{kind}_code_page', '37') or 37),
+            'chars_per_line': int(get_setting(f'printer_{kind}_cpl', '32') or 32),
         }
         if cfg['type'] == 'network':
-            cfg['ip'] = SystemSetting.get_setting(f'printer_{kind}_ip', '192.168.1.101')
-            cfg['port'] = int(SystemSetting.get_setting(f'printer_{kind}_port', '9100') or 9100)
-            cfg['timeout'] = int(SystemSetting.get_setting(f'printer_{kind}_timeout', '5') or 5)
+            cfg['ip'] = get_setting(f'printer_{kind}_ip', '192.168.1.101')
+            cfg['port'] = int(get_setting(f'printer_{kind}_port', '9100') or 9100)
+            cfg['timeout'] = int(get_setting(f'printer_{kind}_timeout', '5') or 5)
         elif cfg['type'] == 'usb':
-            cfg['vendor_id'] = int(SystemSetting.get_setting(f'printer_{kind}_usb_vid', '0'), 0) or 0x0483
-            cfg['product_id'] = int(SystemSetting.get_setting(f'printer_{kind}_usb_pid', '0'), 0) or 0x5743
-            cfg['in_ep'] = int(SystemSetting.get_setting(f'printer_{kind}_usb_in_ep', '129') or 129)  # 0x81
-            cfg['out_ep'] = int(SystemSetting.get_setting(f'printer_{kind}_usb_out_ep', '1') or 1)    # 0x01
+            cfg['vendor_id'] = int(get_setting(f'printer_{kind}_usb_vid', '0'), 0) or 0x0483
+            cfg['product_id'] = int(get_setting(f'printer_{kind}_usb_pid', '0'), 0) or 0x5743
+            cfg['in_ep'] = int(get_setting(f'printer_{kind}_usb_in_ep', '129') or 129)  # 0x81
+            cfg['out_ep'] = int(get_setting(f'printer_{kind}_usb_out_ep', '1') or 1)    # 0x01
         elif cfg['type'] == 'serial':
-            cfg['com'] = SystemSetting.get_setting(f'printer_{kind}_com', 'COM3')
-            cfg['baudrate'] = int(SystemSetting.get_setting(f'printer_{kind}_baud', '9600') or 9600)
-            cfg['bytesize'] = int(SystemSetting.get_setting(f'printer_{kind}_bytesize', '8') or 8)
-            cfg['parity'] = SystemSetting.get_setting(f'printer_{kind}_parity', 'N') or 'N'
-            cfg['stopbits'] = int(SystemSetting.get_setting(f'printer_{kind}_stopbits', '1') or 1)
-            cfg['timeout'] = int(SystemSetting.get_setting(f'printer_{kind}_timeout', '1') or 1)
+            cfg['com'] = get_setting(f'printer_{kind}_com', 'COM3')
+            cfg['baudrate'] = int(get_setting(f'printer_{kind}_baud', '9600') or 9600)
+            cfg['bytesize'] = int(get_setting(f'printer_{kind}_bytesize', '8') or 8)
+            cfg['parity'] = get_setting(f'printer_{kind}_parity', 'N') or 'N'
+            cfg['stopbits'] = int(get_setting(f'printer_{kind}_stopbits', '1') or 1)
+            cfg['timeout'] = int(get_setting(f'printer_{kind}_timeout', '1') or 1)
         return cfg
 
     def _open_printer(self, cfg: dict):
@@ -56,6 +58,13 @@ class PrintService:
             )
         return None  # disabled
     
+    def _init_printer(self, printer, cfg: dict) -> None:
+        """Инициализация принтера после подключения."""
+        # ESC @ - сброс настроек печати
+        printer._raw(b'\x1b\x40')
+        # Устанавливаем кириллицу (по умолчанию 37 = Windows-1251)
+        self._set_code_page(printer, cfg.get('code_page', 37))
+    
     def _set_code_page(self, printer, code_page: int) -> None:
         try:
             # ESC t n
@@ -116,168 +125,108 @@ class PrintService:
             current_app.logger.error(f"Final receipt print error: {e}")
             return False
     
-    def _generate_kitchen_receipt(self, order: Order, kitchen_items: List[OrderItem]) -> str:
+    def _profile(self, kind: str) -> PrinterProfile:
+        """Профиль принтера (ширина ленты и кодовая страница)."""
+        return PrinterProfile.from_config(self._get_printer_config(kind))
+    
+    def _generate_kitchen_receipt(self, order: Order, kitchen_items: List[OrderItem]) -> bytes:
         """Генерация содержимого кухонного чека."""
-        waiter = Staff.query.get(order.waiter_id)
-        
-        receipt = []
-        receipt.append("=" * 32)
-        receipt.append("КУХНЯ - DENIZ")
-        receipt.append("=" * 32)
-        receipt.append(f"Стол: {order.table.table_number} Время: {order.created_at.strftime('%H:%M')}")
-        receipt.append(f"Заказ #{order.id:04d} - КУХНЯ")
-        receipt.append("-" * 32)
-        
-        for item in kitchen_items:
-            receipt.append(f"{item.quantity}x {item.menu_item.name_ru}")
-            if item.comments:
-                receipt.append(f"- {item.comments}")
-        
-        receipt.append("-" * 32)
-        receipt.append(f"Время заказа: {order.created_at.strftime('%H:%M')}")
-        receipt.append(f"Официант: {waiter.name if waiter else 'Неизвестно'}")
-        receipt.append("=" * 32)
-        
-        return "\r\n".join(receipt)
+        return receipt_templates.get('kitchen', self._profile('kitchen')).render(order, kitchen_items)
     
-    def _generate_bar_receipt(self, order: Order, bar_items: List[OrderItem]) -> str:
+    def _generate_bar_receipt(self, order: Order, bar_items: List[OrderItem]) -> bytes:
         """Генерация содержимого барного чека."""
-        waiter = Staff.query.get(order.waiter_id)
-        
-        receipt = []
-        receipt.append("=" * 32)
-        receipt.append("БАР - DENIZ")
-        receipt.append("=" * 32)
-        receipt.append(f"Стол: {order.table.table_number} Время: {order.created_at.strftime('%H:%M')}")
-        receipt.append(f"Заказ #{order.id:04d} - БАР")
-        receipt.append("-" * 32)
-        
-        for item in bar_items:
-            receipt.append(f"{item.quantity}x {item.menu_item.name_ru}")
-            if item.comments:
-                receipt.append(f"- {item.comments}")
-        
-        receipt.append("-" * 32)
-        receipt.append(f"Время заказа: {order.created_at.strftime('%H:%M')}")
-        receipt.append(f"Официант: {waiter.name if waiter else 'Неизвестно'}")
-        receipt.append("=" * 32)
-        
-        return "\r\n".join(receipt)
+        return receipt_templates.get('bar', self._profile('bar')).render(order, bar_items)
     
-    def _generate_final_receipt(self, order: Order) -> str:
+    def _generate_final_receipt(self, order: Order) -> bytes:
         """Генерация финального чека для клиента."""
-        waiter = Staff.query.get(order.waiter_id)
-        
-        # Получаем настройки ресторана
-        from app.models.system_setting import SystemSetting
-        restaurant_address = SystemSetting.get_setting('restaurant_address', 'Адрес: [Адрес ресторана]')
-        restaurant_phone = SystemSetting.get_setting('restaurant_phone', 'Телефон: +993 12 XX-XX-XX')
-        
-        receipt = []
-        receipt.append("=" * 32)
-        receipt.append("РЕСТОРАН DENIZ")
-        receipt.append("=" * 32)
-        receipt.append(restaurant_address)
-        receipt.append(restaurant_phone)
-        receipt.append(f"Стол: {order.table.table_number}      Заказ: #{order.id}")
-        receipt.append(f"Дата: {order.created_at.strftime('%d.%m.%Y')}")
-        receipt.append(f"Время: {order.created_at.strftime('%H:%M')}")
-        receipt.append(f"Официант: {waiter.name if waiter else 'Неизвестно'}")
-        
-        # Группируем позиции по типам
-        kitchen_items = []
-        bar_items = []
-        
-        for item in order.items:
-            if item.menu_item.preparation_type == 'kitchen':
-                kitchen_items.append(item)
-            elif item.menu_item.preparation_type == 'bar':
-                bar_items.append(item)
-        
-        # Печатаем позиции кухни
-        if kitchen_items:
-            receipt.append("")  # Пустая строка перед кухней
-            receipt.append("КУХНЯ:")
-            receipt.append("-" * 32)
-            for item in kitchen_items:
-                receipt.append(f"{item.quantity}x {item.menu_item.name_ru:<20} {item.unit_price * item.quantity:>8.2f}")
-                if item.comments:
-                    receipt.append(f"   - {item.comments}")
-            receipt.append("")  # Пустая строка после кухни
-        
-        # Печатаем позиции бара
-        if bar_items:
-            receipt.append("БАР:")
-            receipt.append("-" * 32)
-            for item in bar_items:
-                receipt.append(f"{item.quantity}x {item.menu_item.name_ru:<20} {item.unit_price * item.quantity:>8.2f}")
-                if item.comments:
-                    receipt.append(f"   - {item.comments}")
-            receipt.append("")  # Пустая строка после бара
-        
-        receipt.append("-" * 32)
-        receipt.append(f"Подытог:              {order.subtotal:>8.2f}")
-        receipt.append(f"Сервисный сбор (10%): {order.service_charge:>8.2f}")
-        
-        # Промежуточный итог (подытог + сервисный сбор)
-        intermediate_total = order.subtotal + order.service_charge
-        receipt.append(f"Промежуточный итог:   {intermediate_total:>8.2f}")
-        
-        # Скидка по бонусной карте
-        if order.discount_amount and order.discount_amount > 0:
-            discount_percent = order.bonus_card.discount_percent if order.bonus_card else 0
-            receipt.append(f"Скидка карта {order.bonus_card.card_number if order.bonus_card else 'XXXXXX'}: -{order.discount_amount:>8.2f}")
-            receipt.append(f"({discount_percent}%)")
-        
-        receipt.append("-" * 32)
-        receipt.append(f"ИТОГО:                {order.total_amount:>8.2f}")
-        receipt.append("=" * 32)
-        receipt.append("Благодарим за посещение!")
-        receipt.append("=" * 32)
-        
-        return "\r\n".join(receipt)
+        return receipt_templates.get('final', self._profile('receipt')).render(order)
+    
+    def queue_kitchen_receipt(self, order: Order, kitchen_items: List[OrderItem], waiter_id: Optional[int] = None):
+        """Постановка кухонного чека в очередь печати. Возвращает PrintJob."""
+        payload = self._generate_kitchen_receipt(order, kitchen_items)
+        return self._enqueue('kitchen', payload, 'kitchen', order, waiter_id)
+    
+    def queue_bar_receipt(self, order: Order, bar_items: List[OrderItem], waiter_id: Optional[int] = None):
+        """Постановка барного чека в очередь печати. Возвращает PrintJob."""
+        payload = self._generate_bar_receipt(order, bar_items)
+        return self._enqueue('bar', payload, 'bar', order, waiter_id)
+    
+    def queue_final_receipt(self, order: Order, waiter_id: Optional[int] = None):
+        """Постановка финального чека в очередь печати. Возвращает PrintJob."""
+        payload = self._generate_final_receipt(order)
+        return self._enqueue('receipt', payload, 'final', order, waiter_id)
     
-    def _send_to_printer(self, content: str, printer_type: str) -> bool:
+    def _enqueue(self, printer_type: str, payload: bytes, job_type: str, order: Order, waiter_id: Optional[int]):
+        from app.utils.print_queue import print_queue
+        # Текст - для просмотра и файла-заглушки, байты - то, что уходит на принтер
+        content = payload.decode(self._profile(printer_type).encoding, errors='replace')
+        return print_queue.enqueue(printer_type, content, job_type=job_type, order_id=order.id,
+                                   waiter_id=waiter_id, payload=payload)
+    
+    def _send_to_printer(self, content: Union[bytes, str], printer_type: str) -> bool:
         """
         printer_type: 'kitchen' | 'bar' | 'receipt'
         """
         try:
-            cfg = self._get_printer_config(printer_type)
-            if cfg.get('type') == 'disabled':
-                raise RuntimeError("Printing disabled for this printer type")
-
-            printer = self._open_printer(cfg)
-            if not printer:
-                raise RuntimeError("Printer open failed (no config or disabled)")
-
-            # Устанавливаем кириллицу (по умолчанию 37 = Windows-1251) — для будущих кухонных тоже
-            self._set_code_page(printer, cfg.get('code_page', 37))
-
-            # Печать
-            printer.text(content + "\n")
-            try:
-                printer.cut()
-            except Exception:
-                # некоторые 58мм не поддерживают автоматическую обрезку
-                pass
-            try:
-                printer.close()
-            except Exception:
-                pass
-
+            self._write_to_printer(content, printer_type)
             return True
 
         except Exception as e:
             # Fallback: лог + сохранение в файл
             current_app.logger.error(f"Printer error ({printer_type}): {e}")
+            self._save_fallback(content, printer_type)
+            return False
+
+    def _write_to_printer(self, content: Union[bytes, str], printer_type: str) -> None:
+        """Отправка чека на принтер; при ошибке выбрасывает исключение."""
+        from app.utils.printer_pool import printer_pool
+        from app.utils.printer_monitor import printer_monitor, PrinterUnavailableError
+        
+        cfg = self._get_printer_config(printer_type)
+        if cfg.get('type') == 'disabled':
+            raise RuntimeError("Printing disabled for this printer type")
+        if printer_monitor.is_down(printer_type):
+            # Не ждем таймаута соединения с заведомо недоступным принтером
+            status = printer_monitor.get_status(printer_type)
+            raise PrinterUnavailableError(f"Printer {printer_type} is {status['status']}")
+
+        if isinstance(content, str):
+            # Текст старых заданий кодируем в кодовую страницу принтера
+            content = content.encode(PrinterProfile.from_config(cfg).encoding, errors='replace')
+
+        for attempt in (1, 2):
+            reused = False
             try:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"receipt_{printer_type}_{timestamp}.txt"
-                filepath = os.path.join(current_app.root_path, '..', 'receipts', filename)
-                os.makedirs(os.path.dirname(filepath), exist_ok=True)
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                current_app.logger.info(f"Receipt saved to: {filepath}")
-            except Exception as e2:
-                current_app.logger.error(f"Receipt save failed: {e2}")
-            return False 
\ No newline at end of file
+                with printer_pool.acquire(printer_type, cfg, self._open_printer,
+                                          lambda printer: self._init_printer(printer, cfg)) as (printer, reused):
+                    # Печать уже закодированных байтов, без перекодирования escpos
+                    printer._raw(content + b"\n")
+                    try:
+                        printer.cut()
+                    except Exception:
+                        # некоторые 58мм не поддерживают автоматическую обрезку
+                        pass
+                return
+            except OSError:
+                # Соединение из пула могло устареть - одна попытка на свежем
+                if attempt == 1 and reused:
+                    current_app.logger.info(f"Stale printer connection ({printer_type}), reconnecting")
+                    continue
+                raise
+
+    def _save_fallback(self, content: Union[bytes, str], printer_type: str) -> Optional[str]:
+        """Сохранение непечатанного чека в файл receipts/."""
+        try:
+            if isinstance(content, bytes):
+                content = content.decode(self._profile(printer_type).encoding, errors='replace')
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"receipt_{printer_type}_{timestamp}.txt"
+            filepath = os.path.join(current_app.root_path, '..', 'receipts', filename)
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            with open(filepath, 'w', encoding='utf-8') as f:
+                f.write(content)
+            current_app.logger.info(f"Receipt saved to: {filepath}")
+            return filepath
+        except Exception as e2:
+            current_app.logger.error(f"Receipt save failed: {e2}")
+            return None
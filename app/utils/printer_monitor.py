@@ -0,0 +1,241 @@
+"""Фоновый мониторинг доступности принтеров.
+
+Планировщик периодически опрашивает каждый настроенный принтер: открывает
+соединение (через пул, чтобы не занимать второй TCP-слот принтера) и
+отправляет запросы статуса реального времени ESC/POS ``DLE EOT 1`` (онлайн)
+и ``DLE EOT 4`` (датчик бумаги). Результат кешируется в памяти; при смене
+состояния официантам уходит событие ``printer_status``. Отправка чеков
+сверяется с кешем и сразу уходит в повтор/заглушку, если принтер недоступен,
+не дожидаясь ``printer_*_timeout``.
+"""
+
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from flask import Flask
+
+from app import db
+
+PRINTERS = ('kitchen', 'bar', 'receipt')
+
+RT_STATUS_ONLINE = b'\x10\x04\x01'  # DLE EOT 1
+RT_STATUS_PAPER = b'\x10\x04\x04'   # DLE EOT 4
+
+STATUS_OFFLINE_BIT = 0x08
+PAPER_NEAR_END_BITS = 0x0C
+PAPER_END_BITS = 0x60
+
+# Статусы, при которых печать не имеет смысла
+DOWN_STATUSES = ('offline', 'paper_out')
+
+
+class PrinterUnavailableError(RuntimeError):
+    """Принтер недоступен по данным мониторинга."""
+
+
+class PrinterHealthMonitor:
+    """Опрос принтеров и кеш их состояния."""
+
+    def __init__(self):
+        self.app: Optional[Flask] = None
+        self.interval = 15.0
+        self.timeout = 1.0
+        self._lock = threading.Lock()
+        self._status: Dict[str, Dict[str, Any]] = {}
+
+    def init_app(self, app: Flask) -> None:
+        """Регистрация периодического опроса в планировщике приложения."""
+        self.app = app
+        self.interval = float(app.config.get('PRINTER_MONITOR_INTERVAL', self.interval))
+        self.timeout = float(app.config.get('PRINTER_MONITOR_TIMEOUT', self.timeout))
+
+        if app.config.get('TESTING') or not app.config.get('PRINTER_MONITOR_ENABLED', True):
+            return
+
+        from app import scheduler
+        from apscheduler.triggers.interval import IntervalTrigger
+
+        scheduler.add_job(
+            func=self._scheduled_check,
+            trigger=IntervalTrigger(seconds=self.interval),
+            id='printer_monitor',
+            name='Printer health monitor',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+            next_run_time=datetime.now()
+        )
+        if not scheduler.running:
+            scheduler.start()
+        app.logger.info(f"Мониторинг принтеров запущен (каждые {self.interval:g} с)")
+
+    # --- чтение кеша ---
+
+    def get_status(self, printer: str) -> Optional[Dict[str, Any]]:
+        """Последний известный статус принтера или None."""
+        with self._lock:
+            status = self._status.get(printer)
+            return self._public(status) if status else None
+
+    def all_statuses(self) -> Dict[str, Dict[str, Any]]:
+        """Статусы всех принтеров."""
+        with self._lock:
+            return {printer: self._public(status) for printer, status in self._status.items()}
+
+    @staticmethod
+    def _public(status: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in status.items() if not key.startswith('_')}
+
+    def is_down(self, printer: str) -> bool:
+        """
+        Недоступен ли принтер по свежим данным мониторинга.
+
+        Устаревший статус (мониторинг остановлен) не блокирует печать.
+        """
+        with self._lock:
+            status = self._status.get(printer)
+        if not status or status['status'] not in DOWN_STATUSES:
+            return False
+        return time.monotonic() - status['_checked'] <= self.interval * 3
+
+    # --- опрос ---
+
+    def check_all(self) -> Dict[str, Dict[str, Any]]:
+        """Опрос всех принтеров (нужен контекст приложения)."""
+        for printer in PRINTERS:
+            self.check(printer)
+        return self.all_statuses()
+
+    def check(self, printer: str) -> Dict[str, Any]:
+        """Опрос одного принтера и обновление кеша."""
+        from app.utils.print_service import PrintService
+
+        print_service = PrintService()
+        cfg = print_service._get_printer_config(printer)
+        started = time.monotonic()
+
+        if cfg.get('type') == 'disabled':
+            result = {'status': 'disabled', 'paper': None, 'error': None}
+        else:
+            try:
+                result = self._probe(print_service, printer, cfg)
+            except Exception as e:
+                result = {'status': 'offline', 'paper': None, 'error': str(e)}
+
+        result['response_ms'] = round((time.monotonic() - started) * 1000, 1)
+        self._update(printer, result)
+        return self.get_status(printer)
+
+    def _probe(self, print_service, printer: str, cfg: Dict[str, Any]) -> Dict[str, Any]:
+        from app.utils.printer_pool import printer_pool
+
+        with printer_pool.acquire(printer, cfg, print_service._open_printer,
+                                  lambda p: print_service._init_printer(p, cfg)) as (device, reused):
+            online = self._query(device, RT_STATUS_ONLINE)
+            paper = self._query(device, RT_STATUS_PAPER)
+
+        if online is None and paper is None:
+            # Соединение есть, но принтер не поддерживает запросы статуса
+            return {'status': 'online', 'paper': 'unknown', 'error': None}
+
+        paper_state = 'unknown'
+        if paper is not None:
+            if paper & PAPER_END_BITS:
+                paper_state = 'out'
+            elif paper & PAPER_NEAR_END_BITS:
+                paper_state = 'low'
+            else:
+                paper_state = 'ok'
+
+        if paper_state == 'out':
+            status = 'paper_out'
+        elif online is not None and online & STATUS_OFFLINE_BIT:
+            status = 'offline'
+        elif paper_state == 'low':
+            status = 'paper_low'
+        else:
+            status = 'online'
+        return {'status': status, 'paper': paper_state, 'error': None}
+
+    def _query(self, device, command: bytes) -> Optional[int]:
+        """Запрос статуса реального времени; None - принтер не ответил."""
+        sock = getattr(device, '_device', None)
+        if isinstance(sock, socket.socket):
+            previous = sock.gettimeout()
+            sock.settimeout(self.timeout)
+            try:
+                sock.sendall(command)
+                data = sock.recv(1)
+                if not data:
+                    raise ConnectionError("Printer closed the connection")
+            except socket.timeout:
+                return None
+            finally:
+                sock.settimeout(previous)
+        else:
+            device._raw(command)
+            data = device._read()
+        return data[0] if data else None
+
+    def _update(self, printer: str, result: Dict[str, Any]) -> None:
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            previous = self._status.get(printer)
+            changed = previous is None or previous['status'] != result['status']
+            status = dict(result)
+            status.update({
+                'printer': printer,
+                'checked_at': now,
+                'since': now if changed else previous['since'],
+                '_checked': time.monotonic(),
+            })
+            self._status[printer] = status
+
+        if not changed:
+            return
+
+        if previous is not None:
+            log = self.app.logger.warning if result['status'] in DOWN_STATUSES else self.app.logger.info
+            log(f"Printer {printer}: {previous['status']} -> {result['status']}")
+            if previous['status'] in DOWN_STATUSES and result['status'] not in DOWN_STATUSES:
+                self._resume_queue(printer)
+        self._notify(printer, status)
+
+    def _resume_queue(self, printer: str) -> None:
+        """Принтер вернулся - задания печатаются сразу, без ожидания паузы повтора."""
+        from app.models import PrintJob
+        from app.utils.print_queue import print_queue
+
+        try:
+            PrintJob.query.filter_by(printer=printer, status='queued').update(
+                {'next_attempt_at': None}, synchronize_session=False
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.app.logger.error(f"Print queue resume failed ({printer}): {e}")
+        print_queue.wake(printer)
+
+    def _notify(self, printer: str, status: Dict[str, Any]) -> None:
+        """Событие смены статуса принтера для официантов."""
+        try:
+            from app.websocket.event_log import emit_room_event
+            emit_room_event('printer_status', self._public(status), 'all_waiters')
+        except Exception as e:
+            self.app.logger.error(f"Printer status notification failed: {e}")
+
+    def _scheduled_check(self) -> None:
+        with self.app.app_context():
+            try:
+                self.check_all()
+            except Exception as e:
+                self.app.logger.error(f"Printer monitor error: {e}")
+            finally:
+                db.session.remove()
+
+
+# Глобальный экземпляр мониторинга
+printer_monitor = PrinterHealthMonitor()
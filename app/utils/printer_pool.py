@@ -0,0 +1,186 @@
+"""Постоянные соединения с сетевыми ESC/POS принтерами.
+
+Вместо TCP connect/teardown на каждый чек держим одно соединение на
+принтер. Перед повторным использованием соединение проверяется (не закрыл
+ли его принтер, не простаивало ли оно слишком долго); последовательность
+инициализации и кодовая страница отправляются только после (пере)подключения.
+Запись на один принтер из разных потоков сериализуется блокировкой.
+"""
+
+import errno
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+
+class PooledPrinter:
+    """Соединение с одним принтером и его счетчики."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.lock = threading.Lock()
+        self.printer = None
+        self.signature: Optional[Tuple] = None
+        self.last_used = 0.0
+        self.connected_at: Optional[float] = None
+        self.connects = 0
+        self.reconnects = 0
+        self.reuses = 0
+        self.errors = 0
+
+    def close(self) -> None:
+        """Закрытие соединения без выброса исключений."""
+        if self.printer is not None:
+            try:
+                self.printer.close()
+            except Exception:
+                pass
+        self.printer = None
+        self.connected_at = None
+
+    def is_alive(self, max_idle: float) -> bool:
+        """Проверка, что соединение открыто и пригодно к записи."""
+        if self.printer is None:
+            return False
+        if max_idle and time.monotonic() - self.last_used > max_idle:
+            # Многие принтеры молча рвут простаивающие соединения
+            return False
+
+        device = getattr(self.printer, '_device', None)
+        if not isinstance(device, socket.socket):
+            return device not in (None, False)
+
+        try:
+            device.setblocking(False)
+            try:
+                data = device.recv(1, socket.MSG_PEEK)
+            finally:
+                device.setblocking(True)
+                device.settimeout(getattr(self.printer, 'timeout', None))
+            # Пустой ответ - принтер закрыл соединение; байты статуса допустимы
+            return data != b''
+        except BlockingIOError:
+            return True
+        except OSError as e:
+            return e.errno in (errno.EAGAIN, errno.EWOULDBLOCK)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Счетчики соединения."""
+        return {
+            'printer': self.kind,
+            'connected': self.printer is not None,
+            'connected_for_seconds': round(time.monotonic() - self.connected_at, 1) if self.connected_at else None,
+            'idle_seconds': round(time.monotonic() - self.last_used, 1) if self.last_used else None,
+            'connects': self.connects,
+            'reconnects': self.reconnects,
+            'reuses': self.reuses,
+            'errors': self.errors,
+        }
+
+
+class PrinterConnectionManager:
+    """Менеджер постоянных соединений с принтерами."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool: Dict[str, PooledPrinter] = {}
+        self.max_idle = 120.0
+
+    def init_app(self, app) -> None:
+        """Чтение настроек пула."""
+        self.max_idle = float(app.config.get('PRINTER_POOL_MAX_IDLE_SECONDS', self.max_idle))
+
+    @contextmanager
+    def acquire(self, kind: str, cfg: Dict[str, Any], opener: Callable[[Dict[str, Any]], Any],
+                initializer: Callable[[Any], None]) -> Iterator[Tuple[Any, bool]]:
+        """
+        Эксклюзивный доступ к соединению принтера.
+
+        Args:
+            kind: Принтер ('kitchen' | 'bar' | 'receipt')
+            cfg: Конфигурация принтера из PrintService._get_printer_config
+            opener: Функция открытия принтера по конфигурации
+            initializer: Инициализация после подключения (ESC @, кодовая страница)
+
+        Yields:
+            (printer, reused): объект escpos и признак повторного использования
+        """
+        entry = self._entry(kind)
+        signature = self._signature(cfg)
+
+        with entry.lock:
+            reused = entry.signature == signature and entry.is_alive(self.max_idle)
+            if reused:
+                entry.reuses += 1
+            else:
+                if entry.connects:
+                    entry.reconnects += 1
+                entry.close()
+                entry.printer = self._connect(opener, cfg, initializer)
+                entry.signature = signature
+                entry.connected_at = time.monotonic()
+                entry.connects += 1
+
+            try:
+                yield entry.printer, reused
+            except Exception:
+                entry.errors += 1
+                entry.close()
+                raise
+            finally:
+                entry.last_used = time.monotonic()
+
+    def invalidate(self, kind: str) -> None:
+        """Принудительное закрытие соединения принтера."""
+        entry = self._entry(kind)
+        with entry.lock:
+            entry.close()
+
+    def close_all(self) -> None:
+        """Закрытие всех соединений (при остановке приложения)."""
+        with self._lock:
+            entries = list(self._pool.values())
+        for entry in entries:
+            with entry.lock:
+                entry.close()
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Счетчики повторного использования и переподключений по принтерам."""
+        with self._lock:
+            entries = list(self._pool.values())
+        return {entry.kind: entry.to_dict() for entry in entries}
+
+    def _entry(self, kind: str) -> PooledPrinter:
+        with self._lock:
+            entry = self._pool.get(kind)
+            if entry is None:
+                entry = self._pool[kind] = PooledPrinter(kind)
+            return entry
+
+    @staticmethod
+    def _signature(cfg: Dict[str, Any]) -> Tuple:
+        """Параметры, изменение которых требует нового соединения."""
+        return tuple(sorted((k, v) for k, v in cfg.items() if k != 'chars_per_line'))
+
+    @staticmethod
+    def _connect(opener: Callable, cfg: Dict[str, Any], initializer: Callable[[Any], None]):
+        printer = opener(cfg)
+        if not printer:
+            raise RuntimeError("Printer open failed (no config or disabled)")
+
+        # Инициализация и кириллица - только один раз на соединение
+        try:
+            initializer(printer)
+        except Exception:
+            try:
+                printer.close()
+            except Exception:
+                pass
+            raise
+        return printer
+
+
+# Глобальный экземпляр менеджера соединений
+printer_pool = PrinterConnectionManager()
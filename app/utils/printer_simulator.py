@@ -0,0 +1,358 @@
+"""Локальный симулятор сетевого ESC/POS принтера.
+
+TCP-сервер (по умолчанию порт 9100), который разбирает поток ESC/POS,
+записывает напечатанные чеки (чек заканчивается командой отрезки GS V) и
+отвечает на запросы статуса DLE EOT. Для нагрузочных тестов умеет
+имитировать медленную печать, обрывы соединения, отключение принтера и
+окончание бумаги.
+
+Используется скриптами ``scripts/printer_simulator.py`` и
+``scripts/printer_benchmark.py``; приложению в работе не нужен.
+"""
+
+import random
+import socket
+import socketserver
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.utils.receipt_templates import CODE_PAGE_ENCODINGS, DEFAULT_ENCODING
+
+ESC = 0x1B
+GS = 0x1D
+DLE = 0x10
+EOT = 0x04
+
+# Команды с фиксированным числом аргументов: (префикс, код) -> число байт
+FIXED_ARGS = {
+    (ESC, 0x21): 1,  # ESC ! n - режим печати
+    (ESC, 0x2D): 1,  # ESC - n - подчеркивание
+    (ESC, 0x32): 0,  # ESC 2 - межстрочный интервал по умолчанию
+    (ESC, 0x33): 1,  # ESC 3 n - межстрочный интервал
+    (ESC, 0x45): 1,  # ESC E n - жирный
+    (ESC, 0x47): 1,  # ESC G n - двойной удар
+    (ESC, 0x4D): 1,  # ESC M n - шрифт
+    (ESC, 0x61): 1,  # ESC a n - выравнивание
+    (ESC, 0x64): 1,  # ESC d n - прогон строк
+    (ESC, 0x70): 3,  # ESC p m t1 t2 - денежный ящик
+    (GS, 0x21): 1,   # GS ! n - размер символов
+    (GS, 0x42): 1,   # GS B n - инверсия
+    (GS, 0x48): 1,   # GS H n - позиция HRI
+    (GS, 0x66): 1,   # GS f n - шрифт HRI
+    (GS, 0x68): 1,   # GS h n - высота штрихкода
+    (GS, 0x77): 1,   # GS w n - ширина штрихкода
+}
+
+# Ответы на DLE EOT n (биты 1, 4 всегда установлены)
+STATUS_OK = 0x12
+STATUS_OFFLINE = 0x08
+STATUS_PAPER_NEAR_END = 0x0C
+STATUS_PAPER_END = 0x60
+
+
+class SimulatedTicket:
+    """Чек, принятый симулятором."""
+
+    __slots__ = ('number', 'status', 'text', 'raw', 'received_at', 'printed_at')
+
+    def __init__(self, number: int, status: str, text: str, raw: bytes,
+                 received_at: float, printed_at: Optional[float]):
+        self.number = number
+        self.status = status  # printed | dropped | discarded
+        self.text = text
+        self.raw = raw
+        self.received_at = received_at
+        self.printed_at = printed_at
+
+    def to_dict(self) -> Dict:
+        return {
+            'number': self.number,
+            'status': self.status,
+            'text': self.text,
+            'bytes': len(self.raw),
+            'received_at': self.received_at,
+            'printed_at': self.printed_at,
+        }
+
+
+class EscPosParser:
+    """
+    Потоковый разбор ESC/POS.
+
+    Команды могут приходить разрезанными между TCP-пакетами, поэтому
+    незавершенный хвост сохраняется до следующего ``feed``.
+    """
+
+    def __init__(self, on_cut: Callable[[str, bytes], None], on_status: Callable[[int], bytes]):
+        self.on_cut = on_cut
+        self.on_status = on_status
+        self.encoding = DEFAULT_ENCODING
+        self._pending = b''
+        self._text = bytearray()
+        self._raw = bytearray()
+
+    def feed(self, data: bytes) -> bytes:
+        """
+        Разбор очередной порции данных.
+
+        Returns:
+            bytes: Ответ принтера (байты статуса), который нужно отправить клиенту
+        """
+        buf = self._pending + data
+        reply = bytearray()
+        i = 0
+        n = len(buf)
+
+        while i < n:
+            b = buf[i]
+            if b in (ESC, GS, DLE):
+                consumed = self._command(buf, i, reply)
+                if consumed is None:
+                    break  # команда не дошла целиком
+                i += consumed
+                continue
+            self._text.append(b)
+            self._raw.append(b)
+            i += 1
+
+        self._pending = buf[i:]
+        return bytes(reply)
+
+    def _command(self, buf: bytes, i: int, reply: bytearray) -> Optional[int]:
+        n = len(buf)
+        if i + 1 >= n:
+            return None
+        prefix, code = buf[i], buf[i + 1]
+
+        if prefix == DLE and code == EOT:
+            if i + 2 >= n:
+                return None
+            reply += self.on_status(buf[i + 2])
+            return 3
+
+        if prefix == ESC and code == 0x40:  # ESC @ - сброс
+            self.encoding = DEFAULT_ENCODING
+            self._raw += buf[i:i + 2]
+            return 2
+
+        if prefix == ESC and code == 0x74:  # ESC t n - кодовая страница
+            if i + 2 >= n:
+                return None
+            self.encoding = CODE_PAGE_ENCODINGS.get(buf[i + 2], DEFAULT_ENCODING)
+            self._raw += buf[i:i + 3]
+            return 3
+
+        if prefix == GS and code == 0x56:  # GS V m [n] - отрезка
+            if i + 2 >= n:
+                return None
+            length = 4 if buf[i + 2] in (0x41, 0x42, 0x61, 0x62) else 3
+            if i + length > n:
+                return None
+            self._raw += buf[i:i + length]
+            self._cut()
+            return length
+
+        args = FIXED_ARGS.get((prefix, code))
+        if args is None:
+            # Неизвестная команда: пропускаем префикс и код
+            args = 0
+        if i + 2 + args > n:
+            return None
+        self._raw += buf[i:i + 2 + args]
+        return 2 + args
+
+    def _cut(self) -> None:
+        text = bytes(self._text).decode(self.encoding, errors='replace').strip('\n')
+        raw = bytes(self._raw)
+        self._text.clear()
+        self._raw.clear()
+        self.on_cut(text, raw)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """Одно TCP-соединение с симулятором."""
+
+    def handle(self):
+        sim: 'PrinterSimulator' = self.server.simulator
+        sock: socket.socket = self.request
+        sim._register(sock)
+
+        dropped = []
+
+        def on_cut(text: str, raw: bytes) -> None:
+            received_at = time.monotonic()
+            if sim.drop_rate and random.random() < sim.drop_rate:
+                dropped.append(True)
+                sim._record('dropped', text, raw, received_at)
+                return
+            if sim.latency:
+                time.sleep(sim.latency)
+            sim._record('discarded' if sim.paper == 'out' else 'printed', text, raw, received_at)
+
+        parser = EscPosParser(on_cut, sim.status_reply)
+        try:
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    break
+                sim.bytes_received += len(data)
+                reply = parser.feed(data)
+                if dropped:
+                    # Обрыв соединения посреди печати
+                    sock.shutdown(socket.SHUT_RDWR)
+                    break
+                if reply:
+                    sock.sendall(reply)
+        except OSError:
+            pass
+        finally:
+            sim._unregister(sock)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class PrinterSimulator:
+    """
+    Симулятор одного принтера.
+
+    Args:
+        host: Адрес прослушивания
+        port: Порт (9100 - стандартный порт RAW-печати)
+        name: Имя для отчетов (kitchen, bar, receipt)
+        latency: Задержка печати одного чека, секунд
+        drop_rate: Доля чеков, на которых соединение обрывается (0..1)
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 9100, name: str = 'printer',
+                 latency: float = 0.0, drop_rate: float = 0.0):
+        self.host = host
+        self.port = port
+        self.name = name
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.paper = 'ok'  # ok | low | out
+        self.tickets: List[SimulatedTicket] = []
+        self.dropped = 0
+        self.discarded = 0
+        self.connections = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self._sockets = set()
+        self._listeners: List[Callable[[SimulatedTicket], None]] = []
+
+    # --- управление ---
+
+    def start(self) -> 'PrinterSimulator':
+        """Запуск сервера в фоновом потоке."""
+        if self._server is not None:
+            return self
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.simulator = self
+        # Порт 0 - свободный порт от ОС
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name=f'printer-sim-{self.name}', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Остановка сервера и разрыв всех соединений."""
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        with self._lock:
+            sockets = list(self._sockets)
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    @property
+    def online(self) -> bool:
+        return self._server is not None
+
+    def set_online(self, online: bool) -> None:
+        """Включение/выключение принтера (соединения отклоняются)."""
+        if online:
+            self.start()
+        else:
+            self.stop()
+
+    def set_paper(self, state: str) -> None:
+        """Состояние бумаги: ok | low | out. Без бумаги чеки теряются."""
+        if state not in ('ok', 'low', 'out'):
+            raise ValueError(f"Неизвестное состояние бумаги: {state}")
+        self.paper = state
+
+    def on_ticket(self, callback: Callable[[SimulatedTicket], None]) -> None:
+        """Подписка на принятые чеки, включая потерянные (status != 'printed')."""
+        self._listeners.append(callback)
+
+    def reset(self) -> None:
+        """Очистка записанных чеков и счетчиков."""
+        with self._lock:
+            self.tickets = []
+            self.dropped = self.discarded = self.connections = self.bytes_received = 0
+
+    def stats(self) -> Dict:
+        """Счетчики симулятора."""
+        return {
+            'name': self.name,
+            'port': self.port,
+            'online': self.online,
+            'paper': self.paper,
+            'tickets': len(self.tickets),
+            'dropped': self.dropped,
+            'discarded': self.discarded,
+            'connections': self.connections,
+            'bytes_received': self.bytes_received,
+        }
+
+    # --- ответы принтера ---
+
+    def status_reply(self, n: int) -> bytes:
+        """Байт ответа на DLE EOT n."""
+        status = STATUS_OK
+        if n == 1 and self.paper == 'out':
+            status |= STATUS_OFFLINE
+        elif n == 4:
+            if self.paper == 'low':
+                status |= STATUS_PAPER_NEAR_END
+            elif self.paper == 'out':
+                status |= STATUS_PAPER_NEAR_END | STATUS_PAPER_END
+        return bytes([status])
+
+    # --- внутреннее ---
+
+    def _record(self, status: str, text: str, raw: bytes, received_at: float) -> None:
+        with self._lock:
+            if status == 'printed':
+                ticket = SimulatedTicket(len(self.tickets) + 1, status, text, raw, received_at, time.monotonic())
+                self.tickets.append(ticket)
+            else:
+                # Обрыв соединения или нет бумаги: чек принят, но не напечатан
+                ticket = SimulatedTicket(0, status, text, raw, received_at, None)
+                if status == 'dropped':
+                    self.dropped += 1
+                else:
+                    self.discarded += 1
+        for callback in list(self._listeners):
+            callback(ticket)
+
+    def _register(self, sock: socket.socket) -> None:
+        with self._lock:
+            self._sockets.add(sock)
+            self.connections += 1
+
+    def _unregister(self, sock: socket.socket) -> None:
+        with self._lock:
+            self._sockets.discard(sock)
@@ -0,0 +1,294 @@
+"""Шаблоны чеков ESC/POS с учетом ширины ленты.
+
+Шаблон компилируется один раз на профиль принтера (символов в строке,
+кодовая страница): статические шапка и подвал сразу кодируются в байты и
+кешируются, а заказ дописывается в тот же буфер уже закодированным. Ширина
+считается в символах до кодирования, поэтому кириллица в однобайтовых
+кодовых страницах выравнивается так же, как латиница.
+"""
+
+import textwrap
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# ESC t n -> кодировка Python. 37 - значение по умолчанию в настройках (Windows-1251)
+CODE_PAGE_ENCODINGS = {
+    17: 'cp866',
+    37: 'cp1251',
+    46: 'cp1251',
+    59: 'cp866',
+}
+DEFAULT_ENCODING = 'cp1251'
+LINE_FEED = b'\n'
+
+
+class PrinterProfile:
+    """Параметры печати, от которых зависит скомпилированный шаблон."""
+
+    __slots__ = ('cpl', 'code_page', 'encoding')
+
+    def __init__(self, cpl: int = 32, code_page: int = 37):
+        self.cpl = max(int(cpl), 16)
+        self.code_page = int(code_page)
+        self.encoding = CODE_PAGE_ENCODINGS.get(self.code_page, DEFAULT_ENCODING)
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        return self.cpl, self.code_page
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> 'PrinterProfile':
+        """Профиль из конфигурации PrintService._get_printer_config."""
+        return cls(cfg.get('chars_per_line', 32), cfg.get('code_page', 37))
+
+
+class ReceiptWriter:
+    """Буфер чека: строки выравниваются по ширине ленты и сразу кодируются."""
+
+    def __init__(self, profile: PrinterProfile):
+        self.profile = profile
+        self.width = profile.cpl
+        self._buffer = bytearray()
+
+    def raw(self, data: bytes) -> None:
+        """Добавление готовых байтов (скомпилированные шапка/подвал)."""
+        self._buffer += data
+
+    def line(self, text: str = '') -> None:
+        """Строка не длиннее ширины ленты."""
+        self._buffer += text[:self.width].encode(self.profile.encoding, errors='replace')
+        self._buffer += LINE_FEED
+
+    def rule(self, char: str = '-') -> None:
+        """Разделитель во всю ширину."""
+        self.line(char * self.width)
+
+    def center(self, text: str) -> None:
+        """Строка по центру."""
+        for part in self._wrap(text, self.width):
+            self.line(part.center(self.width).rstrip())
+
+    def wrapped(self, text: str, indent: str = '') -> None:
+        """Текст с переносом по словам; продолжение строк с отступом."""
+        for part in self._wrap(text, self.width, indent):
+            self.line(part)
+
+    def columns(self, left: str, right: str, indent: str = '   ') -> None:
+        """
+        Левая колонка с переносом и правая колонка, прижатая к краю.
+
+        Правое значение печатается на последней строке левой колонки.
+        """
+        right_width = len(right)
+        left_width = max(self.width - right_width - 1, 8)
+        parts = self._wrap(left, left_width, indent) or ['']
+        for part in parts[:-1]:
+            self.line(part)
+        last = parts[-1]
+        if len(last) + 1 + right_width > self.width:
+            self.line(last)
+            last = ''
+        self.line(last + right.rjust(self.width - len(last)))
+
+    def getvalue(self) -> bytes:
+        return bytes(self._buffer)
+
+    @staticmethod
+    def _wrap(text: str, width: int, indent: str = '') -> List[str]:
+        return textwrap.wrap(
+            text or '', width=width, subsequent_indent=indent,
+            break_long_words=True, break_on_hyphens=False
+        )
+
+
+class ReceiptTemplate:
+    """Базовый шаблон: статические части компилируются один раз на профиль."""
+
+    def __init__(self, profile: PrinterProfile, **static):
+        self.profile = profile
+        self.static = static
+        self.header = self._compile(self.build_header)
+        self.footer = self._compile(self.build_footer)
+
+    def render(self, order, items: Optional[List] = None) -> bytes:
+        """Рендер заказа в байты ESC/POS."""
+        writer = ReceiptWriter(self.profile)
+        writer.raw(self.header)
+        self.build_body(writer, order, items)
+        writer.raw(self.footer)
+        return writer.getvalue()
+
+    def build_header(self, writer: ReceiptWriter) -> None:
+        pass
+
+    def build_body(self, writer: ReceiptWriter, order, items: Optional[List]) -> None:
+        pass
+
+    def build_footer(self, writer: ReceiptWriter) -> None:
+        pass
+
+    def _compile(self, builder: Callable[[ReceiptWriter], None]) -> bytes:
+        writer = ReceiptWriter(self.profile)
+        builder(writer)
+        return writer.getvalue()
+
+    @staticmethod
+    def _waiter_name(order) -> str:
+        return order.waiter.name if order.waiter else 'Неизвестно'
+
+
+class StationTicketTemplate(ReceiptTemplate):
+    """Тикет станции (кухня или бар)."""
+
+    def build_header(self, writer: ReceiptWriter) -> None:
+        writer.rule('=')
+        writer.center(self.static['title'])
+        writer.rule('=')
+
+    def build_body(self, writer: ReceiptWriter, order, items: Optional[List]) -> None:
+        created = order.created_at.strftime('%H:%M')
+        writer.columns(f"Стол: {order.table.table_number}", f"Время: {created}")
+        writer.line(f"Заказ #{order.id:04d} - {self.static['label']}")
+        writer.rule('-')
+
+        for item in items or []:
+            writer.wrapped(f"{item.quantity}x {item.menu_item.name_ru}", indent='   ')
+            if item.comments:
+                writer.wrapped(f"- {item.comments}", indent='  ')
+
+        writer.rule('-')
+        writer.line(f"Время заказа: {created}")
+        writer.wrapped(f"Официант: {self._waiter_name(order)}")
+
+    def build_footer(self, writer: ReceiptWriter) -> None:
+        writer.rule('=')
+
+
+class FinalReceiptTemplate(ReceiptTemplate):
+    """Итоговый чек для гостя."""
+
+    def build_header(self, writer: ReceiptWriter) -> None:
+        writer.rule('=')
+        writer.center('РЕСТОРАН DENIZ')
+        writer.rule('=')
+        writer.wrapped(self.static['address'])
+        writer.wrapped(self.static['phone'])
+
+    def build_body(self, writer: ReceiptWriter, order, items: Optional[List]) -> None:
+        writer.columns(f"Стол: {order.table.table_number}", f"Заказ: #{order.id}")
+        writer.line(f"Дата: {order.created_at.strftime('%d.%m.%Y')}")
+        writer.line(f"Время: {order.created_at.strftime('%H:%M')}")
+        writer.wrapped(f"Официант: {self._waiter_name(order)}")
+
+        # Группируем позиции по типам
+        kitchen_items = [i for i in order.items if i.menu_item.preparation_type == 'kitchen']
+        bar_items = [i for i in order.items if i.menu_item.preparation_type == 'bar']
+
+        for title, group in (('КУХНЯ:', kitchen_items), ('БАР:', bar_items)):
+            if not group:
+                continue
+            writer.line()
+            writer.line(title)
+            writer.rule('-')
+            for item in group:
+                writer.columns(f"{item.quantity}x {item.menu_item.name_ru}",
+                               f"{item.unit_price * item.quantity:.2f}")
+                if item.comments:
+                    writer.wrapped(f"   - {item.comments}", indent='     ')
+        writer.line()
+
+        intermediate_total = order.subtotal + order.service_charge
+        writer.rule('-')
+        writer.columns('Подытог:', f"{order.subtotal:.2f}")
+        writer.columns(f"Сервисный сбор ({self.static['service_charge_percent']}%):", f"{order.service_charge:.2f}")
+        writer.columns('Промежуточный итог:', f"{intermediate_total:.2f}")
+
+        # Скидка по бонусной карте
+        if order.discount_amount and order.discount_amount > 0:
+            card = order.bonus_card
+            writer.columns(f"Скидка карта {card.card_number if card else 'XXXXXX'}:",
+                           f"-{order.discount_amount:.2f}")
+            writer.line(f"({card.discount_percent if card else 0}%)")
+
+        writer.rule('-')
+        writer.columns('ИТОГО:', f"{order.total_amount:.2f}")
+
+    def build_footer(self, writer: ReceiptWriter) -> None:
+        writer.rule('=')
+        writer.center('Благодарим за посещение!')
+        writer.rule('=')
+
+
+class ReceiptTemplateRegistry:
+    """Кеш скомпилированных шаблонов и настроек, нужных для печати."""
+
+    def __init__(self, settings_ttl: float = 30.0):
+        self.settings_ttl = settings_ttl
+        self._lock = threading.Lock()
+        self._templates: Dict[Tuple, ReceiptTemplate] = {}
+        self._settings: Optional[Dict[str, str]] = None
+        self._settings_loaded_at = 0.0
+        self._overrides: Dict[str, str] = {}
+
+    def settings(self) -> Dict[str, str]:
+        """Все системные настройки одним запросом, с коротким кешем."""
+        now = time.monotonic()
+        if self._settings is None or now - self._settings_loaded_at > self.settings_ttl:
+            from app.models import SystemSetting
+            settings = SystemSetting.get_all_settings()
+            with self._lock:
+                self._settings = settings
+                self._settings_loaded_at = now
+        return self._settings
+
+    def setting(self, key: str, default: str = None) -> str:
+        if key in self._overrides:
+            return self._overrides[key]
+        return self.settings().get(key, default)
+
+    def override(self, settings: Dict[str, str]) -> None:
+        """Подмена настроек без записи в БД (симулятор принтеров, бенчмарк)."""
+        with self._lock:
+            self._overrides = {key: str(value) for key, value in settings.items()}
+            self._templates.clear()
+
+    def invalidate(self) -> None:
+        """Сброс кеша после изменения настроек."""
+        with self._lock:
+            self._settings = None
+            self._templates.clear()
+
+    def get(self, name: str, profile: PrinterProfile) -> ReceiptTemplate:
+        """Скомпилированный шаблон для профиля принтера."""
+        if name == 'kitchen':
+            cls, static = StationTicketTemplate, {'title': 'КУХНЯ - DENIZ', 'label': 'КУХНЯ'}
+        elif name == 'bar':
+            cls, static = StationTicketTemplate, {'title': 'БАР - DENIZ', 'label': 'БАР'}
+        elif name == 'final':
+            cls, static = FinalReceiptTemplate, {
+                'address': self.setting('restaurant_address', 'Адрес: [Адрес ресторана]'),
+                'phone': self.setting('restaurant_phone', 'Телефон: +993 12 XX-XX-XX'),
+                'service_charge_percent': self._format_percent(self.setting('service_charge_percent', '10')),
+            }
+        else:
+            raise ValueError(f"Неизвестный шаблон чека: {name}")
+
+        key = (name, profile.key, tuple(sorted(static.items())))
+        template = self._templates.get(key)
+        if template is None:
+            template = cls(profile, **static)
+            with self._lock:
+                self._templates[key] = template
+        return template
+
+    @staticmethod
+    def _format_percent(value: str) -> str:
+        try:
+            return f"{float(value):g}"
+        except (TypeError, ValueError):
+            return str(value)
+
+
+# Глобальный реестр шаблонов
+receipt_templates = ReceiptTemplateRegistry()
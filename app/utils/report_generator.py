@@ -387,7 +387,10 @@ def generate_sales_report_excel(data: Dict[str, Any]) -> bytes:
 
 def generate_audit_logs_csv(logs: list) -> bytes:
     """
-    Экспорт логов аудита в формат CSV.
+    Экспорт небольшого списка логов аудита в формат CSV.
+    
+    Для больших выгрузок используйте потоковый экспорт
+    (``app.utils.streaming_export``, ``/admin/export/audit_logs``).
     
     Args:
         logs: Список логов аудита
@@ -395,19 +398,25 @@ def generate_audit_logs_csv(logs: list) -> bytes:
     Returns:
         bytes: Содержимое CSV файла
     """
+    from app.utils.streaming_export import iter_csv
+    
     try:
-        csv_content = "Timestamp,Action,Staff,IP Address,Table,Order,Status\n"
-        
-        for log in logs:
-            staff_name = log.staff.name if log.staff else "System"
-            status = log.details.get('result_status', 'unknown') if log.details else 'unknown'
-            
-            csv_content += f'"{log.timestamp.isoformat()}","{log.action}","{staff_name}","{log.ip_address or ""}","{log.table_affected or ""}","{log.order_affected or ""}","{status}"\n'
-        
-        return csv_content.encode('utf-8')
+        columns = ['created_at', 'action', 'staff_name', 'ip_address', 'table_id', 'order_id', 'status']
+        rows = (
+            (
+                log.created_at,
+                log.action,
+                log.staff.name if log.staff else "System",
+                log.ip_address,
+                log.table_affected,
+                log.order_affected,
+                log.get_details().get('response_status', 'unknown'),
+            )
+            for log in logs
+        )
+        return ''.join(iter_csv(columns, rows)).encode('utf-8')
         
     except Exception as e:
-        # current_app.logger.error(f"CSV generation failed: {e}") # This line was removed as per the new_code
         raise Exception(f"Ошибка генерации CSV: {str(e)}")
 
 
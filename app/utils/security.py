@@ -1,208 +1,212 @@
 """Middleware и утилиты безопасности."""
 
 from flask import Flask, request, abort, current_app, g
-import re
 from datetime import datetime, timedelta
-from typing import Set, List, Dict, Any
+from typing import Dict, Any
 import ipaddress
 import hashlib
-import time
+import io
+
+from app.rate_limit import RateLimit
+from app.request_pipeline import RequestContext, request_pipeline
+from app.utils.content_filter import ContentFilter
+from app.utils.ip_blocklist import ip_blocklist
+
+PERMISSIONS_POLICY = (
+    'geolocation=(), microphone=(), camera=(), '
+    'payment=(), usb=(), magnetometer=(), accelerometer=(), gyroscope=()'
+)
+
+CSP_POLICY = (
+    "default-src 'self'; "
+    "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
+    "style-src 'self' 'unsafe-inline'; "
+    "img-src 'self' data: https:; "
+    "font-src 'self' https:; "
+    "connect-src 'self'; "
+    "frame-ancestors 'none'; "
+    "base-uri 'self'; "
+    "form-action 'self';"
+)
+
+class _PrefixedStream(io.RawIOBase):
+    """Поток тела запроса: сначала уже прочитанный префикс, затем остаток."""
+    
+    def __init__(self, prefix: bytes, rest):
+        self._prefix = memoryview(prefix)
+        self._rest = rest
+    
+    def readable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer) -> int:
+        if self._prefix:
+            size = min(len(buffer), len(self._prefix))
+            buffer[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        data = self._rest.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _peek_body(limit: int) -> bytes:
+    """
+    Чтение не более ``limit`` байт тела запроса без загрузки его целиком.
+    
+    Прочитанный префикс возвращается в ``request.stream``, поэтому
+    обработчики и разбор формы по-прежнему видят тело полностью.
+    """
+    cached = getattr(request, '_cached_data', None)
+    if cached is not None:
+        return cached[:limit]
+    
+    stream = request.stream
+    chunks = []
+    remaining = limit
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    prefix = b''.join(chunks)
+    request.__dict__['stream'] = _PrefixedStream(prefix, stream)
+    return prefix
+
 
 class SecurityMiddleware:
     """Middleware для дополнительной безопасности."""
     
     def __init__(self, app: Flask = None):
         self.app = app
-        self.blocked_ips: Set[str] = set()
-        self.rate_limit_store: Dict[str, List[float]] = {}
-        self.suspicious_patterns = [
-            r'<script.*?>.*?</script>',  # XSS
-            r'union.*select',            # SQL injection
-            r'drop.*table',              # SQL injection
-            r'exec\s*\(',               # Code injection
-            r'\.\./',                   # Path traversal
-            r'/etc/passwd',             # File access
-            r'<iframe',                 # Iframe injection
-            r'javascript:',             # Javascript injection
-            r'vbscript:',              # VBScript injection
-            r'onload\s*=',             # Event handler injection
-            r'onerror\s*=',            # Event handler injection
-        ]
+        self.content_filter = ContentFilter()
         
         if app:
             self.init_app(app)
     
     def init_app(self, app: Flask):
         """Инициализация middleware."""
-        app.before_request(self.before_request)
-        app.after_request(self.after_request)
+        # Проверки - после лимитов по умолчанию; заголовки ставятся и для статики
+        request_pipeline.add_stage('security', before=self.check_request, order=20)
+        request_pipeline.add_stage('security_headers', after=self.set_headers, order=20, light=True)
         
         # Настройки безопасности
         self.max_requests_per_minute = app.config.get('SECURITY_MAX_REQUESTS_PER_MINUTE', 100)
+        self.rate_limit = RateLimit(self.max_requests_per_minute, 60, f'{self.max_requests_per_minute} per minute')
         self.request_timeout = app.config.get('SECURITY_REQUEST_TIMEOUT', 30)
         self.enable_ip_blocking = app.config.get('SECURITY_ENABLE_IP_BLOCKING', True)
         self.enable_content_filtering = app.config.get('SECURITY_ENABLE_CONTENT_FILTERING', True)
+        self.content_filter = ContentFilter(
+            gap=app.config.get('SECURITY_CONTENT_FILTER_GAP', 256),
+            max_body_bytes=app.config.get('SECURITY_CONTENT_SCAN_MAX_BYTES', 64 * 1024)
+        )
     
-    def before_request(self):
-        """Проверки перед обработкой запроса."""
-        try:
-            current_app.logger.info(f"Security check for: {request.method} {request.path}")
-            current_app.logger.info(f"User-Agent: {request.headers.get('User-Agent', 'None')}")
-            
-            # Проверка IP адреса
-            if self.enable_ip_blocking and self.is_ip_blocked(request.remote_addr):
-                current_app.logger.warning(f"Blocked IP attempted access: {request.remote_addr}")
-                abort(403)
-            
-            # Проверка rate limiting
-            if not self.check_rate_limit(request.remote_addr):
-                current_app.logger.warning(f"Rate limit exceeded for IP: {request.remote_addr}")
-                abort(429)
-            
-            # Проверка на подозрительные паттерны
-            if self.enable_content_filtering and self.has_suspicious_content():
-                current_app.logger.warning(
-                    f"SECURITY: Suspicious content detected from {request.remote_addr}: {request.url}"
-                )
-                self.block_ip(request.remote_addr, "Suspicious content detected")
-                abort(400)
-            
-            # Проверка размера запроса
-            max_content_length = current_app.config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)
-            if request.content_length and request.content_length > max_content_length:
-                current_app.logger.warning(f"SECURITY: Request too large from {request.remote_addr}: {request.content_length}")
-                abort(413)
-            
-            # Проверка User-Agent
-            user_agent = request.headers.get('User-Agent', '')
-            if not self.is_valid_user_agent(user_agent):
-                current_app.logger.warning(f"SECURITY: Invalid User-Agent from {request.remote_addr}: {user_agent}")
-                abort(400)
-            
-            # Добавление security headers в g для использования в after_request
-            g.security_start_time = time.time()
-            
-        except Exception as e:
-            current_app.logger.error(f"Security middleware error: {e}", exc_info=True)
-            # В случае ошибки в middleware, не блокируем запрос полностью
+    def check_request(self, ctx: RequestContext):
+        """Проверки перед обработкой запроса (стадия конвейера, отказ - через abort)."""
+        # Проверка IP адреса
+        if self.enable_ip_blocking and self.is_ip_blocked(ctx.remote_addr):
+            current_app.logger.warning(f"Blocked IP attempted access: {ctx.remote_addr}")
+            abort(403)
+        
+        # Проверка rate limiting
+        if not self.check_rate_limit(ctx.remote_addr):
+            current_app.logger.warning(f"Rate limit exceeded for IP: {ctx.remote_addr}")
+            abort(429)
+        
+        # Проверка на подозрительные паттерны
+        if self.enable_content_filtering and self.has_suspicious_content(ctx):
+            current_app.logger.warning(
+                f"SECURITY: Suspicious content detected from {ctx.remote_addr}: {request.url}"
+            )
+            self.block_ip(ctx.remote_addr, "Suspicious content detected")
+            abort(400)
+        
+        # Проверка размера запроса
+        max_content_length = current_app.config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)
+        if request.content_length and request.content_length > max_content_length:
+            current_app.logger.warning(f"SECURITY: Request too large from {ctx.remote_addr}: {request.content_length}")
+            abort(413)
+        
+        # Проверка User-Agent
+        if not self.is_valid_user_agent(ctx.user_agent, ctx.is_api):
+            current_app.logger.warning(f"SECURITY: Invalid User-Agent from {ctx.remote_addr}: {ctx.user_agent}")
+            abort(400)
     
-    def after_request(self, response):
+    def set_headers(self, ctx: RequestContext, response):
         """Установка заголовков безопасности."""
-        try:
-            # HSTS (Strict Transport Security)
-            if request.is_secure:
-                response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains; preload'
-            
-            # Предотвращение clickjacking
-            response.headers['X-Frame-Options'] = 'DENY'
-            
-            # XSS защита
-            response.headers['X-XSS-Protection'] = '1; mode=block'
-            
-            # Content type sniffing
-            response.headers['X-Content-Type-Options'] = 'nosniff'
-            
-            # Referrer policy
-            response.headers['Referrer-Policy'] = 'strict-origin-when-cross-origin'
-            
-            # Permissions policy
-            response.headers['Permissions-Policy'] = (
-                'geolocation=(), microphone=(), camera=(), '
-                'payment=(), usb=(), magnetometer=(), accelerometer=(), gyroscope=()'
-            )
-            
-            # CSP (Content Security Policy)
-            if not current_app.debug:
-                csp_policy = (
-                    "default-src 'self'; "
-                    "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
-                    "style-src 'self' 'unsafe-inline'; "
-                    "img-src 'self' data: https:; "
-                    "font-src 'self' https:; "
-                    "connect-src 'self'; "
-                    "frame-ancestors 'none'; "
-                    "base-uri 'self'; "
-                    "form-action 'self';"
-                )
-                response.headers['Content-Security-Policy'] = csp_policy
-            
-            # Логирование времени обработки
-            if hasattr(g, 'security_start_time'):
-                duration = time.time() - g.security_start_time
-                if duration > 1.0:  # Логируем только медленные запросы
-                    current_app.logger.warning(f"Slow request: {duration:.2f}s for {request.path}")
-            
-        except Exception as e:
-            current_app.logger.error(f"Security headers error: {e}", exc_info=True)
+        # HSTS (Strict Transport Security)
+        if request.is_secure:
+            response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains; preload'
+        
+        # Предотвращение clickjacking
+        response.headers['X-Frame-Options'] = 'DENY'
+        
+        # XSS защита
+        response.headers['X-XSS-Protection'] = '1; mode=block'
+        
+        # Content type sniffing
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        
+        # Referrer policy
+        response.headers['Referrer-Policy'] = 'strict-origin-when-cross-origin'
+        
+        # Permissions policy
+        response.headers['Permissions-Policy'] = PERMISSIONS_POLICY
+        
+        # CSP (Content Security Policy)
+        if not current_app.debug:
+            response.headers['Content-Security-Policy'] = CSP_POLICY
         
         return response
     
     def is_ip_blocked(self, ip: str) -> bool:
-        """Проверка, заблокирован ли IP."""
+        """Проверка, заблокирован ли IP (общий список блокировок, с подсетями)."""
         if not ip:
             return False
-        return ip in self.blocked_ips
+        return ip_blocklist.is_blocked(ip)
     
     def block_ip(self, ip: str, reason: str = "Security violation"):
-        """Блокировка IP адреса."""
+        """Блокировка IP адреса на block_duration минут."""
         if ip and self.enable_ip_blocking:
-            self.blocked_ips.add(ip)
-            current_app.logger.warning(f"IP blocked: {ip}, reason: {reason}")
+            ip_blocklist.block(ip, reason=reason, source='security')
     
     def unblock_ip(self, ip: str):
         """Разблокировка IP адреса."""
-        if ip in self.blocked_ips:
-            self.blocked_ips.remove(ip)
-            current_app.logger.info(f"IP unblocked: {ip}")
+        ip_blocklist.unblock(ip)
     
     def check_rate_limit(self, ip: str) -> bool:
-        """Проверка rate limiting."""
+        """Проверка rate limiting (общий ограничитель GCRA, см. app.rate_limit)."""
         if not ip:
             return True
         
-        now = time.time()
-        minute_ago = now - 60
-        
-        # Очистка старых записей
-        if ip in self.rate_limit_store:
-            self.rate_limit_store[ip] = [
-                timestamp for timestamp in self.rate_limit_store[ip] 
-                if timestamp > minute_ago
-            ]
-        else:
-            self.rate_limit_store[ip] = []
-        
-        # Проверка лимита
-        if len(self.rate_limit_store[ip]) >= self.max_requests_per_minute:
-            return False
-        
-        # Добавление текущего запроса
-        self.rate_limit_store[ip].append(now)
-        return True
+        from app import limiter
+        return limiter.check('security', ip, [self.rate_limit])
     
-    def has_suspicious_content(self) -> bool:
-        """Проверка на подозрительный контент."""
+    def has_suspicious_content(self, ctx: RequestContext) -> bool:
+        """Проверка на подозрительный контент (один проход по каждому полю)."""
         # Для API endpoints отключаем строгую проверку
-        if request.path.startswith('/api/') or request.path.startswith('/client/api/'):
+        if ctx.is_api:
             return False
-            
-        content_to_check = [
-            request.url,
-            request.get_data(as_text=True) if request.content_length else '',
-            str(request.headers),
-            ' '.join(request.args.values()),
-        ]
         
-        for content in content_to_check:
-            if content:
-                content_lower = content.lower()
-                for pattern in self.suspicious_patterns:
-                    if re.search(pattern, content_lower, re.IGNORECASE):
-                        return True
+        rule = self.content_filter.scan_fields([
+            request.path,
+            request.query_string.decode('latin-1'),
+            *request.args.values(),
+            *request.headers.values(),
+        ])
+        # Тело читается не дальше лимита проверки; загрузки файлов не сканируются
+        if (rule is None and request.content_length
+                and not request.mimetype.startswith('multipart/')):
+            rule = self.content_filter.scan_body(_peek_body(self.content_filter.max_body_bytes))
         
+        if rule:
+            g.security_rule = rule
+            current_app.logger.warning(f"SECURITY: content rule '{rule}' matched for {request.path}")
+            return True
         return False
     
-    def is_valid_user_agent(self, user_agent: str) -> bool:
+    def is_valid_user_agent(self, user_agent: str, is_api: bool = False) -> bool:
         """Проверка валидности User-Agent."""
         if not user_agent:
             return True  # Разрешаем пустой User-Agent
@@ -221,7 +225,7 @@ class SecurityMiddleware:
         user_agent_lower = user_agent.lower()
         
         # Для API endpoints разрешаем программные User-Agent
-        if request.path.startswith('/api/') or request.path.startswith('/client/api/'):
+        if is_api:
             return True
         
         # Блокируем известные сканеры для веб-интерфейса
@@ -259,6 +263,7 @@ security_middleware = SecurityMiddleware()
 
 def init_security(app: Flask):
     """Инициализация системы безопасности."""
+    ip_blocklist.init_app(app)
     security_middleware.init_app(app)
     app.logger.info("Security middleware initialized")
     
@@ -0,0 +1,443 @@
+"""Серверные сессии с редким обновлением активности и массовым отзывом.
+
+В cookie лежит только случайный идентификатор сессии, данные - в общем
+хранилище (``SESSION_STORAGE_URL``: Redis, файл SQLite или память
+процесса; по умолчанию файл SQLite в instance). Недоступное хранилище
+останавливает запуск: тихий переход на память процесса разлогинивал бы
+воркеры друг для друга и терял отзыв сессий. Cookie и запись в хранилище меняются
+только при изменении данных сессии. Время последней активности
+обновляется отдельной короткой операцией и не чаще раза в
+``SESSION_ACTIVITY_RESOLUTION_SECONDS``.
+
+Массовый отзыв без перебора сессий - через номера поколений. При входе
+сессия запоминает текущие номера ключей ``all``, ``role:<роль>`` и
+``staff:<id>``. Отзыв увеличивает номер ключа, и при следующем запросе
+сессия с меньшим номером считается недействительной. Номера кэшируются в
+воркере и сверяются с хранилищем не чаще ``SESSION_REVOCATION_SYNC_SECONDS``.
+"""
+
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import Flask
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+# Ключи отзыва: все сессии, роль, сотрудник
+REVOCATION_SCOPES = ('all', 'role', 'staff')
+
+
+class MemoryStore:
+    """Сессии в памяти процесса (одиночный воркер, разработка)."""
+
+    def __init__(self):
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid: str, now: float) -> Optional[Dict[str, Any]]:
+        record = self._sessions.get(sid)
+        if record is None or record['expires'] <= now:
+            return None
+        return dict(record)
+
+    def save(self, sid: str, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._sessions[sid] = dict(record)
+
+    def touch(self, sid: str, last_activity: float, expires: float) -> None:
+        with self._lock:
+            record = self._sessions.get(sid)
+            if record is not None:
+                record['last_activity'] = last_activity
+                record['expires'] = expires
+
+    def delete(self, sid: str) -> None:
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def purge(self, now: float) -> int:
+        with self._lock:
+            expired = [sid for sid, record in self._sessions.items() if record['expires'] <= now]
+            for sid in expired:
+                del self._sessions[sid]
+            return len(expired)
+
+    def generations(self) -> Dict[str, int]:
+        return dict(self._generations)
+
+    def bump(self, key: str) -> int:
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            return self._generations[key]
+
+
+class RedisStore:
+    """Сессия - хеш Redis с TTL, номера поколений - в общем хеше."""
+
+    def __init__(self, url: str, prefix: str = 'session'):
+        import redis
+        self.client = redis.from_url(url)
+        self.client.ping()
+        self.prefix = prefix
+        self.generations_key = f'{prefix}:generations'
+
+    def _key(self, sid: str) -> str:
+        return f'{self.prefix}:{sid}'
+
+    def load(self, sid: str, now: float) -> Optional[Dict[str, Any]]:
+        values = self.client.hgetall(self._key(sid))
+        if not values:
+            return None
+        record = json.loads(values[b'meta'])
+        record['data'] = values[b'data'].decode('utf-8')
+        record['last_activity'] = float(values[b'last_activity'])
+        return record
+
+    def save(self, sid: str, record: Dict[str, Any]) -> None:
+        meta = {key: value for key, value in record.items() if key not in ('data', 'last_activity')}
+        key = self._key(sid)
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping={'data': record['data'], 'last_activity': record['last_activity'],
+                                'meta': json.dumps(meta)})
+        pipe.expireat(key, int(record['expires']) + 1)
+        pipe.execute()
+
+    def touch(self, sid: str, last_activity: float, expires: float) -> None:
+        key = self._key(sid)
+        pipe = self.client.pipeline()
+        pipe.hset(key, 'last_activity', last_activity)
+        pipe.expireat(key, int(expires) + 1)
+        pipe.execute()
+
+    def delete(self, sid: str) -> None:
+        self.client.delete(self._key(sid))
+
+    def purge(self, now: float) -> int:
+        return 0  # Истекшие ключи удаляет сам Redis
+
+    def generations(self) -> Dict[str, int]:
+        return {key.decode('utf-8'): int(value) for key, value in self.client.hgetall(self.generations_key).items()}
+
+    def bump(self, key: str) -> int:
+        return int(self.client.hincrby(self.generations_key, key, 1))
+
+
+class SQLiteStore:
+    """Сессии в файле SQLite (WAL) - общий для воркеров одной машины."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, '
+                     'meta TEXT NOT NULL, last_activity REAL NOT NULL, expires REAL NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_sessions_expires ON sessions (expires)')
+        conn.execute('CREATE TABLE IF NOT EXISTS session_generations (key TEXT PRIMARY KEY, generation INTEGER NOT NULL)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid: str, now: float) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            'SELECT data, meta, last_activity FROM sessions WHERE sid = ? AND expires > ?', (sid, now)
+        ).fetchone()
+        if row is None:
+            return None
+        record = json.loads(row[1])
+        record['data'] = row[0]
+        record['last_activity'] = row[2]
+        return record
+
+    def save(self, sid: str, record: Dict[str, Any]) -> None:
+        meta = {key: value for key, value in record.items() if key not in ('data', 'last_activity')}
+        self._connect().execute(
+            'INSERT INTO sessions (sid, data, meta, last_activity, expires) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(sid) DO UPDATE SET data = excluded.data, meta = excluded.meta, '
+            'last_activity = excluded.last_activity, expires = excluded.expires',
+            (sid, record['data'], json.dumps(meta), record['last_activity'], record['expires'])
+        )
+
+    def touch(self, sid: str, last_activity: float, expires: float) -> None:
+        self._connect().execute('UPDATE sessions SET last_activity = ?, expires = ? WHERE sid = ?',
+                                (last_activity, expires, sid))
+
+    def delete(self, sid: str) -> None:
+        self._connect().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def purge(self, now: float) -> int:
+        return self._connect().execute('DELETE FROM sessions WHERE expires <= ?', (now,)).rowcount
+
+    def generations(self) -> Dict[str, int]:
+        return dict(self._connect().execute('SELECT key, generation FROM session_generations').fetchall())
+
+    def bump(self, key: str) -> int:
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('INSERT INTO session_generations (key, generation) VALUES (?, 1) '
+                         'ON CONFLICT(key) DO UPDATE SET generation = generation + 1', (key,))
+            return conn.execute('SELECT generation FROM session_generations WHERE key = ?', (key,)).fetchone()[0]
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Данные сессии; в cookie - только sid."""
+
+    def __init__(self, initial: Optional[Dict[str, Any]] = None, sid: Optional[str] = None,
+                 new: bool = True, last_activity: Optional[float] = None,
+                 generations: Optional[Dict[str, int]] = None):
+        def on_update(session):
+            session.modified = True
+            session.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+        # Время последней активности по хранилищу (None - новая сессия)
+        self.last_activity = last_activity
+        self.generations = generations or {}
+        self.loaded_user_id = self.get('_user_id')
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask SessionInterface поверх хранилища сессий."""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store_owner: 'SessionStore'):
+        self.owner = store_owner
+
+    def open_session(self, app: Flask, request) -> ServerSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or len(sid) > 64:
+            return ServerSession(sid=self.owner.new_sid())
+
+        now = time.time()
+        try:
+            record = self.owner.store.load(sid, now)
+        except Exception as e:
+            app.logger.error(f"Session store load failed: {e}")
+            record = None
+        if record is None or self.owner.is_revoked(record):
+            return ServerSession(sid=self.owner.new_sid())
+
+        try:
+            data = self.serializer.loads(record['data'])
+        except Exception:
+            data = {}
+        return ServerSession(data, sid=sid, new=False, last_activity=record['last_activity'],
+                             generations=record.get('generations'))
+
+    def save_session(self, app: Flask, session: ServerSession, response) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        # Сессия очищена (выход) - удаляем запись и cookie
+        if not session:
+            if session.modified and not session.new:
+                self.owner.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+            return
+
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        # Запас на редкое обновление активности: запись живет до проверки таймаута
+        expires = now + lifetime + 2 * self.owner.activity_resolution
+
+        if not session.modified:
+            # Данные не менялись: только время активности, и то не чаще раза в resolution
+            if session.new or (session.last_activity is not None
+                               and now - session.last_activity < self.owner.activity_resolution):
+                return
+            self.owner.touch(session.sid, now, expires)
+            if session.permanent:
+                # Продлеваем срок cookie тем же редким шагом
+                response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                    httponly=httponly, domain=domain, path=path, secure=secure,
+                                    samesite=samesite)
+            return
+
+        user_id = session.get('_user_id')
+        if user_id != session.loaded_user_id:
+            # Вход или смена пользователя: новый sid (защита от фиксации) и отметка поколений
+            if not session.new:
+                self.owner.delete(session.sid)
+            session.sid = self.owner.new_sid()
+            session.generations = self.owner.stamp(user_id)
+
+        self.owner.save(session.sid, {
+            'data': self.serializer.dumps(dict(session)),
+            'last_activity': now,
+            'expires': expires,
+            'user_id': user_id,
+            'generations': session.generations,
+        })
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                            httponly=httponly, domain=domain, path=path, secure=secure, samesite=samesite)
+
+
+class SessionStore:
+    """Хранилище серверных сессий и номера поколений для отзыва."""
+
+    def __init__(self):
+        self.store = MemoryStore()
+        self.activity_resolution = 60.0
+        self.sync_interval = 1.0
+        self._generations: Dict[str, int] = {}
+        self._next_sync = 0.0
+        self._next_purge = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app: Flask) -> None:
+        """Выбор хранилища и подключение интерфейса сессий."""
+        self.activity_resolution = float(app.config.get('SESSION_ACTIVITY_RESOLUTION_SECONDS', 60))
+        self.sync_interval = float(app.config.get('SESSION_REVOCATION_SYNC_SECONDS', 1.0))
+        url = app.config.get('SESSION_STORAGE_URL') or 'sqlite:///'
+        try:
+            if url.startswith('redis'):
+                self.store = RedisStore(url)
+            elif url.startswith('sqlite:///'):
+                path = url[len('sqlite:///'):] or os.path.join(app.instance_path, 'sessions.sqlite3')
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self.store = SQLiteStore(path)
+            elif url.startswith('memory://'):
+                self.store = MemoryStore()
+            else:
+                raise ValueError(f"Unsupported session storage URL: {url}")
+        except Exception as e:
+            raise RuntimeError(f"Session store {url.split('://')[0]} is unavailable: {e}") from e
+        app.logger.info(f"Хранилище сессий: {url.split('://')[0]}")
+        self._next_sync = 0.0
+        app.session_interface = ServerSessionInterface(self)
+
+    @staticmethod
+    def new_sid() -> str:
+        return secrets.token_urlsafe(32)
+
+    # --- запись ---
+
+    def save(self, sid: str, record: Dict[str, Any]) -> None:
+        self.store.save(sid, record)
+        now = time.time()
+        if now >= self._next_purge:
+            self._next_purge = now + 300
+            self.store.purge(now)
+
+    def touch(self, sid: str, last_activity: float, expires: float) -> None:
+        self.store.touch(sid, last_activity, expires)
+
+    def delete(self, sid: str) -> None:
+        self.store.delete(sid)
+
+    # --- отзыв ---
+
+    @staticmethod
+    def revocation_keys(user_id: Optional[str], role: Optional[str] = None) -> List[str]:
+        keys = ['all']
+        if role:
+            keys.append(f'role:{role}')
+        if user_id:
+            keys.append(f'staff:{user_id}')
+        return keys
+
+    def _current_generations(self, force: bool = False) -> Dict[str, int]:
+        now = time.monotonic()
+        if force or now >= self._next_sync:
+            with self._lock:
+                if force or now >= self._next_sync:
+                    self._generations = self.store.generations()
+                    self._next_sync = now + self.sync_interval
+        return self._generations
+
+    def stamp(self, user_id: Optional[str]) -> Dict[str, int]:
+        """Текущие номера поколений для новой сессии пользователя."""
+        staff_id = role = None
+        if user_id:
+            from app.utils.staff_identity import staff_identity
+            try:
+                staff_id = self.parse_login_id(user_id)[0]
+                principal = staff_identity.get(staff_id)
+                role = principal.role if principal else None
+            except (TypeError, ValueError):
+                pass
+        current = self._current_generations(force=True)
+        return {key: current.get(key, 0) for key in self.revocation_keys(staff_id, role)}
+
+    # --- ID для Flask-Login ---
+    #
+    # Remember-cookie Flask-Login содержит session['_user_id'], то есть get_id()
+    # сотрудника. В ID входят номера поколений его ключей отзыва: после отзыва
+    # сессий cookie не совпадает с текущими номерами и не восстанавливает вход.
+
+    def remember_token(self, staff_id: int, role: Optional[str], force: bool = False) -> str:
+        """Номера поколений ключей сотрудника в виде "all.role.staff"."""
+        current = self._current_generations(force=force)
+        return '.'.join(str(current.get(key, 0)) for key in self.revocation_keys(staff_id, role))
+
+    def login_id(self, staff_id: int, role: Optional[str]) -> str:
+        """ID сотрудника для Flask-Login: "<id>:<номера поколений>"."""
+        return f'{staff_id}:{self.remember_token(staff_id, role, force=True)}'
+
+    @staticmethod
+    def parse_login_id(user_id: str) -> Tuple[int, Optional[str]]:
+        """
+        Разбор ID Flask-Login.
+
+        Returns:
+            (staff_id, token): token None для ID без номеров поколений (сессии до их введения)
+
+        Raises:
+            ValueError: ID не число
+        """
+        staff_id, separator, token = str(user_id).partition(':')
+        return int(staff_id), (token if separator else None)
+
+    def is_revoked(self, record: Dict[str, Any]) -> bool:
+        """Отозвана ли сессия: номер хоть одного ее ключа с тех пор вырос."""
+        stamped = record.get('generations') or {}
+        if not stamped:
+            return False
+        current = self._current_generations()
+        return any(current.get(key, 0) > generation for key, generation in stamped.items())
+
+    def revoke(self, scope: str, value: Optional[Any] = None) -> int:
+        """
+        Отзыв сессий без перебора: all, role (value - роль) или staff (value - id).
+
+        Returns:
+            int: Новый номер поколения ключа
+        """
+        if scope not in REVOCATION_SCOPES:
+            raise ValueError(f"Unknown revocation scope: {scope}")
+        if scope != 'all' and not value:
+            raise ValueError(f"Revocation scope {scope} requires a value")
+        key = 'all' if scope == 'all' else f'{scope}:{value}'
+        generation = self.store.bump(key)
+        self._current_generations(force=True)
+        return generation
+
+
+# Глобальный экземпляр
+session_store = SessionStore()
@@ -0,0 +1,159 @@
+"""Кэш идентичности сотрудника для Flask-Login.
+
+``current_user`` на каждом запросе - неизменяемый ``StaffPrincipal`` (id,
+login, name, role, is_active), а не ORM-объект ``Staff``: модель при
+загрузке подтягивает selectin'ом все заказы и назначения официанта.
+Principal хранится в памяти процесса ``STAFF_IDENTITY_TTL_SECONDS`` и
+сбрасывается при изменении или удалении сотрудника (события SQLAlchemy,
+после commit). В других воркерах изменение видно не позже чем через TTL.
+Если нужен сам сотрудник - ``current_user.staff()``.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from flask import Flask
+
+
+@dataclass(frozen=True)
+class StaffPrincipal:
+    """Неизменяемые данные сотрудника для current_user."""
+
+    id: int
+    login: str
+    name: str
+    role: str
+    is_active: bool
+
+    # Интерфейс пользователя Flask-Login
+    @property
+    def is_authenticated(self) -> bool:
+        return True
+
+    @property
+    def is_anonymous(self) -> bool:
+        return False
+
+    def get_id(self) -> str:
+        return str(self.id)
+
+    # Те же проверки ролей, что у модели Staff
+    def has_role(self, role_name: str) -> bool:
+        """Проверка наличия роли."""
+        return self.role == role_name
+
+    def is_waiter(self) -> bool:
+        """Проверка, является ли официантом."""
+        return self.role == 'waiter'
+
+    def is_admin(self) -> bool:
+        """Проверка, является ли администратором."""
+        return self.role == 'admin'
+
+    def is_kitchen(self) -> bool:
+        """Проверка, работает ли на кухне."""
+        return self.role == 'kitchen'
+
+    def is_bar(self) -> bool:
+        """Проверка, работает ли в баре."""
+        return self.role == 'bar'
+
+    def staff(self):
+        """ORM-объект сотрудника (запрос к БД)."""
+        from app import db
+        from app.models import Staff
+        return db.session.get(Staff, self.id)
+
+
+class StaffIdentityCache:
+    """Principal сотрудников в памяти процесса с коротким TTL."""
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[int, Tuple[StaffPrincipal, float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app: Flask) -> None:
+        """Настройки и подписка на изменения сотрудников."""
+        from app.models import Staff
+
+        self.ttl = float(app.config.get('STAFF_IDENTITY_TTL_SECONDS', 30))
+        self.max_entries = int(app.config.get('STAFF_IDENTITY_MAX_ENTRIES', 1000))
+
+        if not sa.event.contains(Staff, 'after_update', self._on_staff_changed):
+            sa.event.listen(Staff, 'after_update', self._on_staff_changed)
+            sa.event.listen(Staff, 'after_delete', self._on_staff_changed)
+            sa.event.listen(so.Session, 'after_commit', self._on_commit)
+            sa.event.listen(so.Session, 'after_rollback', self._on_rollback)
+
+    def get(self, staff_id: int) -> Optional[StaffPrincipal]:
+        """Principal по id; None, если сотрудник не найден или деактивирован."""
+        now = time.monotonic()
+        entry = self._entries.get(staff_id)
+        if entry is not None and entry[1] > now:
+            self.hits += 1
+            principal = entry[0]
+        else:
+            self.misses += 1
+            principal = self._load(staff_id)
+            if principal is not None:
+                with self._lock:
+                    if len(self._entries) >= self.max_entries:
+                        self._entries.clear()
+                    self._entries[staff_id] = (principal, now + self.ttl)
+        return principal if principal is not None and principal.is_active else None
+
+    @staticmethod
+    def _load(staff_id: int) -> Optional[StaffPrincipal]:
+        # Только нужные колонки: без selectin-загрузки заказов и назначений
+        from app import db
+        from app.models import Staff
+
+        row = db.session.execute(
+            sa.select(Staff.id, Staff.login, Staff.name, Staff.role, Staff.is_active)
+            .where(Staff.id == staff_id)
+        ).first()
+        if row is None:
+            return None
+        return StaffPrincipal(id=row.id, login=row.login, name=row.name, role=row.role,
+                              is_active=bool(row.is_active))
+
+    def invalidate(self, staff_id: Optional[int] = None) -> None:
+        """Сброс одного сотрудника или всего кэша."""
+        with self._lock:
+            if staff_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(staff_id, None)
+
+    def _on_staff_changed(self, mapper, connection, target) -> None:
+        # Сразу - чтобы этот воркер не отдал старые данные; и еще раз после commit,
+        # если между flush и commit principal успели загрузить из старой версии
+        self.invalidate(target.id)
+        session = so.object_session(target)
+        if session is not None:
+            session.info.setdefault('staff_identity_changed', set()).add(target.id)
+
+    def _on_commit(self, session) -> None:
+        changed: Set[int] = session.info.pop('staff_identity_changed', None)
+        if changed:
+            for staff_id in changed:
+                self.invalidate(staff_id)
+
+    def _on_rollback(self, session) -> None:
+        session.info.pop('staff_identity_changed', None)
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики попаданий и размер кэша."""
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# Глобальный экземпляр
+staff_identity = StaffIdentityCache()
@@ -0,0 +1,256 @@
+"""Потоковый экспорт логов аудита, заказов и позиций заказов.
+
+Строки читаются курсором на стороне сервера (``yield_per``) и сразу
+отдаются клиенту кусками CSV или NDJSON через потоковый ответ Flask.
+Память не зависит от объема выгрузки, а первые байты уходят клиенту
+до окончания чтения, поэтому экспорт за месяц не упирается в таймаут.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from flask import Response, current_app, stream_with_context
+from werkzeug.datastructures import MultiDict
+
+from app import db
+from app.errors import ValidationError
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+# Ячейки, которые Excel/LibreOffice считают формулой
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+DEFAULT_CHUNK_ROWS = 1000
+
+
+def _parse_date(value: Optional[str], field: str, end_of_day: bool = False) -> Optional[datetime]:
+    """Дата YYYY-MM-DD или ISO 8601; для конца периода без времени - конец дня."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValidationError(f"Неверный формат даты в {field}", field=field)
+    if end_of_day and len(value) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return parsed
+
+
+def _int_arg(args: MultiDict, name: str) -> Optional[int]:
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError(f"{name} должно быть числом", field=name)
+
+
+def _audit_logs(args: MultiDict) -> Tuple[List[str], Any]:
+    from app.models import AuditLog, Staff
+
+    details = {
+        key[len('details.'):]: value
+        for key, value in args.items()
+        if key.startswith('details.') and value != ''
+    }
+    try:
+        query = AuditLog.search(
+            staff_id=_int_arg(args, 'staff_id'),
+            action=args.get('action') or None,
+            table_id=_int_arg(args, 'table_id'),
+            order_id=_int_arg(args, 'order_id'),
+            ip_address=args.get('ip_address') or None,
+            date_from=_parse_date(args.get('date_from'), 'date_from'),
+            date_to=_parse_date(args.get('date_to'), 'date_to', end_of_day=True),
+            details=details,
+            details_path=args.get('details_path') or None,
+        )
+    except ValueError as e:
+        raise ValidationError(str(e))
+
+    columns = ['id', 'created_at', 'action', 'staff_id', 'staff_name', 'ip_address',
+               'table_id', 'order_id', 'details']
+    query = query.outerjoin(Staff, Staff.id == AuditLog.staff_id).with_entities(
+        AuditLog.id, AuditLog.created_at, AuditLog.action, AuditLog.staff_id, Staff.name,
+        AuditLog.ip_address, AuditLog.table_affected, AuditLog.order_affected, AuditLog.details
+    )
+    return columns, query
+
+
+def _order_filters(query, args: MultiDict):
+    from app.models import Order
+
+    status = args.get('status')
+    table_id = _int_arg(args, 'table_id')
+    waiter_id = _int_arg(args, 'waiter_id')
+    start = _parse_date(args.get('start_date') or args.get('date_from'), 'start_date')
+    end = _parse_date(args.get('end_date') or args.get('date_to'), 'end_date', end_of_day=True)
+
+    if status:
+        query = query.filter(Order.status == status)
+    if table_id:
+        query = query.filter(Order.table_id == table_id)
+    if waiter_id:
+        query = query.filter(Order.waiter_id == waiter_id)
+    if start:
+        query = query.filter(Order.created_at >= start)
+    if end:
+        query = query.filter(Order.created_at <= end)
+    return query
+
+
+def _orders(args: MultiDict) -> Tuple[List[str], Any]:
+    from app.models import Order, Staff
+
+    columns = ['id', 'created_at', 'table_id', 'status', 'guest_count', 'waiter_id', 'waiter_name',
+               'subtotal', 'service_charge', 'discount_amount', 'total_amount', 'bonus_card_id',
+               'language', 'confirmed_at', 'completed_at', 'cancelled_at', 'comments']
+    query = db.session.query(
+        Order.id, Order.created_at, Order.table_id, Order.status, Order.guest_count,
+        Order.waiter_id, Staff.name, Order.subtotal, Order.service_charge, Order.discount_amount,
+        Order.total_amount, Order.bonus_card_id, Order.language, Order.confirmed_at,
+        Order.completed_at, Order.cancelled_at, Order.comments
+    ).outerjoin(Staff, Staff.id == Order.waiter_id)
+    return columns, _order_filters(query, args).order_by(Order.created_at.desc(), Order.id.desc())
+
+
+def _order_items(args: MultiDict) -> Tuple[List[str], Any]:
+    from app.models import Order, OrderItem, MenuItem, MenuItemSize
+
+    columns = ['id', 'order_id', 'order_created_at', 'table_id', 'order_status', 'menu_item_id',
+               'menu_item_name', 'size', 'quantity', 'unit_price', 'total_price',
+               'preparation_type', 'comments']
+    query = db.session.query(
+        OrderItem.id, OrderItem.order_id, Order.created_at, Order.table_id, Order.status,
+        OrderItem.menu_item_id, MenuItem.name_ru, MenuItemSize.size_name_ru, OrderItem.quantity,
+        OrderItem.unit_price, OrderItem.total_price, OrderItem.preparation_type, OrderItem.comments
+    ).join(
+        Order, Order.id == OrderItem.order_id
+    ).join(
+        MenuItem, MenuItem.id == OrderItem.menu_item_id
+    ).outerjoin(
+        MenuItemSize, MenuItemSize.id == OrderItem.size_id
+    )
+    order_id = _int_arg(args, 'order_id')
+    if order_id:
+        query = query.filter(OrderItem.order_id == order_id)
+    return columns, _order_filters(query, args).order_by(Order.created_at.desc(), OrderItem.id)
+
+
+DATASETS: Dict[str, Callable[[MultiDict], Tuple[List[str], Any]]] = {
+    'audit_logs': _audit_logs,
+    'orders': _orders,
+    'order_items': _order_items,
+}
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _csv_value(value: Any) -> Any:
+    """Значение ячейки CSV: даты в ISO, JSON для словарей, защита от формул."""
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False, default=str)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(columns: List[str], rows, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[str]:
+    """Куски CSV по ``chunk_rows`` строк; кавычки и переводы строк экранирует модуль csv."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_MINIMAL, lineterminator='\r\n')
+    # BOM - чтобы Excel открыл кириллицу в UTF-8
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+
+    count = 0
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        count += 1
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(columns: List[str], rows, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[str]:
+    """Куски NDJSON: один JSON-объект на строку."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(
+            {column: _json_value(value) for column, value in zip(columns, row)},
+            ensure_ascii=False, default=str
+        ))
+        if len(lines) >= chunk_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def export_response(dataset: str, fmt: str, args: MultiDict) -> Response:
+    """
+    Потоковый ответ с выгрузкой набора данных.
+
+    Args:
+        dataset: audit_logs, orders или order_items
+        fmt: csv или ndjson
+        args: Фильтры из query string
+
+    Raises:
+        ValidationError: Неизвестный набор, формат или неверный фильтр
+    """
+    if dataset not in DATASETS:
+        raise ValidationError(f"Неизвестный набор данных: {dataset}", field='dataset')
+    if fmt not in FORMATS:
+        raise ValidationError(f"Неподдерживаемый формат: {fmt}", field='format')
+
+    # Фильтры разбираются до начала ответа, чтобы ошибка вернулась как 400
+    columns, query = DATASETS[dataset](args)
+    chunk_rows = int(current_app.config.get('EXPORT_CHUNK_ROWS', DEFAULT_CHUNK_ROWS))
+    rows = query.yield_per(chunk_rows)
+    encoder = iter_csv if fmt == 'csv' else iter_ndjson
+
+    def generate():
+        written = 0
+        try:
+            for chunk in encoder(columns, rows, chunk_rows):
+                written += 1
+                yield chunk
+        except Exception as e:
+            current_app.logger.error(f"Export {dataset} failed after {written} chunks: {e}")
+            raise
+        finally:
+            db.session.rollback()
+
+    filename = f"{dataset}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    return Response(
+        stream_with_context(generate()),
+        mimetype=FORMATS[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no',  # nginx не буферизует поток
+            'Cache-Control': 'no-store',
+        }
+    )
@@ -0,0 +1,279 @@
+"""Логирование через очередь со структурированным JSON и выборкой INFO.
+
+Обработчики файлов и консоли работают в отдельном потоке
+``QueueListener``; в потоке запроса ``QueueHandler`` только кладет запись
+в очередь, поэтому задержка запроса не зависит от скорости диска. При
+переполнении очереди запись отбрасывается и учитывается в счетчике.
+
+В потоке запроса к записи добавляются request_id, endpoint и IP (в потоке
+слушателя контекста запроса нет) и подставляются аргументы сообщения;
+сериализация в JSON (structlog) и запись выполняются в потоке слушателя.
+
+Записи ниже WARNING проходят выборку (``LOG_SAMPLE_RATES``) и ограничение
+частоты (``LOG_RATE_LIMITS``, по умолчанию ``LOG_INFO_RATE_LIMIT``) по
+ключу endpoint'а или имени логгера; WARNING и выше пишутся всегда.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+from flask import Flask, g, has_request_context, request
+from flask.logging import default_handler
+
+from app.rate_limit import MemoryBackend, RateLimit
+
+TEXT_FORMAT = (
+    '%(asctime)s %(name)s %(levelname)s: %(message)s '
+    '[in %(pathname)s:%(lineno)d] [request_id: %(request_id)s]'
+)
+
+
+class RequestContextFilter(logging.Filter):
+    """Поля запроса в записи; выполняется в потоке запроса."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if has_request_context():
+            record.request_id = g.get('request_id', 'no-request')
+            record.endpoint = request.endpoint
+            record.remote_addr = request.remote_addr
+        else:
+            record.request_id = 'no-request'
+            record.endpoint = None
+            record.remote_addr = None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Выборка и ограничение частоты для записей ниже WARNING."""
+
+    def __init__(self, sample_rates: Dict[str, float], rate_limits: Dict[str, RateLimit],
+                 default_limit: Optional[RateLimit], max_keys: int = 1000):
+        super().__init__()
+        self.sample_rates = dict(sample_rates)
+        self.rate_limits = dict(rate_limits)
+        self.default_limit = default_limit
+        self.limiter = MemoryBackend(max_keys)
+        self.sampled_out = 0
+        self.rate_limited = 0
+        # Правило для имени логгера с учетом родителей (app.api.system -> app.api -> app)
+        self._logger_rules: Dict[str, Dict[str, Tuple[Optional[str], Any]]] = {'sample': {}, 'rate': {}}
+
+    def _rule(self, record: logging.LogRecord, kind: str) -> Tuple[Optional[str], Any]:
+        table = self.sample_rates if kind == 'sample' else self.rate_limits
+        endpoint = getattr(record, 'endpoint', None)
+        if endpoint and endpoint in table:
+            return endpoint, table[endpoint]
+
+        cache = self._logger_rules[kind]
+        rule = cache.get(record.name)
+        if rule is None:
+            rule = (None, None)
+            candidate = record.name
+            while candidate:
+                if candidate in table:
+                    rule = (candidate, table[candidate])
+                    break
+                candidate = candidate.rpartition('.')[0]
+            cache[record.name] = rule
+        return rule
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        if self.sample_rates:
+            _, rate = self._rule(record, 'sample')
+            if rate is not None and rate < 1.0 and random.random() >= rate:
+                self.sampled_out += 1
+                return False
+
+        key, limit = self._rule(record, 'rate')
+        if limit is None:
+            key, limit = getattr(record, 'endpoint', None) or record.name, self.default_limit
+        if limit is not None:
+            allowed, _ = self.limiter.hit(key, limit, record.created)
+            if not allowed:
+                self.rate_limited += 1
+                return False
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler без ожидания места в очереди и без форматирования в потоке запроса."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Подставляем аргументы сейчас: объекты могут измениться до записи в файл
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # traceback нельзя держать до потока слушателя - рендерим здесь
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _add_record_fields(logger, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Поля записи stdlib в событие structlog."""
+    record = event_dict.get('_record')
+    if record is not None:
+        # Время создания записи, а не записи в файл
+        event_dict['timestamp'] = datetime.fromtimestamp(record.created, timezone.utc).isoformat()
+        event_dict['request_id'] = getattr(record, 'request_id', None)
+        if getattr(record, 'endpoint', None):
+            event_dict['endpoint'] = record.endpoint
+        if getattr(record, 'remote_addr', None):
+            event_dict['ip'] = record.remote_addr
+        event_dict['where'] = f'{record.pathname}:{record.lineno}'
+        event_dict['thread'] = record.threadName
+        if record.exc_text:
+            event_dict['exception'] = record.exc_text
+    return event_dict
+
+
+def json_formatter() -> logging.Formatter:
+    """Форматтер строки JSON на запись (structlog поверх stdlib)."""
+    return structlog.stdlib.ProcessorFormatter(
+        foreign_pre_chain=[
+            structlog.stdlib.add_log_level,
+            structlog.stdlib.add_logger_name,
+            _add_record_fields,
+        ],
+        processors=[
+            structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+            structlog.processors.JSONRenderer(ensure_ascii=False),
+        ],
+    )
+
+
+class TextFormatter(logging.Formatter):
+    """Прежний текстовый формат (консоль разработки)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, 'request_id'):
+            record.request_id = 'app-init'
+        return super().format(record)
+
+
+class StructuredLogging:
+    """Очередь записей журнала, слушатель с обработчиками и выборка INFO."""
+
+    def __init__(self):
+        self.queue: Optional[queue.Queue] = None
+        self.listener: Optional[QueueListener] = None
+        self.queue_handler: Optional[NonBlockingQueueHandler] = None
+        self.sampling: Optional[SamplingFilter] = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app: Flask) -> None:
+        """Перенос обработчиков app.logger за очередь и запуск слушателя."""
+        log_dir = 'logs'
+        os.makedirs(log_dir, exist_ok=True)
+
+        log_level = logging.DEBUG if app.debug else logging.INFO
+        app.logger.setLevel(log_level)
+
+        handlers = self._build_handlers(app, log_dir, log_level)
+        default_limit = app.config.get('LOG_INFO_RATE_LIMIT')
+        self.sampling = SamplingFilter(
+            sample_rates=app.config.get('LOG_SAMPLE_RATES') or {},
+            rate_limits={key: RateLimit.parse(text) for key, text in (app.config.get('LOG_RATE_LIMITS') or {}).items()},
+            default_limit=RateLimit.parse(default_limit) if default_limit else None,
+        )
+
+        with self._lock:
+            self.stop()
+            self.queue = queue.Queue(maxsize=int(app.config.get('LOG_QUEUE_SIZE', 10000)))
+            self.queue_handler = NonBlockingQueueHandler(self.queue)
+            self.queue_handler.setLevel(log_level)
+            self.queue_handler.addFilter(RequestContextFilter())
+            self.queue_handler.addFilter(self.sampling)
+
+            # Все обработчики app.logger - только в потоке слушателя
+            for handler in list(app.logger.handlers):
+                app.logger.removeHandler(handler)
+            app.logger.addHandler(self.queue_handler)
+
+            self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+            self.listener.start()
+        atexit.register(self.stop)
+
+    @staticmethod
+    def _build_handlers(app: Flask, log_dir: str, log_level: int) -> List[logging.Handler]:
+        formatter = json_formatter() if app.config.get('LOG_FORMAT', 'json') == 'json' \
+            else TextFormatter(TEXT_FORMAT)
+
+        # Файловый обработчик (без ротации для разработки)
+        if app.debug:
+            file_handler = logging.FileHandler(os.path.join(log_dir, 'app.log'))
+        else:
+            file_handler = RotatingFileHandler(
+                os.path.join(log_dir, 'app.log'),
+                maxBytes=10485760,  # 10MB
+                backupCount=10
+            )
+        file_handler.setFormatter(formatter)
+        file_handler.setLevel(log_level)
+
+        # Обработчик ошибок (без ротации для разработки)
+        if app.debug:
+            error_handler = logging.FileHandler(os.path.join(log_dir, 'errors.log'))
+        else:
+            error_handler = RotatingFileHandler(
+                os.path.join(log_dir, 'errors.log'),
+                maxBytes=10485760,
+                backupCount=5
+            )
+        error_handler.setFormatter(formatter)
+        error_handler.setLevel(logging.ERROR)
+
+        # Консоль: в разработке все в текстовом виде, иначе как default_handler Flask
+        console_handler = logging.StreamHandler(sys.stderr)
+        if app.debug:
+            console_handler.setFormatter(TextFormatter(TEXT_FORMAT))
+            console_handler.setLevel(logging.DEBUG)
+        else:
+            console_handler.setFormatter(default_handler.formatter)
+            console_handler.setLevel(log_level)
+
+        return [file_handler, error_handler, console_handler]
+
+    def stop(self) -> None:
+        """Остановка слушателя с дозаписью очереди."""
+        if self.listener is not None:
+            try:
+                self.listener.stop()
+            except Exception:
+                pass
+            self.listener = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики: размер очереди и отброшенные записи."""
+        return {
+            'queue_size': self.queue.qsize() if self.queue else 0,
+            'dropped_queue_full': self.queue_handler.dropped if self.queue_handler else 0,
+            'sampled_out': self.sampling.sampled_out if self.sampling else 0,
+            'rate_limited': self.sampling.rate_limited if self.sampling else 0,
+        }
+
+
+# Глобальный экземпляр
+structured_logging = StructuredLogging()
@@ -18,10 +18,18 @@ def init_websocket(app):
         # Простая инициализация для локальной среды
         socketio.init_app(app)
         app.logger.info("WebSocket сервер инициализирован для локальной среды")
+
+        # Журнал событий для досылки пропущенного после переподключения
+        from .event_log import event_log
+        event_log.init_app(app)
         
         # Импорт обработчиков событий
         from . import events
         
+        # Кухонный/барный дисплей (namespace /kds)
+        from .kds import init_kds
+        init_kds(app)
+        
     except Exception as e:
         app.logger.error(f"Ошибка инициализации WebSocket: {e}")
     
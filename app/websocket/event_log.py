@@ -0,0 +1,221 @@
+"""Журнал WebSocket событий с порядковыми номерами по комнатам.
+
+Каждое событие, отправляемое сервером в комнату, получает монотонно
+растущий номер ``seq`` и сохраняется в кольцевом буфере ограниченного
+размера. При переподключении клиент сообщает последний полученный номер,
+и сервер досылает только пропущенные события. Если разрыв больше буфера,
+клиент получает компактный снимок состояния (см. ``events.build_waiter_snapshot``).
+
+Номера действительны только в пределах эпохи ``epoch``: после перезапуска
+процесса, потери ключей в Redis или перехода с Redis на память нумерация
+начинается заново, и клиент с номером из прежней эпохи получает снимок.
+"""
+
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app
+
+
+class RoomEventLog:
+    """Потокобезопасный кольцевой буфер событий для каждой комнаты."""
+
+    def __init__(self, buffer_size: int = 200):
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._seq: Dict[str, int] = {}
+        self._buffers: Dict[str, deque] = {}
+        self._redis = None
+        self._key_prefix = 'ws_events'
+        # Эпоха буфера в памяти; меняется при каждом переходе с Redis на память
+        self._epoch = self._new_epoch()
+        self._memory_fallback = False
+
+    def init_app(self, app) -> None:
+        """Настройка размера буфера и опционального хранилища в Redis."""
+        self.buffer_size = int(app.config.get('WEBSOCKET_EVENT_BUFFER_SIZE', self.buffer_size))
+        self._buffers = {room: deque(events, maxlen=self.buffer_size)
+                         for room, events in self._buffers.items()}
+
+        if app.config.get('WEBSOCKET_EVENT_LOG_PERSIST'):
+            try:
+                import redis
+                url = app.config.get('WEBSOCKET_EVENT_LOG_REDIS_URL') or app.config['REDIS_URL']
+                self._redis = redis.from_url(url)
+                self._redis.ping()
+                app.logger.info("Журнал WebSocket событий сохраняется в Redis")
+            except Exception as e:
+                self._redis = None
+                app.logger.warning(f"Redis для журнала WebSocket событий недоступен, используется память: {e}")
+
+    @staticmethod
+    def _new_epoch() -> str:
+        return uuid.uuid4().hex[:12]
+
+    def append(self, room: str, event: str, data: Dict[str, Any]) -> Tuple[int, str]:
+        """Регистрация события и присвоение ему порядкового номера и эпохи."""
+        if self._redis is not None:
+            try:
+                result = self._append_redis(room, event, data)
+                self._memory_fallback = False
+                return result
+            except Exception as e:
+                current_app.logger.warning(f"Запись события в Redis не удалась: {e}")
+
+        with self._lock:
+            if self._redis is not None and not self._memory_fallback:
+                # Номера в памяти пересекаются с номерами Redis - начинаем новую эпоху
+                self._memory_fallback = True
+                self._epoch = self._new_epoch()
+                self._seq.clear()
+                self._buffers.clear()
+            seq = self._seq.get(room, 0) + 1
+            self._seq[room] = seq
+            buffer = self._buffers.get(room)
+            if buffer is None:
+                buffer = self._buffers[room] = deque(maxlen=self.buffer_size)
+            buffer.append((seq, event, data, time.time()))
+            return seq, self._epoch
+
+    def current_seq(self, room: str) -> int:
+        """Последний выданный номер события в комнате."""
+        return self.position(room)[0]
+
+    def epoch(self, room: str) -> str:
+        """Эпоха нумерации событий в комнате."""
+        return self.position(room)[1]
+
+    def position(self, room: str) -> Tuple[int, str]:
+        """Последний выданный номер события и эпоха нумерации в комнате."""
+        if self._redis is not None and not self._memory_fallback:
+            try:
+                value = self._redis.get(f'{self._key_prefix}:{room}:seq')
+                return (int(value) if value else 0), self._redis_epoch(room)
+            except Exception:
+                pass
+        with self._lock:
+            return self._seq.get(room, 0), self._epoch
+
+    def events_since(self, room: str, last_seq: int,
+                     epoch: Optional[str] = None) -> Tuple[bool, List[Dict[str, Any]]]:
+        """
+        Получение событий с номером больше ``last_seq``.
+
+        Returns:
+            (complete, events): ``complete`` = False, если часть пропущенных
+            событий уже вытеснена из буфера или ``epoch`` клиента устарела
+            и нужен полный снимок.
+        """
+        current, current_epoch = self.position(room)
+        if epoch is not None and epoch != current_epoch:
+            return False, []
+        entries = self._entries(room)
+
+        # Номер из будущего означает перезапуск сервера - доверять ему нельзя
+        if last_seq < 0 or last_seq > current:
+            return False, []
+        if last_seq == current:
+            return True, []
+
+        oldest = entries[0][0] if entries else current + 1
+        if last_seq + 1 < oldest:
+            return False, []
+
+        missed = [
+            {'seq': seq, 'event': event, 'data': data}
+            for seq, event, data, _ in entries
+            if seq > last_seq
+        ]
+        return True, missed
+
+    def _entries(self, room: str) -> list:
+        if self._redis is not None and not self._memory_fallback:
+            try:
+                raw = self._redis.lrange(f'{self._key_prefix}:{room}:events', 0, -1)
+                entries = []
+                for item in raw:
+                    record = json.loads(item)
+                    entries.append((record['seq'], record['event'], record['data'], record['ts']))
+                return entries
+            except Exception as e:
+                current_app.logger.warning(f"Чтение событий из Redis не удалось: {e}")
+        with self._lock:
+            return list(self._buffers.get(room, ()))
+
+    def _redis_epoch(self, room: str) -> str:
+        # Эпоха создается при первом обращении; если ключи Redis потеряны,
+        # нумерация и эпоха начинаются заново
+        key = f'{self._key_prefix}:{room}:epoch'
+        self._redis.setnx(key, self._new_epoch())
+        value = self._redis.get(key)
+        return value.decode() if isinstance(value, bytes) else str(value)
+
+    def _append_redis(self, room: str, event: str, data: Dict[str, Any]) -> Tuple[int, str]:
+        seq = int(self._redis.incr(f'{self._key_prefix}:{room}:seq'))
+        epoch = self._redis_epoch(room)
+        record = json.dumps({'seq': seq, 'event': event, 'data': data, 'ts': time.time()},
+                            ensure_ascii=False, default=str)
+        key = f'{self._key_prefix}:{room}:events'
+        pipe = self._redis.pipeline()
+        pipe.rpush(key, record)
+        pipe.ltrim(key, -self.buffer_size, -1)
+        pipe.execute()
+        return seq, epoch
+
+
+# Глобальный экземпляр журнала
+event_log = RoomEventLog()
+
+
+def emit_room_event(event: str, data: Dict[str, Any], room: str) -> int:
+    """
+    Отправка события в комнату с порядковым номером.
+
+    Все серверные уведомления для официантов и клиентов должны проходить
+    через эту функцию, чтобы их можно было дослать после переподключения.
+    """
+    from . import socketio
+
+    payload = dict(data)
+    seq, epoch = event_log.append(room, event, payload)
+    payload['seq'] = seq
+    payload['epoch'] = epoch
+    payload['room'] = room
+    socketio.emit(event, payload, room=room)
+    return seq
+
+
+def replay_missed_events(room: str, last_seq: Optional[int], to: str,
+                         epoch: Optional[str] = None) -> bool:
+    """
+    Досылка пропущенных событий конкретному клиенту.
+
+    ``epoch`` - эпоха, в которой клиент получил ``last_seq``; при
+    несовпадении с текущей номера несравнимы и нужен снимок.
+
+    Returns:
+        bool: True, если все пропущенные события досланы, False - если
+        нужен полный снимок состояния.
+    """
+    from . import socketio
+
+    if last_seq is None:
+        return True
+
+    complete, missed = event_log.events_since(room, int(last_seq), epoch)
+    if not complete:
+        return False
+
+    current_epoch = event_log.epoch(room)
+    for entry in missed:
+        payload = dict(entry['data'])
+        payload['seq'] = entry['seq']
+        payload['epoch'] = current_epoch
+        payload['room'] = room
+        payload['replayed'] = True
+        socketio.emit(entry['event'], payload, to=to)
+    return True
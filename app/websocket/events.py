@@ -4,6 +4,7 @@ from flask import current_app, request
 from flask_socketio import emit, join_room, leave_room
 from flask_jwt_extended import decode_token
 from . import socketio
+from .event_log import event_log, emit_room_event, replay_missed_events
 from app.models import Order, WaiterCall, TableAssignment, Staff
 from app import db
 import logging
@@ -23,21 +24,53 @@ def handle_disconnect():
 
 @socketio.on('join_waiter_room')
 def handle_waiter_join(data):
-    """Официант присоединяется к своей комнате."""
+    """
+    Официант присоединяется к своей комнате.
+
+    Клиент может передать ``last_seq`` - словарь {комната: последний номер
+    события} и ``epoch`` - словарь {комната: эпоха нумерации}. Тогда вместо
+    полной перезагрузки ему досылаются только пропущенные события, а если
+    разрыв больше буфера или эпоха сменилась - один снимок состояния.
+    """
     try:
         waiter_id = data.get('waiter_id')
         if waiter_id:
+            waiter_room = f'waiter_{waiter_id}'
+            rooms = [waiter_room, 'all_waiters']
+
             # Присоединяемся к личной комнате официанта
-            join_room(f'waiter_{waiter_id}')
+            join_room(waiter_room)
             
             # Также присоединяемся к общей комнате всех официантов
             join_room('all_waiters')
             
+            positions = {room: event_log.position(room) for room in rooms}
             emit('joined_room', {
                 'message': f'Присоединились к комнате официанта {waiter_id}',
-                'room': f'waiter_{waiter_id}'
+                'room': waiter_room,
+                'seq': {room: seq for room, (seq, _) in positions.items()},
+                'epoch': {room: epoch for room, (_, epoch) in positions.items()}
             })
             
+            last_seq = data.get('last_seq') or {}
+            if isinstance(last_seq, dict) and last_seq:
+                epochs = data.get('epoch')
+                if not isinstance(epochs, dict):
+                    epochs = {}
+                needs_snapshot = False
+                for room in rooms:
+                    if last_seq.get(room) is None:
+                        continue
+                    # Номер без эпохи нельзя сопоставить с текущей нумерацией
+                    epoch = epochs.get(room)
+                    if not epoch or not replay_missed_events(room, last_seq[room], to=request.sid,
+                                                             epoch=epoch):
+                        needs_snapshot = True
+                
+                if needs_snapshot:
+                    emit('sync_snapshot', build_waiter_snapshot(int(waiter_id), rooms))
+                    current_app.logger.info(f"Waiter {waiter_id} resynced with snapshot")
+            
             current_app.logger.info(f"Waiter {waiter_id} joined rooms: waiter_{waiter_id}, all_waiters")
         else:
             emit('error', {'message': 'ID официанта не указан'})
@@ -46,6 +79,75 @@ def handle_waiter_join(data):
         current_app.logger.error(f"Error joining waiter room: {e}")
         emit('error', {'message': 'Ошибка присоединения к комнате'})
 
+def build_waiter_snapshot(waiter_id: int, rooms: list) -> dict:
+    """
+    Компактный снимок состояния официанта для ресинхронизации.
+
+    Заменяет отдельные REST запросы заказов, вызовов и счетчиков, когда
+    пропущенные события уже вытеснены из буфера.
+    """
+    # Номера фиксируем до чтения из БД: событие, пришедшее во время
+    # построения снимка, будет дослано повторно, а не потеряно
+    positions = {room: event_log.position(room) for room in rooms}
+    
+    assigned_table_ids = db.session.query(TableAssignment.table_id).filter_by(
+        waiter_id=waiter_id,
+        is_active=True
+    ).subquery()
+    
+    orders = Order.query.filter(
+        Order.waiter_id == waiter_id,
+        Order.status.in_(['pending', 'confirmed'])
+    ).order_by(Order.created_at.desc()).all()
+    
+    calls = WaiterCall.query.filter(
+        WaiterCall.table_id.in_(assigned_table_ids),
+        WaiterCall.status == 'pending'
+    ).order_by(WaiterCall.created_at.desc()).all()
+    
+    return {
+        'seq': {room: seq for room, (seq, _) in positions.items()},
+        'epoch': {room: epoch for room, (_, epoch) in positions.items()},
+        # Поля совпадают с REST ответами, чтобы страницы отрисовали карточки из снимка
+        'orders': [{
+            'id': order.id,
+            'table_id': order.table_id,
+            'table_number': order.table.table_number if order.table else None,
+            'status': order.status,
+            'guest_count': order.guest_count,
+            'subtotal': float(order.subtotal),
+            'service_charge': float(order.service_charge),
+            'discount_amount': float(order.discount_amount) if order.bonus_card and order.discount_amount else 0.0,
+            'total_amount': float(order.total_amount),
+            'comments': order.comments,
+            'language': order.language,
+            'has_added_items': bool(order.has_added_items),
+            'added_items_confirmed': bool(order.added_items_confirmed),
+            'final_receipt_printed': bool(order.final_receipt_printed),
+            'bonus_card_id': order.bonus_card_id,
+            'bonus_card': {
+                'card_number': order.bonus_card.card_number,
+                'discount_percent': order.bonus_card.discount_percent
+            } if order.bonus_card else None,
+            'created_at': order.created_at.isoformat(),
+            'confirmed_at': order.confirmed_at.isoformat() if order.confirmed_at else None,
+        } for order in orders],
+        'calls': [{
+            'id': call.id,
+            'table_id': call.table_id,
+            'table_number': call.table.table_number if call.table else None,
+            'status': call.status,
+            'priority': getattr(call, 'priority', 'средний'),
+            'message': getattr(call, 'message', 'Вызов официанта'),
+            'created_at': call.created_at.isoformat(),
+            'responded_at': call.responded_at.isoformat() if call.responded_at else None,
+        } for call in calls],
+        'counters': {
+            'pending_orders': sum(1 for order in orders if order.status == 'pending'),
+            'pending_calls': len(calls),
+        }
+    }
+
 @socketio.on('leave_waiter_room')
 def handle_leave_waiter_room(data):
     """Официант покидает свою комнату."""
@@ -79,7 +181,7 @@ def notify_new_order(order_id: int):
         room = f'waiter_{waiter_id}'
         
         # Отправляем уведомление официанту
-        socketio.emit('new_order', {
+        emit_room_event('new_order', {
             'order_id': order.id,
             'table_id': order.table_id,
             'table_number': order.table.table_number if order.table else None,
@@ -89,7 +191,7 @@ def notify_new_order(order_id: int):
             'created_at': order.created_at.isoformat(),
             'message': f'Новый заказ со стола {order.table.table_number if order.table else "N/A"}',
             'sound': 'beep'  # Триггер для звукового уведомления
-        }, room=room)
+        }, room)
         
         logger.info(f"Уведомление о новом заказе {order_id} отправлено официанту {waiter_id}")
         
@@ -114,14 +216,14 @@ def notify_waiter_call(call_id: int):
         room = f'waiter_{waiter_id}'
         
         # Отправляем уведомление официанту
-        socketio.emit('waiter_call', {
+        emit_room_event('waiter_call', {
             'call_id': call.id,
             'table_id': call.table_id,
             'table_number': call.table.table_number if call.table else None,
             'created_at': call.created_at.isoformat(),
             'message': f'Вызов официанта со стола {call.table.table_number if call.table else "N/A"}',
             'sound': 'beep'  # Триггер для звукового уведомления
-        }, room=room)
+        }, room)
         
         logger.info(f"Уведомление о вызове {call_id} отправлено официанту {waiter_id}")
         
@@ -129,17 +231,40 @@ def notify_waiter_call(call_id: int):
         logger.error(f"Ошибка при отправке уведомления о вызове: {e}")
 
 @socketio.on('join_client_room')
-def handle_client_join():
+def handle_client_join(data=None):
     """Клиент присоединяется к общей комнате клиентов."""
     try:
         # Присоединяемся к общей комнате всех клиентов
         join_room('all_clients')
         
+        seq, epoch = event_log.position('all_clients')
         emit('joined_client_room', {
             'message': 'Присоединились к клиентской комнате',
-            'room': 'all_clients'
+            'room': 'all_clients',
+            'seq': seq,
+            'epoch': epoch
         })
         
+        # Досылаем пропущенные обновления; при большом разрыве или смене
+        # эпохи - одно общее обновление
+        last_seq = (data or {}).get('last_seq')
+        client_epoch = (data or {}).get('epoch')
+        if last_seq is not None and not client_epoch:
+            replayed = False
+        else:
+            replayed = replay_missed_events('all_clients', last_seq, to=request.sid,
+                                            epoch=client_epoch)
+        if not replayed:
+            seq, epoch = event_log.position('all_clients')
+            emit('content_updated', {
+                'type': 'menu',
+                'action': 'resync',
+                'message': 'Меню обновлено',
+                'seq': seq,
+                'epoch': epoch,
+                'room': 'all_clients'
+            })
+        
         current_app.logger.info("Client joined room: all_clients")
         
     except Exception as e:
@@ -172,14 +297,14 @@ def broadcast_content_update(content_type: str, action: str, message: str = None
             message = f"{type_names.get(content_type, 'Контент')} {action_names.get(action, 'изменен')}"
         
         # Отправляем уведомление всем клиентам
-        socketio.emit('content_updated', {
+        emit_room_event('content_updated', {
             'type': content_type,
             'action': action,
             'message': message,
             'timestamp': current_app.logger.handlers[0].formatter.formatTime(
                 logging.LogRecord('', 0, '', 0, '', (), None)
             ) if current_app.logger.handlers else None
-        }, room='all_clients')
+        }, 'all_clients')
         
         current_app.logger.info(f"Content update broadcasted: {content_type} - {action} - {message}")
         
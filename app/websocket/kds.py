@@ -0,0 +1,321 @@
+"""Кухонный/барный дисплей (KDS) поверх WebSocket.
+
+Namespace ``/kds`` с комнатами ``kitchen`` и ``bar``. При подтверждении
+заказа позиции раскладываются по станциям и рассылаются экранам как
+тикеты прямо из памяти; повар отмечает готовность позиций ("ready") или
+всего тикета ("bump"), и официант получает уведомление. Печать бумажных
+чеков - лишь один из подписчиков, который можно отключить настройкой
+``kds_print_tickets``.
+
+Тикеты заказа снимаются с экранов и после commit завершения или отмены
+заказа (событие SQLAlchemy). Кроме того, тикет живет не дольше
+``KDS_TICKET_TTL_HOURS``, а открытых тикетов не больше
+``KDS_MAX_OPEN_TICKETS`` - старые вытесняются.
+"""
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from flask import current_app, request
+from flask_login import current_user
+from flask_socketio import emit, join_room, leave_room
+
+from . import socketio
+from .event_log import emit_room_event
+
+KDS_NAMESPACE = '/kds'
+KDS_STATIONS = ('kitchen', 'bar')
+KDS_ROLES = ('kitchen', 'bar', 'admin')
+# Статусы заказа, после которых тикеты больше не нужны
+KDS_CLOSED_STATUSES = ('completed', 'cancelled')
+
+
+class KitchenDisplayBoard:
+    """Открытые тикеты станций в памяти и рассылка их подписчикам."""
+
+    def __init__(self, ttl: float = 12 * 3600, max_tickets: int = 500):
+        self.ttl = ttl
+        self.max_tickets = max_tickets
+        self._lock = threading.Lock()
+        # В порядке поступления: ticket_id -> тикет; срок жизни - отдельно (monotonic)
+        self._tickets: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._expires: Dict[str, float] = {}
+        self._counter = itertools.count(1)
+        self._subscribers: Dict[str, Callable] = {}
+
+    def configure(self, app) -> None:
+        """Срок жизни и предельное число открытых тикетов из конфигурации."""
+        self.ttl = float(app.config.get('KDS_TICKET_TTL_HOURS', 12)) * 3600
+        self.max_tickets = int(app.config.get('KDS_MAX_OPEN_TICKETS', 500))
+
+    def subscribe(self, name: str, callback: Callable) -> None:
+        """
+        Регистрация подписчика на новые тикеты.
+
+        Callback вызывается как ``callback(order, station, items, ticket)``,
+        его результат возвращается из ``publish_order`` под именем ``name``.
+        """
+        self._subscribers[name] = callback
+
+    def unsubscribe(self, name: str) -> None:
+        """Отключение подписчика."""
+        self._subscribers.pop(name, None)
+
+    def publish_order(self, order, items_by_station: Dict[str, List]) -> Dict[str, Dict[str, Any]]:
+        """
+        Публикация позиций заказа на экраны станций.
+
+        Args:
+            order: Подтвержденный заказ
+            items_by_station: {'kitchen': [OrderItem, ...], 'bar': [...]}
+
+        Returns:
+            {станция: {'ticket_id': ..., <подписчик>: <результат>}}
+        """
+        results: Dict[str, Dict[str, Any]] = {}
+
+        for station, items in items_by_station.items():
+            if not items or station not in KDS_STATIONS:
+                continue
+
+            ticket = self._build_ticket(order, station, items)
+            with self._lock:
+                self._tickets[ticket['ticket_id']] = ticket
+                self._expires[ticket['ticket_id']] = time.monotonic() + self.ttl
+                self._evict()
+
+            socketio.emit('ticket_new', ticket, room=station, namespace=KDS_NAMESPACE)
+            results[station] = {'ticket_id': ticket['ticket_id']}
+
+            for name, callback in list(self._subscribers.items()):
+                try:
+                    results[station][name] = callback(order, station, items, ticket)
+                except Exception as e:
+                    current_app.logger.error(f"KDS subscriber '{name}' failed for {station}: {e}")
+                    results[station][name] = None
+
+        return results
+
+    def open_tickets(self, station: str) -> List[Dict[str, Any]]:
+        """Открытые тикеты станции в порядке поступления."""
+        with self._lock:
+            self._evict()
+            tickets = [t for t in self._tickets.values() if t['station'] == station]
+        return sorted(tickets, key=lambda t: t['number'])
+
+    def close_order(self, order_id: int) -> List[Dict[str, Any]]:
+        """Снятие с экранов всех тикетов заказа (заказ завершен или отменен)."""
+        with self._lock:
+            ticket_ids = [ticket_id for ticket_id, t in self._tickets.items() if t['order_id'] == order_id]
+            closed = [self._discard(ticket_id) for ticket_id in ticket_ids]
+        for ticket in closed:
+            socketio.emit('ticket_removed', ticket, room=ticket['station'], namespace=KDS_NAMESPACE)
+        return closed
+
+    def _evict(self) -> None:
+        # Истекшие и лишние сверх лимита тикеты (вызывается под блокировкой);
+        # порядок поступления совпадает с порядком истечения
+        now = time.monotonic()
+        while self._tickets:
+            ticket_id = next(iter(self._tickets))
+            if self._expires[ticket_id] > now and len(self._tickets) <= self.max_tickets:
+                break
+            self._discard(ticket_id)
+
+    def _discard(self, ticket_id: str) -> Dict[str, Any]:
+        self._expires.pop(ticket_id, None)
+        return self._tickets.pop(ticket_id)
+
+    def mark_item_ready(self, ticket_id: str, order_item_id: int) -> Optional[Dict[str, Any]]:
+        """Отметка готовности позиции; тикет закрывается, когда готовы все."""
+        with self._lock:
+            ticket = self._tickets.get(ticket_id)
+            if not ticket:
+                return None
+            for item in ticket['items']:
+                if item['order_item_id'] == order_item_id:
+                    item['status'] = 'ready'
+            if all(item['status'] == 'ready' for item in ticket['items']):
+                return self._close(ticket_id)
+            ticket['status'] = 'in_progress'
+            return ticket
+
+    def bump(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        """Закрытие тикета целиком (кнопка "bump" на экране)."""
+        with self._lock:
+            ticket = self._tickets.get(ticket_id)
+            if not ticket:
+                return None
+            for item in ticket['items']:
+                item['status'] = 'ready'
+            return self._close(ticket_id)
+
+    def _close(self, ticket_id: str) -> Dict[str, Any]:
+        ticket = self._discard(ticket_id)
+        ticket['status'] = 'ready'
+        ticket['ready_at'] = datetime.utcnow().isoformat()
+        return ticket
+
+    def _build_ticket(self, order, station: str, items: List) -> Dict[str, Any]:
+        number = next(self._counter)
+        return {
+            'ticket_id': f'{order.id}-{station}-{number}',
+            'number': number,
+            'station': station,
+            'order_id': order.id,
+            'table_number': order.table.table_number if order.table else None,
+            'waiter_id': order.waiter_id,
+            'waiter_name': order.waiter.name if order.waiter else None,
+            'status': 'new',
+            'created_at': datetime.utcnow().isoformat(),
+            'items': [{
+                'order_item_id': item.id,
+                'name': item.menu_item.name_ru,
+                'size': item.size.size_name_ru if item.size else None,
+                'quantity': item.quantity,
+                'comments': item.comments,
+                'status': 'new',
+            } for item in items],
+        }
+
+
+# Глобальный экземпляр доски тикетов
+kds_board = KitchenDisplayBoard()
+
+
+def print_ticket_subscriber(order, station: str, items: List, ticket: Dict[str, Any]) -> Optional[int]:
+    """
+    Постановка бумажного чека станции в очередь печати.
+
+    Returns:
+        Optional[int]: id задания печати или None, если печать отключена
+    """
+    from app.models import SystemSetting
+    from app.utils.print_service import PrintService
+
+    if SystemSetting.get_setting('kds_print_tickets', 'true').lower() != 'true':
+        return None
+
+    print_service = PrintService()
+    if station == 'kitchen':
+        job = print_service.queue_kitchen_receipt(order, items, waiter_id=order.waiter_id)
+    else:
+        job = print_service.queue_bar_receipt(order, items, waiter_id=order.waiter_id)
+    return job.id
+
+
+def _on_order_updated(mapper, connection, target) -> None:
+    # Завершение/отмену запоминаем в сессии, тикеты снимаем только после commit
+    if target.status in KDS_CLOSED_STATUSES and sa.inspect(target).attrs.status.history.has_changes():
+        session = so.object_session(target)
+        if session is not None:
+            session.info.setdefault('kds_closed_orders', set()).add(target.id)
+
+
+def _on_commit(session) -> None:
+    closed: Set[int] = session.info.pop('kds_closed_orders', None)
+    for order_id in closed or ():
+        try:
+            kds_board.close_order(order_id)
+        except Exception as e:
+            current_app.logger.error(f"KDS close order #{order_id} failed: {e}")
+
+
+def _on_rollback(session) -> None:
+    session.info.pop('kds_closed_orders', None)
+
+
+def init_kds(app) -> None:
+    """Регистрация подписчиков KDS и снятия тикетов закрытых заказов."""
+    from app.models import Order
+
+    kds_board.configure(app)
+    kds_board.subscribe('print_job_id', print_ticket_subscriber)
+    if not sa.event.contains(Order, 'after_update', _on_order_updated):
+        sa.event.listen(Order, 'after_update', _on_order_updated)
+        sa.event.listen(so.Session, 'after_commit', _on_commit)
+        sa.event.listen(so.Session, 'after_rollback', _on_rollback)
+    app.logger.info("KDS инициализирован")
+
+
+def _notify_waiter_ready(ticket: Dict[str, Any]) -> None:
+    """Уведомление официанта о готовности тикета."""
+    socketio.emit('ticket_bumped', ticket, room=ticket['station'], namespace=KDS_NAMESPACE)
+    if ticket.get('waiter_id'):
+        station_name = 'Кухня' if ticket['station'] == 'kitchen' else 'Бар'
+        emit_room_event('order_ready', {
+            'order_id': ticket['order_id'],
+            'table_number': ticket['table_number'],
+            'station': ticket['station'],
+            'items': [item['name'] for item in ticket['items']],
+            'message': f"{station_name}: заказ #{ticket['order_id']} для стола {ticket['table_number']} готов"
+        }, f"waiter_{ticket['waiter_id']}")
+
+
+@socketio.on('connect', namespace=KDS_NAMESPACE)
+def handle_kds_connect():
+    """Подключение экрана KDS (только персонал кухни, бара и администраторы)."""
+    if not current_user.is_authenticated or current_user.role not in KDS_ROLES:
+        return False
+    current_app.logger.info(f"KDS экран подключился: {request.sid} ({current_user.login})")
+
+
+@socketio.on('join_station', namespace=KDS_NAMESPACE)
+def handle_join_station(data):
+    """Экран присоединяется к комнате станции и получает открытые тикеты."""
+    station = (data or {}).get('station')
+    if station not in KDS_STATIONS:
+        emit('error', {'message': 'Неизвестная станция'})
+        return
+
+    join_room(station)
+    emit('tickets_snapshot', {
+        'station': station,
+        'tickets': kds_board.open_tickets(station)
+    })
+
+
+@socketio.on('leave_station', namespace=KDS_NAMESPACE)
+def handle_leave_station(data):
+    """Экран покидает комнату станции."""
+    station = (data or {}).get('station')
+    if station in KDS_STATIONS:
+        leave_room(station)
+
+
+@socketio.on('item_ready', namespace=KDS_NAMESPACE)
+def handle_item_ready(data):
+    """Отметка готовности отдельной позиции тикета."""
+    data = data if isinstance(data, dict) else {}
+    try:
+        order_item_id = int(data.get('order_item_id'))
+    except (TypeError, ValueError):
+        emit('error', {'message': 'Неверный ID позиции'})
+        return
+
+    ticket = kds_board.mark_item_ready(data.get('ticket_id'), order_item_id)
+    if not ticket:
+        emit('error', {'message': 'Тикет не найден'})
+        return
+
+    if ticket['status'] == 'ready':
+        _notify_waiter_ready(ticket)
+    else:
+        socketio.emit('ticket_updated', ticket, room=ticket['station'], namespace=KDS_NAMESPACE)
+
+
+@socketio.on('bump_ticket', namespace=KDS_NAMESPACE)
+def handle_bump_ticket(data):
+    """Закрытие тикета целиком."""
+    ticket = kds_board.bump((data if isinstance(data, dict) else {}).get('ticket_id'))
+    if not ticket:
+        emit('error', {'message': 'Тикет не найден'})
+        return
+
+    _notify_waiter_ready(ticket)
@@ -37,6 +37,11 @@ class BaseConfig:
     }
     ENCRYPTION_KEY: str = os.environ.get('ENCRYPTION_KEY')
     ENCRYPTION_OPTIONS: str = os.environ.get('ENCRYPTION_OPTIONS')
+    FIELD_ENCRYPTION_KEYS: str = os.environ.get('FIELD_ENCRYPTION_KEYS')  # "2:<base64 32 байта>,1:..."; по умолчанию ключ 1 из ENCRYPTION_KEY
+    FIELD_ENCRYPTION_ACTIVE_KEY: str = os.environ.get('FIELD_ENCRYPTION_ACTIVE_KEY')  # Номер ключа для новых значений (по умолчанию наибольший)
+    BONUS_CARD_CACHE_TTL_SECONDS: int = 60  # Снимок карты для /api/bonus-cards/check (сбрасывается при изменении карты)
+    BONUS_CARD_NEGATIVE_TTL_SECONDS: int = 15  # Сколько помнить несуществующий номер карты
+    BONUS_CARD_CACHE_MAX_ENTRIES: int = 5000  # Предел числа номеров в кэше
     
     # JWT настройки
     JWT_SECRET_KEY: str = os.environ.get('JWT_SECRET_KEY') or SECRET_KEY
@@ -55,8 +60,9 @@ class BaseConfig:
     CACHE_DEFAULT_TIMEOUT: int = 300
     
     # Rate limiting
-    RATELIMIT_STORAGE_URL: str = os.environ.get('REDIS_URL', 'redis://localhost:6379/1')
+    RATELIMIT_STORAGE_URL: str = os.environ.get('REDIS_URL', 'redis://localhost:6379/1')  # redis://, sqlite:///path или memory://
     RATELIMIT_DEFAULT: str = "1000 per hour"
+    RATE_LIMIT_MAX_KEYS: int = 10000  # Ключей в памяти процесса (memory:// и запасное хранилище)
     
     # Celery настройки
     CELERY_BROKER_URL: str = REDIS_URL
@@ -70,6 +76,22 @@ class BaseConfig:
     SESSION_COOKIE_HTTPONLY: bool = True
     SESSION_COOKIE_SAMESITE: str = 'Lax'
     PERMANENT_SESSION_LIFETIME: int = 7200  # 2 часа - базовое значение (перезаписывается из БД динамически)
+    SESSION_TIMEOUT_CACHE_SECONDS: int = 30  # Как часто перечитывать session_timeout из БД
+    SESSION_STORAGE_URL: str = os.environ.get('SESSION_STORAGE_URL', 'sqlite:///')  # redis://, sqlite:///path (без пути - файл в instance) или memory://
+    SESSION_ACTIVITY_RESOLUTION_SECONDS: int = 60  # Шаг обновления времени активности (и срока cookie)
+    SESSION_REVOCATION_SYNC_SECONDS: float = 1.0  # Как часто воркер сверяет номера отзыва сессий
+    STAFF_IDENTITY_TTL_SECONDS: int = 30  # Сколько current_user берется из памяти без запроса к БД
+    STAFF_IDENTITY_MAX_ENTRIES: int = 1000
+    
+    # Argon2: параметры подбираются scripts/argon2_tune.py под CPU сервера
+    # (старые хеши пересчитываются при входе); пусто - значения argon2-cffi по умолчанию
+    ARGON2_TIME_COST: int = int(os.environ.get('ARGON2_TIME_COST', '0')) or None
+    ARGON2_MEMORY_COST: int = int(os.environ.get('ARGON2_MEMORY_COST', '0')) or None  # КиБ
+    ARGON2_PARALLELISM: int = int(os.environ.get('ARGON2_PARALLELISM', '0')) or None
+    PASSWORD_HASH_WORKERS: int = int(os.environ.get('PASSWORD_HASH_WORKERS', '0')) or None  # По умолчанию половина ядер
+    PASSWORD_HASH_MAX_PENDING: int = 16  # Сверх этого вход ждет места в очереди
+    PASSWORD_HASH_WAIT_SECONDS: float = 10.0  # Затем отказ 503 "сервер занят"
+    PASSWORD_HASH_MAX_PER_KEY: int = 2  # Одновременных проверок с одного IP
     
     # Файлы
     UPLOAD_FOLDER: str = 'uploads'
@@ -84,7 +106,69 @@ class BaseConfig:
     SECURITY_REQUEST_TIMEOUT: int = 30  # Таймаут запроса в секундах
     SECURITY_ENABLE_IP_BLOCKING: bool = True  # Включить блокировку IP
     SECURITY_ENABLE_CONTENT_FILTERING: bool = True  # Включить фильтрацию контента
+    SECURITY_CONTENT_SCAN_MAX_BYTES: int = 64 * 1024  # Сколько байт тела проверять
+    SECURITY_CONTENT_FILTER_GAP: int = 256  # Окно между ключевыми словами (union ... select)
+    IP_BLOCKLIST_STORAGE_URL: str = os.environ.get('IP_BLOCKLIST_STORAGE_URL')  # По умолчанию как RATELIMIT_STORAGE_URL
+    IP_BLOCKLIST_SYNC_SECONDS: float = 1.0  # Как часто воркер сверяет версию списка блокировок
+    IP_BLOCK_MIN_PREFIX_V4: int = 16  # Ручная блокировка: подсеть IPv4 не шире /16
+    IP_BLOCK_MIN_PREFIX_V6: int = 48  # Ручная блокировка: подсеть IPv6 не шире /48
+    
+    # Конвейер запроса: статика и health-check проходят только стадии заголовков
+    REQUEST_PIPELINE_LIGHT_ENDPOINTS: tuple = ('static', 'favicon', 'system_api.health_check')
+    REQUEST_PIPELINE_SLOW_SECONDS: float = 1.0  # Запросы дольше - WARNING "Slow request"
+    REQUEST_PIPELINE_LOG_REQUESTS: bool = True  # Строка INFO на каждый обычный запрос
     
+    # Логирование: запись в файлы в фоновом потоке, INFO с выборкой и лимитом частоты
+    LOG_FORMAT: str = os.environ.get('LOG_FORMAT', 'json')  # json | text
+    LOG_QUEUE_SIZE: int = 10000  # При переполнении записи отбрасываются (счетчик dropped_queue_full)
+    LOG_INFO_RATE_LIMIT: str = '50 per second'  # На endpoint (вне запроса - на логгер)
+    LOG_RATE_LIMITS: dict = {}  # {'client.get_menu': '5 per second', 'app.api.system': '1 per second'}
+    LOG_SAMPLE_RATES: dict = {  # Доля сохраняемых записей ниже WARNING
+        'client.get_menu': 0.1,
+        'client.get_carousel': 0.1,
+        'client.get_banners': 0.1,
+    }
+    
+    # WebSocket: журнал событий для досылки после переподключения
+    WEBSOCKET_EVENT_BUFFER_SIZE: int = int(os.environ.get('WEBSOCKET_EVENT_BUFFER_SIZE', '200'))
+    WEBSOCKET_EVENT_LOG_PERSIST: bool = os.environ.get('WEBSOCKET_EVENT_LOG_PERSIST', 'false').lower() == 'true'
+    WEBSOCKET_EVENT_LOG_REDIS_URL: str = os.environ.get('WEBSOCKET_EVENT_LOG_REDIS_URL')
+
+    # Аудит: фоновая пакетная запись
+    AUDIT_ASYNC_ENABLED: bool = os.environ.get('AUDIT_ASYNC_ENABLED', 'true').lower() == 'true'
+    AUDIT_QUEUE_SIZE: int = 10000  # При переполнении записи отбрасываются (счетчик dropped)
+    AUDIT_BATCH_SIZE: int = 200
+    AUDIT_FLUSH_INTERVAL_MS: int = 500
+    AUDIT_QUEUE_PUT_TIMEOUT_MS: int = 0  # Сколько запрос может ждать места в очереди
+    AUDIT_POLICY_FILE: str = os.environ.get('AUDIT_POLICY_FILE')  # По умолчанию app/audit_policy.json
+
+    # Аудит: хранение (сроки по действиям - раздел retention файла политики)
+    AUDIT_RETENTION_ENABLED: bool = os.environ.get('AUDIT_RETENTION_ENABLED', 'true').lower() == 'true'
+    AUDIT_RETENTION_HOUR: int = 3  # Ночной запуск в HH:30
+    AUDIT_RETENTION_BATCH_SIZE: int = 5000
+    AUDIT_RETENTION_PAUSE_MS: int = 200
+    AUDIT_RETENTION_MAX_RUNTIME_SECONDS: int = 3600
+    AUDIT_STATS_PAGE_DAYS: int = 30  # Период топа действий на странице аудита
+
+    # Потоковый экспорт: строк на один fetch курсора и один кусок ответа
+    EXPORT_CHUNK_ROWS: int = 1000
+
+    # Очередь печати
+    PRINT_QUEUE_ENABLED: bool = os.environ.get('PRINT_QUEUE_ENABLED', 'true').lower() == 'true'
+    PRINT_QUEUE_POLL_INTERVAL: float = 2.0  # Проверка заданий других процессов, сек
+    PRINT_QUEUE_MAX_ATTEMPTS: int = 5
+    PRINT_QUEUE_RETRY_BASE_SECONDS: float = 2.0  # 2, 4, 8, 16... сек
+    PRINT_QUEUE_RETRY_MAX_SECONDS: float = 60.0
+    PRINT_QUEUE_LEASE_SECONDS: float = 120.0  # Аренда захваченного задания; истекшую забирает другой процесс
+    PRINTER_POOL_MAX_IDLE_SECONDS: float = 120.0  # Переподключение после простоя соединения
+    PRINTER_MONITOR_ENABLED: bool = os.environ.get('PRINTER_MONITOR_ENABLED', 'true').lower() == 'true'
+    PRINTER_MONITOR_INTERVAL: float = 15.0  # Период опроса статуса принтеров, сек
+    PRINTER_MONITOR_TIMEOUT: float = 1.0  # Ожидание ответа на DLE EOT, сек
+
+    # Кухонный дисплей (KDS)
+    KDS_TICKET_TTL_HOURS: float = 12.0  # Тикет без bump/закрытия заказа снимается с экранов
+    KDS_MAX_OPEN_TICKETS: int = 500  # Сверх лимита вытесняются самые старые тикеты
+
     # Принтеры
     PRINTERS = {
         'kitchen': {
@@ -130,9 +214,11 @@ class TestingConfig(BaseConfig):
     
     # Тестовая база данных
     SQLALCHEMY_DATABASE_URI: str = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = {}  # SQLite в памяти не поддерживает pool_size
+    SESSION_STORAGE_URL: str = 'memory://'
     
     # Отключение внешних сервисов
-    CACHE_TYPE: str = "null"
+    CACHE_TYPE: str = "NullCache"
     CELERY_TASK_ALWAYS_EAGER: bool = True
 
 class ProductionConfig(BaseConfig):
@@ -8,6 +8,7 @@
     python manage.py reset-db     # Пересоздание БД
     python manage.py status       # Статус системы
     python manage.py create-admin username password  # Создание администратора
+    python manage.py reencrypt-fields  # Перешифровка полей после смены ключа
 """
 
 import sys
@@ -0,0 +1,47 @@
+"""Add hourly audit statistics rollup table
+
+Revision ID: a4b5c6d7e8f9
+Revises: f3a4b5c6d7e8
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4b5c6d7e8f9'
+down_revision = 'f3a4b5c6d7e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'audit_stats_hourly',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('hour', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('action', sa.String(length=100), nullable=False),
+        sa.Column('staff_id', sa.Integer(), nullable=True),
+        sa.Column('is_error', sa.Boolean(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_audit_stats_hourly_hour', 'audit_stats_hourly', ['hour'])
+    op.create_index('uq_audit_stats_hourly_key', 'audit_stats_hourly',
+                    ['hour', 'action', sa.text('coalesce(staff_id, 0)')], unique=True)
+
+    # Заполнение агрегатов по уже накопленным логам
+    op.execute("""
+        INSERT INTO audit_stats_hourly (hour, action, staff_id, is_error, count)
+        SELECT timezone('UTC', date_trunc('hour', timezone('UTC', created_at))),
+               action, staff_id, action LIKE '%\\_error', count(*)
+        FROM audit_log
+        GROUP BY 1, action, staff_id
+    """)
+
+
+def downgrade():
+    op.drop_index('uq_audit_stats_hourly_key', table_name='audit_stats_hourly')
+    op.drop_index('ix_audit_stats_hourly_hour', table_name='audit_stats_hourly')
+    op.drop_table('audit_stats_hourly')
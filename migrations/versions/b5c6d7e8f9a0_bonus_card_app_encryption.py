@@ -0,0 +1,77 @@
+"""Re-encrypt bonus card names from pgcrypto to application AES-GCM
+
+Revision ID: b5c6d7e8f9a0
+Revises: a4b5c6d7e8f9
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5c6d7e8f9a0'
+down_revision = 'a4b5c6d7e8f9'
+branch_labels = None
+depends_on = None
+
+FIELDS = ('first_name', 'last_name')
+
+
+def _pgcrypto_key():
+    # Без ключа pgp_sym_decrypt/pgp_sym_encrypt падают на первой строке или, хуже,
+    # шифруют ключом NULL - прерываем миграцию до изменений
+    key = current_app.config.get('ENCRYPTION_KEY')
+    if not key:
+        raise RuntimeError("ENCRYPTION_KEY is not set: bonus card names cannot be re-encrypted")
+    return key
+
+
+def _field_encryption():
+    from app.utils.field_encryption import FieldEncryption
+    encryption = FieldEncryption()
+    encryption.init_app(current_app)
+    return encryption
+
+
+def upgrade():
+    key = _pgcrypto_key()
+    encryption = _field_encryption()
+    conn = op.get_bind()
+
+    for field in FIELDS:
+        # Старые значения pgcrypto (пакет OpenPGP, первый байт >= 0x80) расшифровываем одним запросом
+        rows = conn.execute(sa.text(f"""
+            SELECT id, pgp_sym_decrypt({field}, :key) AS value
+            FROM bonus_cards
+            WHERE {field} IS NOT NULL AND get_byte({field}, 0) >= 128
+        """), {'key': key}).fetchall()
+        # Расшифровка дала NULL (или пустую строку, которую encrypt() тоже превращает в NULL) -
+        # строку не трогаем, чтобы не затереть значение
+        params = [
+            {'id': row.id, 'value': encryption.encrypt(row.value, f'bonus_cards.{field}')}
+            for row in rows if row.value
+        ]
+        if params:
+            conn.execute(sa.text(f"UPDATE bonus_cards SET {field} = :value WHERE id = :id"), params)
+
+
+def downgrade():
+    from app.utils.field_encryption import is_encrypted
+
+    key = _pgcrypto_key()
+    encryption = _field_encryption()
+    conn = op.get_bind()
+
+    for field in FIELDS:
+        rows = conn.execute(sa.text(f"SELECT id, {field} AS value FROM bonus_cards WHERE {field} IS NOT NULL")).fetchall()
+        params = [
+            {'id': row.id, 'value': encryption.decrypt(row.value, f'bonus_cards.{field}'), 'key': key}
+            for row in rows if is_encrypted(row.value)
+        ]
+        if params:
+            conn.execute(
+                sa.text(f"UPDATE bonus_cards SET {field} = pgp_sym_encrypt(:value, :key) WHERE id = :id"),
+                params
+            )
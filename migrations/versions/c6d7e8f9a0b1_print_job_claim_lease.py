@@ -0,0 +1,26 @@
+"""Add claim lease columns to print_jobs
+
+Revision ID: c6d7e8f9a0b1
+Revises: b5c6d7e8f9a0
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6d7e8f9a0b1'
+down_revision = 'b5c6d7e8f9a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('print_jobs', sa.Column('claimed_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('print_jobs', sa.Column('claimed_by', sa.String(length=100), nullable=True))
+
+
+def downgrade():
+    op.drop_column('print_jobs', 'claimed_by')
+    op.drop_column('print_jobs', 'claimed_at')
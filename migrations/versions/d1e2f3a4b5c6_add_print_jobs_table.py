@@ -0,0 +1,52 @@
+"""Add print_jobs table for asynchronous print queue
+
+Revision ID: d1e2f3a4b5c6
+Revises: c7d8e9f1a2b3
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1e2f3a4b5c6'
+down_revision = 'c7d8e9f1a2b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'print_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('printer', sa.String(length=20), nullable=False),
+        sa.Column('job_type', sa.String(length=20), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='queued'),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=True),
+        sa.Column('waiter_id', sa.Integer(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('max_attempts', sa.Integer(), nullable=False, server_default='5'),
+        sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('printed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['order_id'], ['orders.id']),
+        sa.ForeignKeyConstraint(['waiter_id'], ['staff.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('print_jobs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_print_jobs_status'), ['status'], unique=False)
+        batch_op.create_index(batch_op.f('ix_print_jobs_order_id'), ['order_id'], unique=False)
+        batch_op.create_index('ix_print_jobs_printer_status_id', ['printer', 'status', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('print_jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_print_jobs_printer_status_id')
+        batch_op.drop_index(batch_op.f('ix_print_jobs_order_id'))
+        batch_op.drop_index(batch_op.f('ix_print_jobs_status'))
+
+    op.drop_table('print_jobs')
@@ -0,0 +1,29 @@
+"""Index audit_log.created_at for batched retention deletes
+
+Revision ID: d7e8f9a0b1c2
+Revises: c6d7e8f9a0b1
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e8f9a0b1c2'
+down_revision = 'c6d7e8f9a0b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Пачки очистки (created_at < граница LIMIT n) без индекса сканируют таблицу целиком;
+    # CONCURRENTLY не блокирует вставки аудита на время построения
+    with op.get_context().autocommit_block():
+        op.create_index('ix_audit_log_created_at', 'audit_log', ['created_at'],
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_audit_log_created_at', table_name='audit_log',
+                      postgresql_concurrently=True, if_exists=True)
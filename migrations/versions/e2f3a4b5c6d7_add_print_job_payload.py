@@ -0,0 +1,24 @@
+"""Add payload column to print_jobs for pre-rendered ESC/POS bytes
+
+Revision ID: e2f3a4b5c6d7
+Revises: d1e2f3a4b5c6
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2f3a4b5c6d7'
+down_revision = 'd1e2f3a4b5c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('print_jobs', sa.Column('payload', sa.LargeBinary(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('print_jobs', 'payload')
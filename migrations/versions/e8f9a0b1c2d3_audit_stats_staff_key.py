@@ -0,0 +1,31 @@
+"""Replace the audit rollup expression key with a staff_key column
+
+Revision ID: e8f9a0b1c2d3
+Revises: d7e8f9a0b1c2
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8f9a0b1c2d3'
+down_revision = 'd7e8f9a0b1c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('audit_stats_hourly', sa.Column('staff_key', sa.Integer(), nullable=False, server_default='0'))
+    op.execute("UPDATE audit_stats_hourly SET staff_key = coalesce(staff_id, 0)")
+    op.alter_column('audit_stats_hourly', 'staff_key', server_default=None)
+    op.drop_index('uq_audit_stats_hourly_key', table_name='audit_stats_hourly')
+    op.create_unique_constraint('uq_audit_stats_hourly_key', 'audit_stats_hourly', ['hour', 'action', 'staff_key'])
+
+
+def downgrade():
+    op.drop_constraint('uq_audit_stats_hourly_key', 'audit_stats_hourly', type_='unique')
+    op.create_index('uq_audit_stats_hourly_key', 'audit_stats_hourly',
+                    ['hour', 'action', sa.text('coalesce(staff_id, 0)')], unique=True)
+    op.drop_column('audit_stats_hourly', 'staff_key')
@@ -0,0 +1,49 @@
+"""Convert audit_log.details to JSONB with GIN indexes
+
+Revision ID: f3a4b5c6d7e8
+Revises: e2f3a4b5c6d7
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a4b5c6d7e8'
+down_revision = 'e2f3a4b5c6d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Старые записи с невалидным JSON сохраняются как {"raw": "<текст>"}
+    op.execute("""
+        CREATE OR REPLACE FUNCTION pg_temp.audit_details_to_jsonb(value text) RETURNS jsonb AS $$
+        BEGIN
+            IF value IS NULL OR value = '' THEN
+                RETURN NULL;
+            END IF;
+            RETURN value::jsonb;
+        EXCEPTION WHEN others THEN
+            RETURN jsonb_build_object('raw', value);
+        END;
+        $$ LANGUAGE plpgsql IMMUTABLE
+    """)
+    op.execute("""
+        ALTER TABLE audit_log
+        ALTER COLUMN details TYPE jsonb USING pg_temp.audit_details_to_jsonb(details)
+    """)
+    op.create_index(
+        'ix_audit_log_details_gin', 'audit_log', ['details'],
+        postgresql_using='gin', postgresql_ops={'details': 'jsonb_path_ops'}
+    )
+    op.create_index(
+        'ix_audit_log_details_endpoint', 'audit_log', [sa.text("(details ->> 'endpoint')")]
+    )
+
+
+def downgrade():
+    op.drop_index('ix_audit_log_details_endpoint', table_name='audit_log')
+    op.drop_index('ix_audit_log_details_gin', table_name='audit_log')
+    op.execute("ALTER TABLE audit_log ALTER COLUMN details TYPE text USING details::text")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Подбор параметров Argon2 под CPU сервера.
+
+Для сетки (memory_cost, time_cost) меряет время одного хеша и предлагает
+самые стойкие параметры, укладывающиеся в целевое время проверки пароля.
+Результат переносится в переменные окружения ARGON2_TIME_COST,
+ARGON2_MEMORY_COST, ARGON2_PARALLELISM; хеши со старыми параметрами
+пересчитаются при следующем входе сотрудника.
+
+Запускать на целевой машине без нагрузки.
+
+Примеры:
+    python scripts/argon2_tune.py
+    python scripts/argon2_tune.py --target-ms 150 --parallelism 2
+"""
+
+import argparse
+import os
+import statistics
+import time
+from typing import List, Tuple
+
+from argon2 import PasswordHasher
+
+MEMORY_COSTS_MIB = [19, 32, 46, 64, 96, 128]
+TIME_COSTS = [1, 2, 3, 4]
+
+
+def measure(hasher: PasswordHasher, rounds: int) -> float:
+    """Медиана времени verify, мс (verify на входе стоит столько же, сколько hash)."""
+    password_hash = hasher.hash('benchmark-password')
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        hasher.verify(password_hash, 'benchmark-password')
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Подбор параметров Argon2')
+    parser.add_argument('--target-ms', type=float, default=250.0, help='Целевое время проверки пароля, мс')
+    parser.add_argument('--parallelism', type=int, default=min(4, os.cpu_count() or 1), help='Параметр p Argon2')
+    parser.add_argument('--rounds', type=int, default=5, help='Замеров на комбинацию')
+    args = parser.parse_args()
+
+    workers = max(1, (os.cpu_count() or 2) // 2)
+    print(f"CPU: {os.cpu_count()}, p={args.parallelism}, цель {args.target_ms:.0f} мс\n")
+    print(f"{'m, МиБ':>8}{'t':>4}{'мс':>10}")
+
+    fitting: List[Tuple[int, int, float]] = []
+    for memory_mib in MEMORY_COSTS_MIB:
+        for time_cost in TIME_COSTS:
+            hasher = PasswordHasher(time_cost=time_cost, memory_cost=memory_mib * 1024,
+                                    parallelism=args.parallelism)
+            elapsed = measure(hasher, args.rounds)
+            print(f"{memory_mib:>8}{time_cost:>4}{elapsed:>10.1f}")
+            if elapsed <= args.target_ms:
+                fitting.append((memory_mib, time_cost, elapsed))
+            else:
+                break  # Дальше по t только дольше
+
+    if not fitting:
+        print("\nНи одна комбинация не укладывается в цель - увеличьте --target-ms")
+        return
+
+    # Стойкость растет с памятью, затем с числом проходов
+    memory_mib, time_cost, elapsed = max(fitting, key=lambda item: (item[0], item[1]))
+    print(f"\nРекомендация ({elapsed:.0f} мс на вход, "
+          f"~{workers * 1000 / elapsed:.1f} входов/с при PASSWORD_HASH_WORKERS={workers}):")
+    print(f"  ARGON2_TIME_COST={time_cost}")
+    print(f"  ARGON2_MEMORY_COST={memory_mib * 1024}")
+    print(f"  ARGON2_PARALLELISM={args.parallelism}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Микробенчмарк фильтра подозрительного содержимого SecurityMiddleware.
+
+Сравнивает прежнюю проверку (lower() каждого поля и 11 отдельных
+re.search с IGNORECASE) с однопроходным ContentFilter на типичных
+запросах: короткий GET, форма, JSON на 64 КБ и тело на 1 МБ без
+переводов строк (худший случай для шаблонов с ``.*``).
+
+Примеры:
+    python scripts/content_filter_benchmark.py
+    python scripts/content_filter_benchmark.py --repeat 2000
+"""
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+# Добавляем корневую директорию в PATH
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from app.utils.content_filter import ContentFilter
+
+LEGACY_PATTERNS = [
+    r'<script.*?>.*?</script>',
+    r'union.*select',
+    r'drop.*table',
+    r'exec\s*\(',
+    r'\.\./',
+    r'/etc/passwd',
+    r'<iframe',
+    r'javascript:',
+    r'vbscript:',
+    r'onload\s*=',
+    r'onerror\s*=',
+]
+
+HEADERS = {
+    'Host': 'deniz.local',
+    'User-Agent': 'Mozilla/5.0 (Linux; Android 13) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+    'Cookie': 'session=' + 'a' * 180,
+    'X-CSRFToken': 'b' * 88,
+}
+
+
+def make_requests() -> Dict[str, Tuple[str, Dict[str, str], List[str], bytes]]:
+    """Набор запросов: (url, заголовки, значения параметров, тело)."""
+    union_heavy = ('union ' * 20000).encode()  # много "union" без "select" - откат у .*
+    return {
+        'get': ('http://deniz.local/waiter/tables?hall=1&page=2', HEADERS, ['1', '2'], b''),
+        'form': ('http://deniz.local/admin/menu/create', HEADERS, [],
+                 b'name_ru=%D0%A1%D1%83%D0%BF&price=250&category_id=3&description=' + b'x' * 2000),
+        'json_64k': ('http://deniz.local/admin/settings', HEADERS, [],
+                     b'{"items": [' + b'{"id": 1, "name": "Chai", "comment": "bez sahara"},' * 1300 + b'{}]}'),
+        'body_1m_one_line': ('http://deniz.local/admin/banners/upload', HEADERS, [], union_heavy[:1024 * 1024]),
+    }
+
+
+def legacy_check(url: str, headers: Dict[str, str], args: List[str], body: bytes) -> bool:
+    header_text = ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+    content_to_check = [url, body.decode('utf-8', 'replace'), header_text, ' '.join(args)]
+    for content in content_to_check:
+        if content:
+            content_lower = content.lower()
+            for pattern in LEGACY_PATTERNS:
+                if re.search(pattern, content_lower, re.IGNORECASE):
+                    return True
+    return False
+
+
+def new_check(content_filter: ContentFilter, url: str, headers: Dict[str, str],
+              args: List[str], body: bytes) -> bool:
+    rule = content_filter.scan_fields([url, *args, *headers.values()])
+    if rule is None and body:
+        rule = content_filter.scan_body(body)
+    return rule is not None
+
+
+def measure(func: Callable[[], bool], repeat: int) -> float:
+    """Среднее время одного вызова, мкс."""
+    func()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Микробенчмарк фильтра содержимого')
+    parser.add_argument('--repeat', type=int, default=500, help='Повторов на запрос')
+    args = parser.parse_args()
+
+    content_filter = ContentFilter()
+    print(f"{'запрос':<20}{'было, мкс':>14}{'стало, мкс':>14}{'ускорение':>12}")
+    for name, (url, headers, values, body) in make_requests().items():
+        # Тяжелые тела старым способом меряем реже - иначе бенчмарк идет минутами
+        repeat = args.repeat if len(body) < 100_000 else max(1, args.repeat // 100)
+        legacy = measure(lambda: legacy_check(url, headers, values, body), repeat)
+        current = measure(lambda: new_check(content_filter, url, headers, values, body), repeat)
+        print(f"{name:<20}{legacy:>14.1f}{current:>14.1f}{legacy / current:>11.1f}x")
+
+
+if __name__ == '__main__':
+    main()
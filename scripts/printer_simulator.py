@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Запуск локальных симуляторов ESC/POS принтеров.
+
+Пример:
+    python scripts/printer_simulator.py --port 9100 --name kitchen --latency 0.3
+    python scripts/printer_simulator.py --port 9100 --count 3 --drop-rate 0.05
+
+В настройках принтеров укажите IP 127.0.0.1 и соответствующий порт.
+Команды в консоли: ``paper ok|low|out``, ``offline``, ``online``,
+``stats``, ``last``, ``quit``.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Добавляем корневую директорию в PATH
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from app.utils.printer_simulator import PrinterSimulator
+
+NAMES = ('kitchen', 'bar', 'receipt')
+
+
+def main():
+    """Запуск симуляторов и простая консоль управления."""
+    parser = argparse.ArgumentParser(description='Симулятор ESC/POS принтеров')
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес прослушивания')
+    parser.add_argument('--port', type=int, default=9100, help='Порт первого принтера')
+    parser.add_argument('--count', type=int, default=1, help='Количество принтеров (порты подряд)')
+    parser.add_argument('--name', default=None, help='Имя принтера (для одного принтера)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Время печати чека, секунд')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Доля обрывов соединения (0..1)')
+    parser.add_argument('--echo', action='store_true', help='Выводить текст каждого чека')
+    args = parser.parse_args()
+
+    simulators = []
+    for index in range(args.count):
+        name = args.name if args.count == 1 and args.name else NAMES[index % len(NAMES)]
+        sim = PrinterSimulator(args.host, args.port + index, name=name,
+                               latency=args.latency, drop_rate=args.drop_rate)
+        if args.echo:
+            sim.on_ticket(lambda ticket, sim=sim: print(
+                f"\n--- {sim.name} #{ticket.number} ({ticket.status}) ---\n{ticket.text}\n"
+            ))
+        simulators.append(sim.start())
+        print(f"🖨️  {name}: {args.host}:{sim.port}")
+
+    try:
+        for line in sys.stdin:
+            command = line.split()
+            if not command:
+                continue
+            if command[0] == 'quit':
+                break
+            for sim in simulators:
+                if command[0] == 'paper' and len(command) > 1:
+                    sim.set_paper(command[1])
+                elif command[0] == 'offline':
+                    sim.set_online(False)
+                elif command[0] == 'online':
+                    sim.set_online(True)
+                elif command[0] == 'last' and sim.tickets:
+                    print(f"--- {sim.name} #{sim.tickets[-1].number} ---\n{sim.tickets[-1].text}")
+                print(sim.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for sim in simulators:
+            sim.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""Микробенчмарк накладных расходов на запрос: отдельные хуки против конвейера.
+
+Собирает три одинаковых Flask-приложения с пустыми обработчиками:
+
+- ``bare`` - без хуков, точка отсчета;
+- ``hooks`` - прежняя схема: before/after логирования (UUID, две строки
+  INFO), аудит (свой start_time), безопасность (две строки INFO, фильтр
+  содержимого, проверка User-Agent, свой start_time), два чтения
+  session_timeout из БД;
+- ``pipeline`` - RequestPipeline с теми же проверками стадиями: одна
+  строка INFO, session_timeout из кэша, статика и health-check только со
+  стадией заголовков.
+
+Чтение настройки - запрос к SQLite в памяти (PostgreSQL по сети дороже,
+так что выигрыш здесь занижен). Лог пишется в файл во временной папке.
+Накладные расходы = время запроса минус время того же запроса в ``bare``.
+
+Примеры:
+    python scripts/request_pipeline_benchmark.py
+    python scripts/request_pipeline_benchmark.py --repeat 5000
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict
+
+# Добавляем корневую директорию в PATH
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+from flask import Blueprint, Flask, g, request
+
+from app.request_pipeline import RequestPipeline
+from app.utils.content_filter import ContentFilter
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Linux; Android 13) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+}
+
+URLS = {
+    'page': '/waiter/tables?hall=1&page=2',
+    'api': '/api/menu?lang=ru',
+    'static': '/static/app.js',
+    'health': '/api/system/health',
+}
+
+
+def make_settings_lookup() -> Callable[[], int]:
+    """Чтение session_timeout - как SystemSetting.get_setting, но из SQLite в памяти."""
+    connection = sqlite3.connect(':memory:', check_same_thread=False)
+    connection.execute('CREATE TABLE system_settings (setting_key TEXT PRIMARY KEY, setting_value TEXT)')
+    connection.execute("INSERT INTO system_settings VALUES ('session_timeout', '120')")
+
+    def lookup() -> int:
+        row = connection.execute(
+            'SELECT setting_value FROM system_settings WHERE setting_key = ?', ('session_timeout',)
+        ).fetchone()
+        return int(row[0])
+    return lookup
+
+
+def make_app(static_folder: str, log_path: str, name: str) -> Flask:
+    app = Flask(name, static_folder=static_folder)
+    app.logger.handlers.clear()
+    app.logger.propagate = False
+    app.logger.setLevel(logging.INFO)
+    handler = logging.FileHandler(log_path)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(levelname)s: %(message)s'))
+    app.logger.addHandler(handler)
+
+    system_api = Blueprint('system_api', name)
+
+    @system_api.route('/api/system/health')
+    def health_check():
+        return {'status': 'healthy'}
+
+    @app.route('/waiter/tables')
+    def tables():
+        return 'ok'
+
+    @app.route('/api/menu')
+    def menu():
+        return {'status': 'success', 'data': []}
+
+    app.register_blueprint(system_api)
+    return app
+
+
+def install_hooks(app: Flask, content_filter: ContentFilter, settings_lookup: Callable[[], int]) -> None:
+    """Прежняя схема: независимые before_request/after_request."""
+
+    @app.before_request
+    def logging_before():
+        g.request_id = str(uuid.uuid4())
+        g.start_time = datetime.utcnow()
+        app.logger.info(f"Request started: {request.method} {request.path}")
+
+    @app.before_request
+    def audit_before():
+        g.start_time = time.time()
+
+    @app.before_request
+    def session_timeout():
+        if request.endpoint and not request.endpoint.startswith('static'):
+            settings_lookup()
+
+    @app.before_request
+    def session_activity():
+        if request.endpoint and (request.endpoint.startswith('static') or request.path.startswith('/api/')):
+            return
+        settings_lookup()
+
+    @app.before_request
+    def security_before():
+        app.logger.info(f"Security check for: {request.method} {request.path}")
+        app.logger.info(f"User-Agent: {request.headers.get('User-Agent', 'None')}")
+        if not request.path.startswith('/api/'):
+            content_filter.scan_fields([request.path, request.query_string.decode('latin-1'),
+                                        *request.args.values(), *request.headers.values()])
+        request.headers.get('User-Agent', '').lower()
+        g.security_start_time = time.time()
+
+    @app.after_request
+    def security_after(response):
+        response.headers['X-Frame-Options'] = 'DENY'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        return response
+
+    @app.after_request
+    def logging_after(response):
+        duration = (datetime.utcnow() - g.start_time).total_seconds() if isinstance(g.start_time, datetime) \
+            else time.time() - g.start_time
+        app.logger.info(f"Request completed: {response.status_code} ({duration:.4f}s)")
+        return response
+
+
+def install_pipeline(app: Flask, content_filter: ContentFilter,
+                     settings_lookup: Callable[[], int]) -> RequestPipeline:
+    """Новая схема: стадии одного конвейера."""
+    pipeline = RequestPipeline()
+    pipeline.init_app(app)
+    cached = {'minutes': 0, 'expires': 0.0}
+
+    def security(ctx):
+        if not ctx.is_api:
+            content_filter.scan_fields([ctx.path, request.query_string.decode('latin-1'),
+                                        *request.args.values(), *request.headers.values()])
+        ctx.user_agent.lower()
+
+    def headers(ctx, response):
+        response.headers['X-Frame-Options'] = 'DENY'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        return response
+
+    def session(ctx):
+        now = time.monotonic()
+        if now >= cached['expires']:
+            cached['minutes'] = settings_lookup()
+            cached['expires'] = now + 30
+
+    def audit_after(ctx, response):
+        return response
+
+    pipeline.add_stage('security', before=security, order=20)
+    pipeline.add_stage('security_headers', after=headers, order=20, light=True)
+    pipeline.add_stage('session', before=session, order=30)
+    pipeline.add_stage('audit', after=audit_after, order=40)
+    return pipeline
+
+
+def measure(client, url: str, repeat: int) -> float:
+    """Среднее время одного запроса через test_client, мкс."""
+    for _ in range(50):
+        client.get(url, headers=HEADERS)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        client.get(url, headers=HEADERS)
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Накладные расходы хуков на запрос')
+    parser.add_argument('--repeat', type=int, default=2000, help='Запросов на URL')
+    args = parser.parse_args()
+
+    content_filter = ContentFilter()
+    settings_lookup = make_settings_lookup()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        static_folder = os.path.join(tmp, 'static')
+        os.mkdir(static_folder)
+        with open(os.path.join(static_folder, 'app.js'), 'w') as f:
+            f.write('console.log("deniz");\n' * 50)
+
+        apps: Dict[str, Flask] = {
+            name: make_app(static_folder, os.path.join(tmp, f'{name}.log'), name)
+            for name in ('bare', 'hooks', 'pipeline')
+        }
+        install_hooks(apps['hooks'], content_filter, settings_lookup)
+        pipeline = install_pipeline(apps['pipeline'], content_filter, settings_lookup)
+
+        print(f"{'запрос':<10}{'bare, мкс':>12}{'хуки, мкс':>12}{'конвейер, мкс':>16}"
+              f"{'накладные было':>17}{'стало':>9}")
+        for label, url in URLS.items():
+            timings = {name: measure(app.test_client(), url, args.repeat) for name, app in apps.items()}
+            before = timings['hooks'] - timings['bare']
+            after = timings['pipeline'] - timings['bare']
+            print(f"{label:<10}{timings['bare']:>12.1f}{timings['hooks']:>12.1f}{timings['pipeline']:>16.1f}"
+                  f"{before:>17.1f}{after:>9.1f}")
+
+        print('\nСтадии конвейера (среднее, мкс):')
+        for key, counter in sorted(pipeline.stats()['stages'].items()):
+            print(f"  {key:<24}{counter['avg_ms'] * 1000:>10.1f}  x{counter['calls']}")
+
+
+if __name__ == '__main__':
+    main()
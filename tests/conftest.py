@@ -0,0 +1,16 @@
+"""Общие фикстуры тестов."""
+
+import pytest
+
+from app import create_app, db
+
+
+@pytest.fixture
+def app():
+    """Приложение с чистой SQLite-базой в памяти."""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
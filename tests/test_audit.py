@@ -0,0 +1,34 @@
+"""Тесты записи аудита и почасовых агрегатов."""
+
+from datetime import datetime, timezone
+
+from app import db
+from app.models import AuditLog, AuditStatHourly
+from app.utils.audit_writer import audit_writer
+
+
+def _row(action, staff_id=None):
+    return {'action': action, 'staff_id': staff_id, 'table_affected': None, 'order_affected': None,
+            'details': None, 'ip_address': '127.0.0.1', 'created_at': datetime.now(timezone.utc)}
+
+
+def test_audit_batch_updates_hourly_stats(app):
+    audit_writer._write([_row('login', 1), _row('login', 1), _row('view_menu')])
+    audit_writer._write([_row('login', 1)])
+
+    assert AuditLog.query.count() == 4
+    assert AuditStatHourly.top_actions(days=1) == [('login', 3), ('view_menu', 1)]
+    assert AuditStatHourly.top_staff(days=1) == [(1, 3)]
+
+
+def test_stats_failure_keeps_audit_records(app, monkeypatch):
+    def fail(rows):
+        raise RuntimeError('rollup is broken')
+
+    monkeypatch.setattr(AuditStatHourly, 'add_rows', fail)
+    audit_writer._write([_row('login', 1)])
+    AuditLog.log_action('logout', staff_id=1)
+
+    db.session.expire_all()
+    assert AuditLog.query.count() == 2
+    assert AuditStatHourly.query.count() == 0
@@ -0,0 +1,44 @@
+"""Тесты журнала WebSocket событий."""
+
+from app.websocket.event_log import RoomEventLog
+
+
+class BrokenRedis:
+    """Redis, который недоступен для записи."""
+
+    def incr(self, key):
+        raise ConnectionError('redis is down')
+
+
+def test_replay_within_epoch(app):
+    log = RoomEventLog()
+    log.append('waiter_1', 'new_order', {'order_id': 1})
+    seq, epoch = log.append('waiter_1', 'new_order', {'order_id': 2})
+
+    complete, missed = log.events_since('waiter_1', seq - 1, epoch)
+    assert complete
+    assert [event['data']['order_id'] for event in missed] == [2]
+
+
+def test_restart_forces_snapshot(app):
+    old = RoomEventLog()
+    for order_id in range(5):
+        _, old_epoch = old.append('waiter_1', 'new_order', {'order_id': order_id})
+
+    # После перезапуска номера начинаются заново, старый номер ниже текущего
+    restarted = RoomEventLog()
+    for order_id in range(10):
+        restarted.append('waiter_1', 'new_order', {'order_id': order_id})
+
+    assert restarted.events_since('waiter_1', 5, old_epoch) == (False, [])
+
+
+def test_redis_fallback_starts_new_epoch(app):
+    log = RoomEventLog()
+    memory_epoch = log.epoch('waiter_1')
+    log._redis = BrokenRedis()
+
+    seq, epoch = log.append('waiter_1', 'new_order', {'order_id': 1})
+    assert seq == 1
+    assert epoch != memory_epoch
+    assert log.position('waiter_1') == (1, epoch)
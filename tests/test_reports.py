@@ -0,0 +1,60 @@
+"""Тесты отчетов администратора."""
+
+import inspect
+from decimal import Decimal
+
+import pytest
+import sqlalchemy as sa
+
+from app import db
+from app.controllers.admin import get_top_dishes_report
+from app.models import MenuCategory, MenuItem, Order, OrderItem
+
+
+@pytest.fixture
+def count_queries(app):
+    """Список SQL-запросов, выполненных внутри блока."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    sa.event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    yield statements
+    sa.event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def _create_menu(items_count: int) -> None:
+    """Категория, items_count блюд и заказ, в котором i-е блюдо заказано i раз."""
+    category = MenuCategory(name_ru='Горячее')
+    db.session.add(category)
+    db.session.flush()
+    order = Order(table_id=1, guest_count=2, status='completed', subtotal=Decimal('0'),
+                  service_charge=Decimal('0'), total_amount=Decimal('0'))
+    db.session.add(order)
+    db.session.flush()
+    for number in range(1, items_count + 1):
+        item = MenuItem(category_id=category.id, name_ru=f'Блюдо {number}', price=Decimal('10.00'),
+                        preparation_type='kitchen')
+        db.session.add(item)
+        db.session.flush()
+        db.session.add(OrderItem(order_id=order.id, menu_item_id=item.id, quantity=number,
+                                 unit_price=Decimal('10.00'), total_price=Decimal(10 * number),
+                                 preparation_type='kitchen'))
+    db.session.commit()
+
+
+@pytest.mark.parametrize('items_count', [3, 30])
+def test_top_dishes_report_is_one_query(app, count_queries, items_count):
+    _create_menu(items_count)
+    # Без декораторов доступа и аудита - считаются только запросы самого отчета
+    report = inspect.unwrap(get_top_dishes_report)
+
+    with app.test_request_context('/admin/api/reports/top-dishes?limit=5'):
+        count_queries.clear()
+        response = report()
+
+    assert len(count_queries) == 1
+    data = response.get_json()['data']
+    assert [dish['quantity'] for dish in data] == list(range(items_count, max(items_count - 5, 0), -1))
+    assert data[0]['revenue'] == 10.0 * items_count